@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Values of all the nodes of a decomposition, e.g. `decompositions/decomp.xml`, in one call
+
+    decomposition = compute_decomposition(simulation, 2018, weights = simulation.calculate('wprm', 2018))
+    decomposition['values']  # Array of shape (nodes, menages)
+    decomposition['totals']  # Weighted sums, by node
+
+The decomposition file is parsed once into a tree flattened so that the children of a node come before it. The nodes
+are calculated in this order over the whole period, each one being summed over the entity of the decomposition. A
+node whose code is not a variable is the sum of its children.
+
+With axes, e.g. a range of salaries, each menage of the simulation is a point of the range:
+
+    decomposition = compute_waterfall(tax_benefit_system, 2018, axes = [[
+        dict(count = 101, name = 'salaire_de_base', min = 0, max = 100000),
+        ]], parent1 = dict(age = 40))
+'''
+
+
+import os
+from xml.etree import ElementTree
+
+from numpy import bincount, float64, zeros
+
+from openfisca_core import periods
+
+from openfisca_tunisia.scenarios import init_single_entity
+
+
+# Decompositions parsed by `load_decomposition`, by path
+decompositions_by_path = dict()
+
+
+class CompiledDecomposition(object):
+    '''
+    Decomposition tree flattened in post-order, the children of each node coming before it
+
+    `parents` holds the index of the parent of each node, -1 for the root, and `depths` its depth from the root.
+    '''
+
+    def __init__(self, codes, labels, short_names, colors, parents, depths):
+        self.codes = codes
+        self.labels = labels
+        self.short_names = short_names
+        self.colors = colors
+        self.parents = parents
+        self.depths = depths
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def compile_decomposition(root):
+    codes = []
+    labels = []
+    short_names = []
+    colors = []
+    parents = []
+    depths = []
+
+    def add_node(element, depth):
+        children = [add_node(child, depth + 1) for child in element.findall('NODE')]
+        index = len(codes)
+        codes.append(element.get('code'))
+        labels.append(element.get('desc'))
+        short_names.append(element.get('shortname'))
+        colors.append(element.get('color'))
+        parents.append(-1)
+        depths.append(depth)
+        for child in children:
+            parents[child] = index
+        return index
+
+    add_node(root, 0)
+    return CompiledDecomposition(codes, labels, short_names, colors, parents, depths)
+
+
+def load_decomposition(tax_benefit_system, path = None):
+    '''
+    Returns the `CompiledDecomposition` of the file `path`, the default decomposition of `tax_benefit_system` if None
+
+    The file is only parsed again when it changes.
+    '''
+    if path is None:
+        path = os.path.join(tax_benefit_system.DECOMP_DIR, tax_benefit_system.DEFAULT_DECOMP_FILE)
+    mtime = os.stat(path).st_mtime_ns
+    cached = decompositions_by_path.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    decomposition = compile_decomposition(ElementTree.parse(path).getroot())
+    decompositions_by_path[path] = (mtime, decomposition)
+    return decomposition
+
+
+def sum_on_entity(simulation, variable, value, population):
+    '''
+    Returns `value`, an array of the entity of `variable`, summed over the entity of `population`
+
+    The value of a group entity goes to its first member, so that it is counted once.
+    '''
+    variable_population = simulation.get_variable_population(variable)
+    if variable_population is population:
+        return value
+    if variable_population is not simulation.persons:
+        value = value[variable_population.members_entity_id] * (variable_population.members_position == 0)
+    if population is simulation.persons:
+        return value
+    return bincount(population.members_entity_id, weights = value, minlength = population.count)
+
+
+def compute_decomposition(simulation, period, entity = 'menage', weights = None, decomposition = None):
+    '''
+    Returns the values of the nodes of `decomposition` (the default one if None) over `period`, by `entity`
+
+    Returns a dict of the compiled decomposition, of the values as a float64 array of shape (nodes, entities), and of
+    their totals weighted by `weights`, an array by entity.
+    '''
+    tax_benefit_system = simulation.tax_benefit_system
+    if decomposition is None:
+        decomposition = load_decomposition(tax_benefit_system)
+    period = periods.period(period)
+    population = simulation.populations[entity]
+
+    values = zeros((len(decomposition), population.count), dtype = float64)
+    for index, code in enumerate(decomposition.codes):
+        variable = tax_benefit_system.variables.get(code)
+        if variable is not None:
+            if variable.definition_period == periods.ETERNITY:
+                value = simulation.calculate(code, period)
+            else:
+                value = simulation.calculate_add(code, period)
+            values[index] = sum_on_entity(simulation, code, value, population)
+        # The children come before, so a node without variable is complete when summed into its parent
+        parent = decomposition.parents[index]
+        if parent >= 0 and tax_benefit_system.variables.get(decomposition.codes[parent]) is None:
+            values[parent] += values[index]
+
+    totals = values.sum(axis = 1) if weights is None else values.dot(weights)
+    return dict(decomposition = decomposition, values = values, totals = totals)
+
+
+def compute_waterfall(tax_benefit_system, period, axes, entity = 'menage', decomposition = None, **kwargs):
+    '''
+    Returns the decomposition, see `compute_decomposition`, of the single entity described by `kwargs` (see
+    `init_single_entity`) along `axes`, one entity by point
+    '''
+    simulation = init_single_entity(
+        tax_benefit_system.new_scenario(), axes = axes, period = period, **kwargs).new_simulation()
+    return compute_decomposition(simulation, period, entity = entity, decomposition = decomposition)
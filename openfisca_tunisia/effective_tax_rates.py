@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Marginal and average effective tax rates, by finite differences on the earnings of each individual
+
+    rates = compute_effective_tax_rates(simulation, 2018)
+    rates['revenu_disponible']['marginal']  # 1 - d revenu_disponible / d salaire_de_base, by individual
+
+The base calculation is profiled, so as to know which (variable, period) depend on the earnings variable. Each
+perturbed calculation runs on a copy of the simulation keeping all the other calculated values, and only recomputes
+the dependent ones.
+
+The schedules of the model being piecewise-linear, the marginal rates are exact as long as `delta` does not cross a
+threshold of a schedule.
+'''
+
+
+from collections import OrderedDict
+
+from numpy import arange, errstate, flatnonzero, full, minimum, nan, where, zeros
+
+from openfisca_core import periods
+
+from openfisca_tunisia.memory import MemoryManager
+from openfisca_tunisia.profiler import Profiler
+from openfisca_tunisia.scenarios import clone_simulation
+
+
+# Variables of net income, whose effective tax rate is 1 - d variable / d earnings. The rate of the other variables,
+# taxes counted negatively, is - d variable / d earnings.
+NET_INCOME_VARIABLES = ['revenu_disponible']
+
+
+def get_perturbation_rounds(simulation):
+    '''
+    Returns boolean masks of the individuals, partitioning them so that no group entity has two members in a mask
+
+    The first mask holds the first member of each group, and so on.
+    '''
+    count = simulation.persons.count
+    unassigned = full(count, True)
+    rounds = list()
+    while unassigned.any():
+        selected = unassigned.copy()
+        unassigned_ids = flatnonzero(unassigned)
+        for population in simulation.populations.values():
+            if population is simulation.persons:
+                continue
+            # Index of the first unassigned member of each group
+            first_member = full(population.count, count)
+            minimum.at(first_member, population.members_entity_id[unassigned_ids], unassigned_ids)
+            selected &= first_member[population.members_entity_id] == arange(count)
+        rounds.append(selected)
+        unassigned &= ~selected
+    return rounds
+
+
+def get_formula_values(simulation):
+    '''
+    Returns the (variable, period) known in `simulation` whose variable has formulas, and may thus have been calculated
+    '''
+    tax_benefit_system = simulation.tax_benefit_system
+    return set(
+        (variable, period)
+        for population in simulation.populations.values()
+        for variable, holder in population._holders.items()
+        if tax_benefit_system.get_variable(variable).formulas
+        for period in holder.get_known_periods()
+        )
+
+
+def compute_effective_tax_rates(simulation, period, variables = None, earnings_variable = 'salaire_de_base',
+        delta = 10):
+    '''
+    Returns, for each of `variables` and each individual, the marginal and average effective tax rates on the
+    earnings `earnings_variable` over `period`
+
+    The marginal rate adds `delta` to the earnings of each sub-period. The average rate compares with the earnings set
+    to zero, and is `nan` for the individuals without earnings. Values of group entities are projected on their
+    members, each individual being perturbed in a calculation where no other member of its groups is.
+
+    When the tracer of `simulation` is a `Profiler` (see `profiler.profile`), the values it did not record are taken
+    as inputs. Otherwise, a ValueError is raised if `simulation` holds values of variables having formulas, whose
+    dependency on the earnings is unknown.
+    '''
+    if variables is None:
+        variables = ['revenu_disponible', 'irpp', 'cotisations_salarie']
+    period = periods.period(period)
+    tax_benefit_system = simulation.tax_benefit_system
+    definition_period = tax_benefit_system.get_variable(earnings_variable, check_existence = True).definition_period
+    subperiods = period.get_subperiods(definition_period)
+
+    tracer = simulation.tracer
+    if isinstance(tracer, Profiler):
+        profiler = tracer
+    elif isinstance(tracer, MemoryManager):
+        raise ValueError("The simulation has a MemoryManager, which the Profiler of the base calculation would replace")
+    else:
+        calculations = get_formula_values(simulation)
+        if calculations:
+            raise ValueError(
+                "The dependencies of {} on {} are unknown: install a Profiler with profile(simulation) before "
+                "calculating them".format(
+                    ', '.join(sorted('{}<{}>'.format(*calculation) for calculation in calculations)),
+                    earnings_variable,
+                    )
+                )
+        profiler = Profiler()
+    simulation.tracer = profiler
+    try:
+        base_values = OrderedDict(
+            (variable, project_on_persons(simulation, variable, simulation.calculate_add(variable, period)))
+            for variable in variables
+            )
+        base_earnings = [simulation.calculate(earnings_variable, subperiod) for subperiod in subperiods]
+    finally:
+        simulation.tracer = tracer
+    dependents = profiler.get_dependents(earnings_variable)
+
+    earnings = sum(base_earnings)
+    marginal_changes = dict((variable, zeros(simulation.persons.count)) for variable in variables)
+    average_changes = dict((variable, zeros(simulation.persons.count)) for variable in variables)
+    for selected in get_perturbation_rounds(simulation):
+        for changes, perturb in [
+                (marginal_changes, lambda value: value + delta * selected),
+                (average_changes, lambda value: where(selected, 0, value)),
+                ]:
+            perturbed_simulation = clone_simulation(simulation, dependents)
+            holder = perturbed_simulation.persons.get_holder(earnings_variable)
+            for subperiod, value in zip(subperiods, base_earnings):
+                holder.delete_arrays(subperiod)
+                perturbed_simulation.set_input(earnings_variable, subperiod, perturb(value))
+            for variable in variables:
+                value = project_on_persons(
+                    perturbed_simulation, variable, perturbed_simulation.calculate_add(variable, period))
+                changes[variable][selected] = (value - base_values[variable])[selected]
+
+    rates = OrderedDict()
+    with errstate(divide = 'ignore', invalid = 'ignore'):
+        for variable in variables:
+            marginal = - marginal_changes[variable] / (delta * len(subperiods))
+            average = where(earnings != 0, average_changes[variable] / earnings, nan)
+            if variable in NET_INCOME_VARIABLES:
+                marginal = 1 + marginal
+                average = 1 + average
+            rates[variable] = dict(marginal = marginal, average = average)
+    return rates
+
+
+def project_on_persons(simulation, variable, value):
+    population = simulation.get_variable_population(variable)
+    if population is simulation.persons:
+        return value
+    return value[population.members_entity_id]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Incremental recomputation of a simulation whose inputs change
+
+    track(simulation)
+    simulation.calculate('revenu_disponible', 2018)
+    update_input(simulation, 'salaire_de_base', 2018, salaire_de_base)
+    simulation.calculate('revenu_disponible', 2018)  # Only recomputes what depends on salaire_de_base
+
+The dependencies are the ones observed by the `Profiler` of the simulation: each (variable, period) calculated using
+the updated input is removed from the cache, and recomputed when it is next needed.
+'''
+
+
+from numpy import array_equal
+
+from openfisca_core import periods
+
+from openfisca_tunisia.profiler import Profiler, profile
+
+
+def track(simulation):
+    '''
+    Installs a `Profiler` on `simulation`, if it has none, and returns it
+
+    The values calculated before are taken as inputs by `update_input`.
+    '''
+    if isinstance(simulation.tracer, Profiler):
+        return simulation.tracer
+    return profile(simulation)
+
+
+def update_input(simulation, variable, period, value):
+    '''
+    Sets the input `variable` to `value` for `period`, and removes the values calculated from it from the cache
+
+    Returns the set of the removed (variable, period). Nothing is removed when `value` equals the current one.
+    '''
+    profiler = simulation.tracer
+    if not isinstance(profiler, Profiler):
+        raise ValueError("The dependencies of the simulation are not tracked: call track(simulation) first")
+    period = periods.period(period)
+    holder = simulation.get_holder(variable)
+    current_value = holder.get_array(period)
+    if current_value is not None and array_equal(current_value, value):
+        return set()
+
+    holder.delete_arrays(period)
+    simulation.set_input(variable, period, value)
+    dependents = profiler.get_dependents(variable, period)
+    for dependent_variable, dependent_period in dependents:
+        simulation.get_holder(dependent_variable).delete_arrays(dependent_period)
+    return dependents
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Storage of the values of the simulations in memory-mapped files, for populations too large for the memory
+
+    use_memmap_storage(simulation, 'run-2018')
+    simulation.calculate('revenu_disponible', 2018)
+
+The values of each period are in a directory of their own, one `.npy` file by variable, e.g.
+`run-2018/2018-01/salaire_de_base.npy`, so that the calculations of a period read contiguous files. The values stay
+in the page cache of the system, which writes them back to the files and drops them when it needs the memory.
+
+The entities of the simulation being saved too, a finished run may be opened again, read-only, without calculating
+anything:
+
+    simulation = open_simulation(tax_benefit_system, 'run-2018')
+    simulation.calculate('revenu_disponible', 2018)
+'''
+
+
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from openfisca_core import periods
+from openfisca_core.indexed_enums import Enum, EnumArray
+from openfisca_core.simulations import SimulationBuilder
+
+
+STRUCTURE_FILE_NAME = 'structure.npz'
+
+
+class MemmapStorage(object):
+    '''
+    Storage of the values of a variable in `.npy` files of `directory` mapped in memory, by period
+
+    Has the interface of `InMemoryStorage`. The values of dtype object, which cannot be mapped, are kept in memory.
+    With `read_only`, the files are left untouched: the values set are kept in memory, and the deleted ones are only
+    forgotten.
+    '''
+
+    def __init__(self, directory, variable, read_only = False):
+        self.directory = directory
+        self.variable = variable
+        self.read_only = read_only
+        self.is_eternal = variable.definition_period == periods.ETERNITY
+        self._arrays = {}
+
+    def get_path(self, period):
+        return os.path.join(self.directory, str(period), '{}.npy'.format(self.variable.name))
+
+    def get_period(self, period):
+        if self.is_eternal:
+            return periods.period(periods.ETERNITY)
+        return periods.period(period)
+
+    def open(self, path):
+        value = numpy.load(path, mmap_mode = 'r' if self.read_only else 'c')
+        if self.variable.value_type == Enum:
+            value = EnumArray(value, self.variable.possible_values)
+        return value
+
+    def get(self, period):
+        return self._arrays.get(self.get_period(period))
+
+    def put(self, value, period):
+        period = self.get_period(period)
+        array = value.view(numpy.ndarray) if isinstance(value, EnumArray) else numpy.asarray(value)
+        if self.read_only or array.dtype == object:
+            self._arrays[period] = value
+            return
+        path = self.get_path(period)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        # Write then rename, so that the arrays already mapped from the previous file stay valid
+        temporary_path = '{}.{}.npy'.format(path[:-len('.npy')], os.getpid())
+        mapped = open_memmap(temporary_path, mode = 'w+', dtype = array.dtype, shape = array.shape)
+        mapped[...] = array
+        mapped.flush()
+        del mapped
+        os.replace(temporary_path, path)
+        self._arrays[period] = self.open(path)
+
+    def delete(self, period = None):
+        if period is None:
+            deleted = list(self._arrays)
+        else:
+            period = self.get_period(period)
+            deleted = [period_item for period_item in self._arrays if period.contains(period_item)]
+        for period_item in deleted:
+            del self._arrays[period_item]
+            path = self.get_path(period_item)
+            if not self.read_only and os.path.exists(path):
+                os.remove(path)
+
+    def get_known_periods(self):
+        return self._arrays.keys()
+
+    def get_memory_usage(self):
+        if not self._arrays:
+            return dict(
+                nb_arrays = 0,
+                total_nb_bytes = 0,
+                cell_size = numpy.nan,
+                )
+
+        nb_arrays = len(self._arrays)
+        array = next(iter(self._arrays.values()))
+        return dict(
+            nb_arrays = nb_arrays,
+            total_nb_bytes = array.nbytes * nb_arrays,
+            cell_size = array.itemsize,
+            )
+
+    def restore(self):
+        '''
+        Maps the values of the variable found in `directory`
+        '''
+        for period_name in os.listdir(self.directory):
+            path = self.get_path(period_name)
+            if os.path.exists(path):
+                self._arrays[self.get_period(period_name)] = self.open(path)
+
+
+def use_memmap_storage(simulation, directory, entities = None):
+    '''
+    Stores the values of the variables of `entities` (all the entities if None) of `simulation` in `directory`
+
+    The values already known are moved there. The entities of the simulation are saved too, for `open_simulation`.
+    '''
+    os.makedirs(directory, exist_ok = True)
+    save_structure(simulation, os.path.join(directory, STRUCTURE_FILE_NAME))
+    for variable in simulation.tax_benefit_system.variables.values():
+        if entities is not None and variable.entity.key not in entities:
+            continue
+        holder = simulation.get_holder(variable.name)
+        storage = MemmapStorage(directory, holder.variable)
+        for period, value in holder._memory_storage._arrays.items():
+            storage.put(value, period)
+        holder._memory_storage = storage
+
+
+def save_structure(simulation, path):
+    structure = dict()
+    for population in simulation.populations.values():
+        entity = population.entity
+        structure['{}.ids'.format(entity.key)] = numpy.asarray(population.ids)
+        if entity.is_person:
+            continue
+        # Index of the role of each member in the flattened roles of the entity
+        members_role = numpy.empty(population.members.count, dtype = numpy.int16)
+        for index, role in enumerate(entity.flattened_roles):
+            members_role[population.members_role == role] = index
+        structure['{}.members_entity_id'.format(entity.key)] = population.members_entity_id
+        structure['{}.members_role'.format(entity.key)] = members_role
+        structure['{}.members_position'.format(entity.key)] = population.members_position
+    numpy.savez(path, **structure)
+
+
+def open_simulation(tax_benefit_system, directory):
+    '''
+    Returns a simulation of `tax_benefit_system` reading, read-only, the values saved in `directory` by a simulation
+    using `use_memmap_storage`
+
+    The values calculated by the returned simulation are kept in memory.
+    '''
+    with numpy.load(os.path.join(directory, STRUCTURE_FILE_NAME)) as structure:
+        builder = SimulationBuilder()
+        builder.create_entities(tax_benefit_system)
+        for entity_key, population in builder.populations.items():
+            population.ids = structure['{}.ids'.format(entity_key)]
+            population.count = len(population.ids)
+            if population.entity.is_person:
+                continue
+            population.members_entity_id = structure['{}.members_entity_id'.format(entity_key)]
+            # The `members_role` setter goes through a list of roles, which is slow for millions of individuals
+            population._members_role = numpy.array(population.entity.flattened_roles, dtype = object)[
+                structure['{}.members_role'.format(entity_key)]]
+            population.members_position = structure['{}.members_position'.format(entity_key)]
+    simulation = builder.build(tax_benefit_system)
+
+    for variable in tax_benefit_system.variables.values():
+        holder = simulation.get_holder(variable.name)
+        storage = MemmapStorage(directory, holder.variable, read_only = True)
+        storage.restore()
+        holder._memory_storage = storage
+    return simulation
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Memory budget of the intermediate values of the simulations
+
+`MemoryManager` is a tracer keeping the calculated values within a budget of bytes. Once the budget is exceeded, it
+removes from the cache the least recently used intermediate values, i.e. the calculated values which are neither
+inputs nor of the output variables:
+
+    manager = manage_memory(simulation, budget = 2 * 2 ** 30, outputs = ['revenu_disponible'])
+    simulation.calculate('revenu_disponible', 2018)
+    manager.get_variables_stats()  # Current and peak bytes, and evictions, by variable
+
+With `policy = 'last_consumer'`, an intermediate value is removed as soon as all the calculations using it are done.
+These consumers are the ones observed by a `Profiler` on a previous calculation, see `Profiler.get_consumers`:
+
+    profiler = profile(sample_simulation)
+    sample_simulation.calculate('revenu_disponible', 2018)
+    manage_memory(simulation, policy = 'last_consumer', consumers = profiler.get_consumers())
+
+With `spill_dir`, the removed values are written to files there and kept in the cache as memory-mapped arrays,
+instead of being calculated again when they are next needed.
+
+A removed value is calculated again if needed, so that the results do not depend on the budget.
+'''
+
+
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy
+
+from openfisca_core import periods
+from openfisca_core.indexed_enums import EnumArray
+from openfisca_core.tracers import SimpleTracer
+
+
+POLICIES = ['lru', 'last_consumer']
+
+# Indices of the statistics lists
+NBYTES, PEAK_NBYTES, EVICTIONS = range(3)
+
+
+class MemoryManager(SimpleTracer):
+    '''
+    Tracer removing intermediate values from the cache of `simulation` to keep them within `budget` bytes
+
+    The values kept in the cache by the formulas themselves, and not returned by a calculation, are not managed.
+    '''
+
+    def __init__(self, simulation, budget = None, policy = 'lru', outputs = (), spill_dir = None,
+            consumers = None):
+        super(MemoryManager, self).__init__()
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy {}, expected one of {}".format(policy, POLICIES))
+        if policy == 'last_consumer' and consumers is None:
+            raise ValueError("The last_consumer policy needs the consumers of the calculations")
+        self.simulation = simulation
+        self.budget = budget
+        self.policy = policy
+        self.outputs = set(outputs)
+        self.consumers = consumers
+        self.spill_dir = None if spill_dir is None else tempfile.mkdtemp(prefix = 'openfisca-', dir = spill_dir)
+        # [(variable, period), calculated by this call, children] of the calculations in progress
+        self._frames = []
+        self._done = set()
+        self.nbytes_by_calculation = OrderedDict()  # Managed values in the cache, from the least recently used
+        self.nbytes = 0
+        self.peak_nbytes = 0
+        self.stats = dict()  # Statistics by variable
+
+    def record_calculation_start(self, variable, period):
+        super(MemoryManager, self).record_calculation_start(variable, period)
+        calculation = (variable, period)
+        if self._frames:
+            self._frames[-1][2].append(calculation)
+        if calculation in self.nbytes_by_calculation:
+            self.nbytes_by_calculation.move_to_end(calculation)
+        calculated = self.simulation.get_holder(variable).get_array(period) is None
+        self._frames.append([calculation, calculated, []])
+
+    def record_calculation_result(self, value):
+        calculation, calculated, _ = self._frames[-1]
+        if not calculated or calculation[0] in self.outputs or calculation in self.nbytes_by_calculation:
+            return
+        if self.simulation.get_holder(calculation[0]).get_array(calculation[1]) is not value:
+            # Not cached, e.g. the default value of a cycle
+            return
+        nbytes = getattr(value, 'nbytes', 0)
+        self.nbytes_by_calculation[calculation] = nbytes
+        self.update_nbytes(calculation[0], nbytes)
+
+    def record_calculation_end(self):
+        super(MemoryManager, self).record_calculation_end()
+        calculation, _, children = self._frames.pop()
+        if self.policy == 'last_consumer':
+            self._done.add(calculation)
+            for child in children:
+                if child in self.nbytes_by_calculation and self.consumers.get(child, set()) <= self._done:
+                    self.evict(child)
+        if self.budget is not None and self.nbytes > self.budget:
+            in_progress = set(frame[0] for frame in self._frames)
+            for evicted in list(self.nbytes_by_calculation):
+                if self.nbytes <= self.budget:
+                    break
+                if evicted not in in_progress:
+                    self.evict(evicted)
+
+    def update_nbytes(self, variable, nbytes):
+        stats = self.stats.get(variable)
+        if stats is None:
+            stats = self.stats[variable] = [0, 0, 0]
+        stats[NBYTES] += nbytes
+        stats[PEAK_NBYTES] = max(stats[PEAK_NBYTES], stats[NBYTES])
+        self.nbytes += nbytes
+        self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+
+    def evict(self, calculation):
+        '''
+        Removes the value of `calculation` from the cache, or replaces it by a memory-mapped copy
+        '''
+        variable, period = calculation
+        nbytes = self.nbytes_by_calculation.pop(calculation)
+        self.update_nbytes(variable, - nbytes)
+        self.stats[variable][EVICTIONS] += 1
+        holder = self.simulation.get_holder(variable)
+        storage = holder._memory_storage
+        key = periods.period(periods.ETERNITY) if storage.is_eternal else periods.period(period)
+        value = storage._arrays.get(key)
+        if value is None:
+            return
+        if self.spill_dir is None or value.dtype == object:
+            del storage._arrays[key]
+            return
+        path = os.path.join(self.spill_dir, '{}-{}.npy'.format(variable, key))
+        numpy.save(path, numpy.asarray(value))
+        spilled = numpy.load(path, mmap_mode = 'c')
+        if isinstance(value, EnumArray):
+            spilled = EnumArray(spilled, value.possible_values)
+        storage._arrays[key] = spilled
+
+    def get_variables_stats(self):
+        '''
+        Returns the bytes in the cache, their peak and the number of evictions by variable, by decreasing peak
+        '''
+        return [
+            dict(
+                variable = variable,
+                nbytes = stats[NBYTES],
+                peak_nbytes = stats[PEAK_NBYTES],
+                evictions = stats[EVICTIONS],
+                )
+            for variable, stats in sorted(self.stats.items(), key = lambda item: - item[1][PEAK_NBYTES])
+            ]
+
+    def close(self):
+        '''
+        Removes the files of the spilled values, which must not be used anymore
+        '''
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors = True)
+            self.spill_dir = None
+
+
+def manage_memory(simulation, budget = None, policy = 'lru', outputs = (), spill_dir = None, consumers = None):
+    '''
+    Installs a `MemoryManager` on `simulation` and returns it
+
+    Raises a ValueError if `simulation` already has a tracer other than the default one of OpenFisca-Core, e.g. the
+    `Profiler` of `incremental.track`, `reform_delta.track_baseline` or `parameter_sweep.sweep`, which the manager
+    would replace.
+    '''
+    if type(simulation.tracer) is not SimpleTracer:
+        raise ValueError("The simulation already has a tracer, a {}, which a MemoryManager would replace".format(
+            type(simulation.tracer).__name__))
+    manager = MemoryManager(simulation, budget = budget, policy = policy, outputs = outputs, spill_dir = spill_dir,
+        consumers = consumers)
+    simulation.tracer = manager
+    return manager
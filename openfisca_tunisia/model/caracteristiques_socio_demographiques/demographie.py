@@ -1,11 +1,60 @@
 # -*- coding: utf-8 -*-
 
-from numpy import datetime64
+from weakref import WeakKeyDictionary
 
+from numpy import int32, where
 
 from openfisca_tunisia.model.base import *
 
 
+# Components of the dates of birth computed by `get_date_naissance_components`, by population
+date_naissance_by_population = WeakKeyDictionary()
+
+
+def get_date_naissance_components(individu, period):
+    '''
+    Returns the year, the month (from 1) and the day of the date_naissance of the individus, as integer arrays
+
+    The result is kept as long as the date_naissance array of the simulation stays the same, so that the ages of all
+    the periods are computed from it with integer arithmetic.
+    '''
+    date_naissance = individu('date_naissance', period)
+    cached = date_naissance_by_population.get(individu)
+    if cached is not None and cached[0] is date_naissance:
+        return cached[1]
+
+    components = civil_from_days(date_naissance.astype('datetime64[D]').astype(int32))
+    date_naissance_by_population[individu] = (date_naissance, components)
+    return components
+
+
+def civil_from_days(days):
+    '''
+    Returns the year, the month and the day of the dates `days` days after 1970-01-01, as int32 arrays
+
+    Integer arithmetic of the proleptic Gregorian calendar, by eras of 400 years starting on March 1st, much faster than
+    the conversions of datetime64 arrays to years and months.
+    '''
+    days = days + 719468  # Days since 0000-03-01
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_from_march = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_from_march + 2) // 5 + 1
+    month = where(month_from_march < 10, month_from_march + 3, month_from_march - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    return year.astype(int32), month.astype(int32), day.astype(int32)
+
+
+def compute_age_en_mois(individu, period, instant):
+    '''
+    Returns the age in completed months of the individus at `instant`
+    '''
+    annee, mois, jour = get_date_naissance_components(individu, period)
+    return (instant.year - annee) * 12 + (instant.month - mois) - (instant.day < jour)
+
+
 class age(Variable):
     value_type = int
     entity = Individu
@@ -15,8 +64,7 @@ class age(Variable):
     set_input = set_input_dispatch_by_period
 
     def formula(individu, period):
-        date_naissance = individu('date_naissance', period)
-        return (datetime64(period.date) - date_naissance).astype('timedelta64[Y]')
+        return compute_age_en_mois(individu, period, period.start) // 12
 
 
 class age_en_mois(Variable):
@@ -45,8 +93,7 @@ class age_en_mois(Variable):
             has_age = bool(individu.get_holder('age').get_known_periods())
             if has_age:
                 return individu('age', period) * 12
-        date_naissance = individu('date_naissance', period)
-        return (datetime64(period.start) - date_naissance).astype('timedelta64[M]')
+        return compute_age_en_mois(individu, period, start)
 
 
 class date_naissance(Variable):
@@ -3,7 +3,12 @@
 
 from __future__ import division
 
-from numpy import zeros
+from bisect import bisect_right
+from weakref import WeakKeyDictionary
+
+from numpy import (
+    argsort, array, bincount, cumsum, full, inf, load, maximum as max_, minimum as min_, savez, zeros,
+    )
 
 from openfisca_tunisia.model.base import *  # noqa analysis:ignore
 
@@ -27,44 +32,238 @@ class TypesRegimeSecuriteSociale(Enum):
     # http://www.paie-tunisie.com/412/fr/83/reglementations/regimes-de-securite-sociale.aspx
 
 
-def compute_cotisation(individu, period, cotisation_type = None, bareme_name = None, parameters = None):
-    assert cotisation_type in ['employeur', 'salarie']
+BAREMES_COTISATIONS_BY_TYPE = dict(
+    employeur = [
+        'accident_du_travail',
+        'deces',
+        'fonds_special_etat',
+        'famille',
+        'maladie',
+        'maternite',
+        'protection_sociale_travailleurs',
+        'retraite',
+        ],
+    salarie = [
+        'accident_du_travail',
+        'deces',
+        'famille',
+        'maladie',
+        'maternite',
+        'protection_sociale_travailleurs',
+        'retraite',
+        ],
+    )
+
+
+def get_bareme(baremes_by_regime, regime, cotisation_type, bareme_name):
+    '''
+    Returns the bareme `bareme_name` paid by the `cotisation_type` side under `regime`, None if not applicable
+    '''
+    if 'cotisations_{}'.format(cotisation_type) not in baremes_by_regime[regime.name]._children:
+        return None
+    baremes_by_name = getattr(
+        baremes_by_regime[regime.name],
+        'cotisations_{}'.format(cotisation_type),
+        )
+
+    if bareme_name in ['maladie', 'maternite', 'deces']:
+        if 'assurances_sociales' in baremes_by_name._children:
+            baremes_assurances_sociales = getattr(baremes_by_name, 'assurances_sociales')
+            return getattr(baremes_assurances_sociales, bareme_name)
+
+    if bareme_name not in baremes_by_name._children:
+        return None
+    return getattr(baremes_by_name, bareme_name)
+
+
+COTISATIONS_TYPES = ['employeur', 'salarie']
+
+BAREMES_COTISATIONS = sorted(set(
+    bareme_name
+    for baremes_names in BAREMES_COTISATIONS_BY_TYPE.values()
+    for bareme_name in baremes_names
+    ))
+
+
+def build_baremes_tables(baremes_by_regime):
+    '''
+    Returns dense thresholds and rates tables indexed by [regime, bareme, cotisation_type, bracket]
+
+    Missing baremes and brackets have a zero rate, the thresholds being padded with infinity.
+    '''
+    baremes = dict(
+        ((regime_index, bareme_index, type_index), bareme)
+        for regime_index, regime in enumerate(TypesRegimeSecuriteSociale)
+        for type_index, cotisation_type in enumerate(COTISATIONS_TYPES)
+        for bareme_index, bareme_name in enumerate(BAREMES_COTISATIONS)
+        if bareme_name in BAREMES_COTISATIONS_BY_TYPE[cotisation_type]
+        for bareme in [get_bareme(baremes_by_regime, regime, cotisation_type, bareme_name)]
+        if bareme is not None
+        )
+    nb_brackets = max([len(bareme.rates) for bareme in baremes.values()] + [1])
+    shape = (len(TypesRegimeSecuriteSociale), len(BAREMES_COTISATIONS), len(COTISATIONS_TYPES))
+    thresholds = full(shape + (nb_brackets + 1, ), inf)
+    rates = zeros(shape + (nb_brackets, ))
+    for index, bareme in baremes.items():
+        thresholds[index][:len(bareme.thresholds)] = bareme.thresholds
+        rates[index][:len(bareme.rates)] = bareme.rates
+    return thresholds, rates
+
+
+class BaremesTables(object):
+    '''
+    Thresholds and rates tables of the cotisations sociales, indexed by
+    [instant, regime, bareme, cotisation_type, bracket]
+
+    The tables of an instant apply until the next instant of `instants`.
+    `parameters` is the parameters tree the tables were compiled from, if known.
+    '''
+
+    def __init__(self, instants, thresholds, rates, parameters = None):
+        self.instants = list(instants)
+        self.thresholds = thresholds
+        self.rates = rates
+        self.parameters = parameters
+
+    @classmethod
+    def compile(cls, parameters):
+        baremes_by_regime = parameters.cotisations_sociales
+        instants = sorted(set(
+            value_at_instant.instant_str
+            for descendant in baremes_by_regime.get_descendants()
+            for value_at_instant in getattr(descendant, 'values_list', [])
+            ))
+        tables = [build_baremes_tables(baremes_by_regime(instant)) for instant in instants]
+        nb_brackets = max(rates.shape[-1] for _, rates in tables)
+        thresholds = full((len(instants), ) + tables[0][0].shape[:-1] + (nb_brackets + 1, ), inf)
+        rates = zeros((len(instants), ) + tables[0][1].shape[:-1] + (nb_brackets, ))
+        for index, (instant_thresholds, instant_rates) in enumerate(tables):
+            thresholds[index, ..., :instant_thresholds.shape[-1]] = instant_thresholds
+            rates[index, ..., :instant_rates.shape[-1]] = instant_rates
+        return cls(instants, thresholds, rates, parameters = parameters)
+
+    @classmethod
+    def load(cls, path, parameters = None):
+        with load(path) as data:
+            return cls(data['instants'].tolist(), data['thresholds'], data['rates'], parameters = parameters)
+
+    def save(self, path):
+        savez(path, instants = array(self.instants), thresholds = self.thresholds, rates = self.rates)
+
+    def at(self, instant):
+        '''
+        Returns the (thresholds, rates) tables in force at `instant`, None before the first known instant
+        '''
+        index = bisect_right(self.instants, str(instant)) - 1
+        if index < 0:
+            return None
+        return self.thresholds[index], self.rates[index]
+
+
+def get_baremes_tables(tax_benefit_system, period, parameters):
+    '''
+    Returns the tables precompiled by `TunisiaTaxBenefitSystem.compile_cotisations_sociales` when they were compiled
+    from the parameters of `tax_benefit_system`, otherwise builds them from the parameters at `period`
+    '''
+    compiled_tables = getattr(tax_benefit_system, 'cotisations_sociales_tables', None)
+    if compiled_tables is not None and compiled_tables.parameters is tax_benefit_system.parameters:
+        tables = compiled_tables.at(period.start)
+        if tables is not None:
+            return tables
+    return build_baremes_tables(parameters(period.start).cotisations_sociales)
+
+
+def apply_baremes_tables(assiette, regime_index, thresholds, rates):
+    '''
+    Computes every (bareme, cotisation_type) amount in one pass, grouping individuals by regime
+
+    Returns an array indexed by [individu, bareme, cotisation_type].
+    '''
+    cotisations = zeros((len(assiette), ) + rates.shape[1:3])
+    order = argsort(regime_index, kind = 'stable')
+    ends = cumsum(bincount(regime_index, minlength = len(rates)))
+    starts = ends - bincount(regime_index, minlength = len(rates))
+    for regime, (start, end) in enumerate(zip(starts, ends)):
+        if start == end or not rates[regime].any():
+            continue
+        members = order[start:end]
+        base = assiette[members][:, None, None]
+        cotisation = 0
+        for bracket in range(rates.shape[-1]):
+            lower = thresholds[regime, :, :, bracket]
+            upper = thresholds[regime, :, :, bracket + 1]
+            cotisation = cotisation + rates[regime, :, :, bracket] * max_(min_(base, upper) - lower, 0)
+        cotisations[members] = cotisation
+    return cotisations
 
-    assiette_cotisations_sociales = individu('assiette_cotisations_sociales', period)
-    regime_securite_sociale = individu('regime_securite_sociale', period)
-    baremes_by_regime = parameters(period.start).cotisations_sociales
-    cotisation = zeros(len(assiette_cotisations_sociales))
-    types_regime_securite_sociale = regime_securite_sociale.possible_values
 
-    for regime in types_regime_securite_sociale:
-        if 'cotisations_{}'.format(cotisation_type) not in baremes_by_regime[regime.name]._children:
-            continue
-        baremes_by_name = getattr(
-            baremes_by_regime[regime.name],
-            'cotisations_{}'.format(cotisation_type),
-            )
+# Cotisations computed by `compute_cotisations_sociales` while shared by `share_cotisations_sociales`, by population,
+# then by (period, cotisation_type)
+cotisations_sociales_by_population = WeakKeyDictionary()
 
-        if bareme_name in ['maladie', 'maternite', 'deces']:
-            if 'assurances_sociales' in baremes_by_name._children:
-                baremes_assurances_sociales = getattr(baremes_by_name, 'assurances_sociales')
-                bareme = getattr(baremes_assurances_sociales, bareme_name)
 
-            else:
-                if bareme_name not in baremes_by_name._children:
-                    continue
-                bareme = getattr(baremes_by_name, bareme_name)
+def share_cotisations_sociales(individu, period, cotisation_type):
+    '''
+    Keeps the cotisations of the `cotisation_type` side computed by `compute_cotisations_sociales` for the month,
+    until `unshare_cotisations_sociales`, so that they are computed once for all the cotisation variables
+    '''
+    cotisations_sociales_by_population.setdefault(individu, dict())[(period, cotisation_type)] = None
 
-        else:
-            if bareme_name not in baremes_by_name._children:
-                continue
-            bareme = getattr(baremes_by_name, bareme_name)
 
-        if bareme is not None:
-            cotisation += bareme.calc(
-                assiette_cotisations_sociales * (regime_securite_sociale == regime),
-                )
+def unshare_cotisations_sociales(individu, period, cotisation_type):
+    cotisations_sociales_by_population.get(individu, dict()).pop((period, cotisation_type), None)
+
 
-    return - cotisation
+def compute_cotisations_sociales(individu, period, parameters, cotisation_type):
+    '''
+    Computes all the cotisations sociales of the `cotisation_type` side for the month at once
+
+    Returns a dict of (negative) amounts by bareme_name, in float64: the simulation casts each of them to the dtype of
+    its variable. While shared, see `share_cotisations_sociales`, the result is reused as long as the assiette and the
+    regime arrays of the simulation stay the same.
+    '''
+    assiette_cotisations_sociales = individu('assiette_cotisations_sociales', period)
+    regime_securite_sociale = individu('regime_securite_sociale', period)
+    # The amounts may come from the cache or from the compiled tables: record for the tracers that every cotisation
+    # depends on all the baremes
+    simulation = individu.simulation
+    simulation.tracer.record_parameter_access(
+        'cotisations_sociales',
+        str(period.start),
+        simulation.tax_benefit_system.get_parameters_at_instant(period.start).cotisations_sociales,
+        )
+
+    cache = cotisations_sociales_by_population.get(individu, dict())
+    key = (period, cotisation_type)
+    cached = cache.get(key)
+    if cached is not None and cached[0] is assiette_cotisations_sociales and cached[1] is regime_securite_sociale:
+        return cached[2]
+
+    thresholds, rates = get_baremes_tables(individu.simulation.tax_benefit_system, period, parameters)
+    type_index = COTISATIONS_TYPES.index(cotisation_type)
+    cotisations = apply_baremes_tables(
+        assiette_cotisations_sociales,
+        regime_securite_sociale,
+        thresholds[:, :, type_index:type_index + 1],
+        rates[:, :, type_index:type_index + 1],
+        )
+    cotisations_by_name = dict(
+        (bareme_name, - cotisations[:, bareme_index, 0])
+        for bareme_index, bareme_name in enumerate(BAREMES_COTISATIONS)
+        if bareme_name in BAREMES_COTISATIONS_BY_TYPE[cotisation_type]
+        )
+    if key in cache:
+        cache[key] = (assiette_cotisations_sociales, regime_securite_sociale, cotisations_by_name)
+    return cotisations_by_name
+
+
+def compute_cotisation(individu, period, cotisation_type = None, bareme_name = None, parameters = None):
+    '''
+    Returns the amount of a cotisation, computed along with the other cotisations of its side, see
+    `compute_cotisations_sociales`
+    '''
+    assert cotisation_type in COTISATIONS_TYPES
+    return compute_cotisations_sociales(individu, period, parameters, cotisation_type)[bareme_name]
 
 
 class assiette_cotisations_sociales(Variable):
@@ -109,16 +308,20 @@ class cotisations_employeur(Variable):
     definition_period = MONTH
 
     def formula(individu, period):
-        return (
-            individu('accident_du_travail_employeur', period) +
-            individu('deces_employeur', period) +
-            individu('fonds_special_etat', period) +
-            individu('famille_employeur', period) +
-            individu('maladie_employeur', period) +
-            individu('maternite_employeur', period) +
-            individu('protection_sociale_travailleurs_employeur', period) +
-            individu('retraite_employeur', period)
-            )
+        share_cotisations_sociales(individu, period, 'employeur')
+        try:
+            return (
+                individu('accident_du_travail_employeur', period) +
+                individu('deces_employeur', period) +
+                individu('fonds_special_etat', period) +
+                individu('famille_employeur', period) +
+                individu('maladie_employeur', period) +
+                individu('maternite_employeur', period) +
+                individu('protection_sociale_travailleurs_employeur', period) +
+                individu('retraite_employeur', period)
+                )
+        finally:
+            unshare_cotisations_sociales(individu, period, 'employeur')
 
 
 class cotisations_salarie(Variable):
@@ -128,16 +331,20 @@ class cotisations_salarie(Variable):
     definition_period = MONTH
 
     def formula(individu, period):
-        return (
-            individu('accident_du_travail_salarie', period) +
-            individu('deces_salarie', period) +
-            individu('famille_salarie', period) +
-            individu('maladie_salarie', period) +
-            individu('maternite_salarie', period) +
-            individu('protection_sociale_travailleurs_salarie', period) +
-            individu('retraite_salarie', period) +
-            individu('ugtt', period)
-            )
+        share_cotisations_sociales(individu, period, 'salarie')
+        try:
+            return (
+                individu('accident_du_travail_salarie', period) +
+                individu('deces_salarie', period) +
+                individu('famille_salarie', period) +
+                individu('maladie_salarie', period) +
+                individu('maternite_salarie', period) +
+                individu('protection_sociale_travailleurs_salarie', period) +
+                individu('retraite_salarie', period) +
+                individu('ugtt', period)
+                )
+        finally:
+            unshare_cotisations_sociales(individu, period, 'salarie')
 
 
 class accident_du_travail_employeur(Variable):
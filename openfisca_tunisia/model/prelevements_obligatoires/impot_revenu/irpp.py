@@ -3,7 +3,12 @@
 
 from __future__ import division
 
-from numpy import logical_or as or_
+from weakref import WeakKeyDictionary
+
+from numpy import (
+    array, asarray, column_stack, concatenate, cumsum, diff, float32, logical_or as or_, newaxis, result_type,
+    searchsorted, zeros,
+    )
 
 from openfisca_tunisia.model.base import *  # noqa analysis:ignore
 
@@ -645,37 +650,174 @@ class irpp_mensuel_salarie(Variable):
     definition_period = MONTH
 
     def formula(individu, period, parameters):
-        salaire_imposable = individu('salaire_imposable', period = period)
-        deduction_famille_annuelle = individu.foyer_fiscal('deduction_famille', period = period.this_year)
+        return compute_irpp_mensuel_salarie(individu, period, parameters)
 
-        return calcule_impot_revenu_brut(
-            salaire_imposable, deduction_famille_annuelle, period, parameters,
-            )
+
+class irpp_retenu_a_la_source(Variable):
+    value_type = float
+    entity = Individu
+    label = "Impôt sur le revenu des personnes physiques prélevé à la source sur les salaires de l'année"
+    definition_period = YEAR
+
+    def formula(individu, period, parameters):
+        '''
+        Sum of the withholdings of the months, computed at once
+        '''
+        prepare_irpp_mensuel_salarie(individu, period, parameters)
+        try:
+            return individu('irpp_mensuel_salarie', period = period, options = [ADD])
+        finally:
+            # The withholdings not taken, e.g. because a reform replaced irpp_mensuel_salarie, are dropped
+            irpp_mensuel_salarie_by_population.get(individu, dict()).pop(period, None)
+
+
+class irpp_regularisation_annuelle_salarie(Variable):
+    value_type = float
+    entity = Individu
+    label = "Régularisation annuelle de l'impôt sur le revenu prélevé à la source sur les salaires"
+    definition_period = YEAR
+
+    def formula(individu, period, parameters):
+        '''
+        Impôt dû sur le salaire annuel moins l'impôt prélevé à la source, négatif quand un complément est dû
+        '''
+        salaire_imposable = individu('salaire_imposable', period = period, options = [ADD])
+        deduction_famille_annuelle = individu.foyer_fiscal('deduction_famille', period = period)
+        impot_du = 12 * calcule_impot_revenu_brut(
+            salaire_imposable / 12, deduction_famille_annuelle, period, parameters)
+        return impot_du - individu('irpp_retenu_a_la_source', period = period)
 
 
 # Utils
 
+# Withholdings computed in advance by `prepare_irpp_mensuel_salarie`, by population, then by year and month
+irpp_mensuel_salarie_by_population = WeakKeyDictionary()
+
+
+def prepare_irpp_mensuel_salarie(individu, year, parameters):
+    '''
+    Computes at once the withholdings of the months of `year` not calculated yet, for `compute_irpp_mensuel_salarie`
+    '''
+    holder = individu.get_holder('irpp_mensuel_salarie')
+    months = [month for month in year.get_subperiods(MONTH) if holder.get_array(month) is None]
+    if not months:
+        return
+    salaires_imposables = [individu('salaire_imposable', period = month) for month in months]
+    foyer_fiscal = individu.simulation.populations['foyer_fiscal']
+    deduction_famille = foyer_fiscal('deduction_famille', period = year)
+    irpp_mensuel = calcule_impot_revenu_brut_mensuel(
+        column_stack(salaires_imposables), foyer_fiscal.project(deduction_famille), months, parameters)
+    irpp_mensuel_salarie_by_population.setdefault(individu, dict())[year] = dict(
+        (month, (salaire_imposable, deduction_famille, irpp_mensuel[:, index]))
+        for index, (month, salaire_imposable) in enumerate(zip(months, salaires_imposables))
+        )
+
+
+def compute_irpp_mensuel_salarie(individu, period, parameters):
+    '''
+    Returns the withholding of the month `period`, taking it from `prepare_irpp_mensuel_salarie` when computed there
+    from the same `salaire_imposable` and `deduction_famille`
+    '''
+    year = period.this_year
+    salaire_imposable = individu('salaire_imposable', period = period)
+    foyer_fiscal = individu.simulation.populations['foyer_fiscal']
+    deduction_famille = foyer_fiscal('deduction_famille', period = year)
+    prepared = irpp_mensuel_salarie_by_population.get(individu, dict()).get(year, dict()).pop(period, None)
+    if prepared is not None and prepared[0] is salaire_imposable and prepared[1] is deduction_famille:
+        # Read the parameters of the month as `calcule_impot_revenu_brut_mensuel` did, so that the tracers record
+        # them for this calculation too
+        get_impot_revenu_brut_parameters(parameters(period.start), year.start.year)
+        return prepared[2]
+    return calcule_impot_revenu_brut(salaire_imposable, foyer_fiscal.project(deduction_famille), period, parameters)
+
+
 def calcule_impot_revenu_brut(salaire_mensuel, deduction_famille_annuelle, period, parameters):
-    revenu_assimile_salaire = salaire_mensuel
-    smig_40h_mensuel = parameters(period.start).cotisations_sociales.gen.smig_40h_mensuel
-    smig = revenu_assimile_salaire <= smig_40h_mensuel
-    tspr = parameters(period.start).impot_revenu.tspr
+    '''
+    Returns the withholding on the monthly salary `salaire_mensuel`, with the parameters at the start of `period`
+    '''
+    return calcule_impot_revenu_brut_mensuel(
+        asarray(salaire_mensuel)[..., newaxis], deduction_famille_annuelle, [period], parameters)[..., 0]
 
-    if period.start.year >= 2011:
+
+def calcule_impot_revenu_brut_mensuel(salaires_mensuels, deduction_famille_annuelle, months, parameters):
+    '''
+    Returns the withholdings on `salaires_mensuels`, having a column by month of `months`, of the same year
+
+    The parameters are resolved once by month, as arrays by month broadcast along the columns, and each distinct
+    bareme is applied once to all the months it is in force.
+    '''
+    year = months[0].start.year
+    parameters_by_month = [get_impot_revenu_brut_parameters(parameters(month.start), year) for month in months]
+    dtype = result_type(salaires_mensuels.dtype, float32)
+
+    def by_month(name):
+        return array([parameters_of_month[name] for parameters_of_month in parameters_by_month], dtype = dtype)
+
+    smig_40h_mensuel = by_month('smig_40h_mensuel')
+    abat_sal = by_month('abat_sal')
+    tspr_smig = by_month('smig')
+
+    revenu_assimile_salaire = salaires_mensuels
+    smig = revenu_assimile_salaire <= smig_40h_mensuel
+    if year >= 2011:
+        smig_ext = by_month('smig_ext')
         revenu_assimile_salaire_apres_abattement = max_(
-            revenu_assimile_salaire * (1 - tspr.abat_sal) - max_(smig * tspr.smig,
-                (revenu_assimile_salaire <= tspr.smig_ext) * tspr.smig), 0)
+            revenu_assimile_salaire * (1 - abat_sal) - max_(smig * tspr_smig,
+                (revenu_assimile_salaire <= smig_ext) * tspr_smig), 0)
     else:
         revenu_assimile_salaire_apres_abattement = max_(
-            revenu_assimile_salaire * (1 - tspr.abat_sal) - smig * tspr.smig, 0)
-    bareme = parameters(period.start).impot_revenu.bareme
+            revenu_assimile_salaire * (1 - abat_sal) - smig * tspr_smig, 0)
+    base = 12 * revenu_assimile_salaire_apres_abattement - asarray(deduction_famille_annuelle)[..., newaxis]
 
     non_exonere = revenu_assimile_salaire_apres_abattement >= 0
-    if 2014 <= period.start.year <= 2016:
-        non_exonere = (
-            (12 * revenu_assimile_salaire_apres_abattement - deduction_famille_annuelle)
-            ) > parameters(period.start).impot_revenu.exoneration.seuil
-
-    return - 1.0 * non_exonere * bareme.calc(
-        (12 * revenu_assimile_salaire_apres_abattement - deduction_famille_annuelle)
-        ) / 12
+    if 2014 <= year <= 2016:
+        non_exonere = base > by_month('seuil')
+
+    columns_by_bareme = dict()
+    for column, parameters_of_month in enumerate(parameters_by_month):
+        bareme = parameters_of_month['bareme']
+        columns_by_bareme.setdefault((tuple(bareme.thresholds), tuple(bareme.rates)), []).append(column)
+    if len(columns_by_bareme) == 1:
+        (thresholds, rates), = columns_by_bareme
+        impot = calcule_bareme(thresholds, rates, base)
+    else:
+        impot = zeros(base.shape, dtype = dtype)
+        for (thresholds, rates), columns in columns_by_bareme.items():
+            impot[:, columns] = calcule_bareme(thresholds, rates, base[:, columns])
+
+    return - 1.0 * non_exonere * impot / 12
+
+
+def get_impot_revenu_brut_parameters(parameters_at_instant, year):
+    '''
+    Returns the parameters read by `calcule_impot_revenu_brut_mensuel` at an instant of `year`, by name
+    '''
+    tspr = parameters_at_instant.impot_revenu.tspr
+    parameters_by_name = dict(
+        smig_40h_mensuel = parameters_at_instant.cotisations_sociales.gen.smig_40h_mensuel,
+        abat_sal = tspr.abat_sal,
+        smig = tspr.smig,
+        bareme = parameters_at_instant.impot_revenu.bareme,
+        )
+    if year >= 2011:
+        parameters_by_name['smig_ext'] = tspr.smig_ext
+    if 2014 <= year <= 2016:
+        parameters_by_name['seuil'] = parameters_at_instant.impot_revenu.exoneration.seuil
+    return parameters_by_name
+
+
+def calcule_bareme(thresholds, rates, base):
+    '''
+    Same as `MarginalRateTaxScale.calc`, locating the bracket of each base instead of going through all the brackets
+    '''
+    thresholds = array(thresholds, dtype = base.dtype)
+    rates = array(rates, dtype = base.dtype)
+    # Amount at each threshold
+    cumulative = concatenate([[0], cumsum(rates[:-1] * diff(thresholds))]).astype(base.dtype)
+    bracket = searchsorted(thresholds, base, side = 'right') - 1
+    clipped_bracket = max_(bracket, 0)
+    return where(
+        bracket >= 0,
+        cumulative[clipped_bracket] + rates[clipped_bracket] * (base - thresholds[clipped_bracket]),
+        0,
+        )
@@ -3,52 +3,116 @@
 
 from __future__ import division
 
-from numpy import (
-    round, maximum as max_, minimum as min_, logical_xor as xor_, logical_not as not_,
-    asanyarray, amin, amax, arange)
+from weakref import WeakKeyDictionary
+
+from numpy import array, bincount, concatenate, logical_xor as xor_, maximum as max_, minimum as min_, round
 
 from openfisca_tunisia.model.base import *  # noqa analysis:ignore
+from openfisca_tunisia.model.ranks import get_members_order, rank_members
 
 
-def age_min(age, minimal_age=None):
-    '''
-    Returns minimal age higher than or equal to a
-    '''
-    if minimal_age is None:
-        minimal_age = 0
-    ages = asanyarray(age)
-    ages = ages + (ages < minimal_age) * 9999
-    return amin(ages, axis=1)
+# Number of children giving right to the allocations familiales and to the majoration du salaire unique, from the
+# eldest
+NOMBRE_ENFANTS_MAX = 3  # TODO: 4e enfant qui en bénéficiait en 1989
 
+# Prestations familiales computed by `compute_prestations_familiales`, by population and period
+prestations_familiales_by_population = WeakKeyDictionary()
 
-def age_max(age):
-    '''
-    Returns minimal age higher than or equal to a
-    '''
-    ages = asanyarray(age)
-    return amax(ages, axis=1)
 
+def compute_prestations_familiales(menage, period, parameters):
+    '''
+    Computes all the prestations familiales of the year at once, from the ranks of the children by age in their menage
 
-def ages_first_kids(age, nb=None):
+    Returns a dict of arrays by menage, by variable name, shared by the variables of the prestations familiales.
+    The result is kept as long as the arrays of the members stay the same, and until each value has been taken by
+    `compute_prestation_familiale`.
     '''
-    Returns the ages of the nb first born kids according to age
+    # The children à charge and the ages are the ones of the month before the year
+    month = period.last_month
+    enfant_a_charge = menage.members('prestations_familiales_enfant_a_charge', month)
+    age_en_mois = menage.members('age_en_mois', month)
+    salaire_imposable_mensuel = menage.members('salaire_imposable', month)
+    salaires_imposables = tuple(
+        menage.members('salaire_imposable', subperiod) for subperiod in period.get_subperiods(MONTH))
+    P = parameters(period.start).prestations_familiales
+    smig48 = parameters(period.start).cotisations_sociales.gen.smig_48h_mensuel  # TODO: smig 48H
+
+    inputs = (enfant_a_charge, age_en_mois, salaire_imposable_mensuel) + salaires_imposables
+    cache = prestations_familiales_by_population.setdefault(menage, dict())
+    cached = cache.get(period)
+    if cached is not None and all(value is cached_value for value, cached_value in zip(inputs, cached[0])):
+        return cached[1]
+
+    entity_id = menage.members_entity_id
+    # Rank of the children à charge in their menage, from the eldest, 0 for the other members and the children beyond
+    # NOMBRE_ENFANTS_MAX
+    rang = rank_members(menage, 'age_en_mois', month, eligible = enfant_a_charge)
+    rang[rang > NOMBRE_ENFANTS_MAX] = 0
+
+    # Salaires of the personne de référence and of the conjoint
+    personne_de_reference = menage.members.has_role(Menage.PERSONNE_DE_REFERENCE)
+    conjoint = menage.members.has_role(Menage.CONJOINT)
+    salaire_imposable = sum(salaires_imposables)
+    salaire_imposable_personne_de_reference = bincount(
+        entity_id, weights = salaire_imposable * personne_de_reference, minlength = menage.count)
+    salaire_imposable_conjoint = bincount(
+        entity_id, weights = salaire_imposable * conjoint, minlength = menage.count)
+    salaire_unique = xor_(salaire_imposable_personne_de_reference > 0, salaire_imposable_conjoint > 0)
+
+    # Allocations familiales, the quarterly amount being a rate by rank of the quarterly salaire capped at 122 dinars
+    # TODO: ajouter éligibilité des parents aux allocations familiales
+    base_trimestrielle = min_(max_(salaire_imposable_personne_de_reference, salaire_imposable_conjoint) / 4,
+        P.af.plaf_trim)
+    taux = array([0, P.af.taux.enf1, P.af.taux.enf2, P.af.taux.enf3])
+    af = bincount(entity_id, weights = round(base_trimestrielle[entity_id] * taux[rang], 2), minlength = menage.count)
+
+    # Majoration du salaire unique, a quarterly amount by rank
+    montants = array([
+        0, round(P.salaire_unique.enf1, 3), round(P.salaire_unique.enf2, 3), round(P.salaire_unique.enf3, 3)])
+    majoration_salaire_unique = bincount(entity_id, weights = montants[rang], minlength = menage.count)
+
+    # Contribution aux frais de crêche
+    # TODO rework and test
+    # Une prise en charge peut être accordée à la mère exerçant une
+    # activité salariée et dont le salaire ne dépasse pas deux fois et demie
+    # le SMIG pour 48 heures de travail par semaine. Cette contribution est
+    # versée pour les enfants ouvrant droit aux prestations familiales et
+    # dont l'âge est compris entre 2 et 36 mois. Elle s'élève à 15 dinars par
+    # enfant et par mois pendant 11 mois.
+    somme_salaire_imposable = bincount(
+        entity_id, weights = salaire_imposable_mensuel * (personne_de_reference | conjoint), minlength = menage.count)
+    # The youngest member is the last one of its menage, from the eldest
+    order, first = get_members_order(menage, 'age_en_mois', month)
+    age_en_mois_benjamin = age_en_mois[order[concatenate([first[1:], [len(order)]]) - 1]]
+    elig_age = (age_en_mois_benjamin <= P.creche.age_max) * (age_en_mois_benjamin >= P.creche.age_min)
+    elig_sal = somme_salaire_imposable < P.creche.plaf * smig48
+    contribution_frais_creche = P.creche.montant * elig_age * elig_sal * min_(P.creche.duree, 12 - age_en_mois_benjamin)
+
+    prestations_familiales_by_name = dict(
+        af_nbenf = bincount(entity_id, weights = rang > 0, minlength = menage.count),
+        salaire_unique = salaire_unique,
+        af = 4 * af,  # annualisé
+        majoration_salaire_unique = 4 * majoration_salaire_unique * salaire_unique,  # annualisé
+        contribution_frais_creche = contribution_frais_creche,
+        )
+    cache[period] = (inputs, prestations_familiales_by_name)
+    return prestations_familiales_by_name
+
+
+def compute_prestation_familiale(menage, period, name, parameters):
     '''
-    ages = asanyarray(list(age.values()))
-
-    ages = (ages.T + .00001 * arange(ages.shape[0])).T  # To deal with twins
-
-    if nb is None:
-        nb = 3  # TODO: 4e enfant qui en bénéficiait en 1989
-    i = 0
-    age_list = []
-
-    while i < 4:
-        from numpy import putmask
-        maximas = amax(ages, axis=0)
-        age_list.append(round(maximas))
-        putmask(ages, ages == maximas, -99999)
-        i += 1
-    return age_list
+    Takes the value of a variable out of the cache of `compute_prestations_familiales`
+    '''
+    prestations_familiales_by_name = compute_prestations_familiales(menage, period, parameters)
+    value = prestations_familiales_by_name.pop(name, None)
+    if value is None:
+        # Already taken by a calculation whose value is not cached anymore
+        del prestations_familiales_by_population[menage][period]
+        prestations_familiales_by_name = compute_prestations_familiales(menage, period, parameters)
+        value = prestations_familiales_by_name.pop(name)
+    if not prestations_familiales_by_name:
+        del prestations_familiales_by_population[menage][period]
+    return value
 
 
 class salaire_unique(Variable):
@@ -57,10 +121,8 @@ class salaire_unique(Variable):
     label = "Indicatrice de salaire unique"
     definition_period = YEAR
 
-    def formula(individu, period):
-        salaire_imposable_personne_de_reference = menage.personne_de_reference('salaire_imposable', period = period)
-        salaire_imposable_conjoint = menage.conjoint('salaire_imposable', period = period)
-        return xor_(salaire_imposable_personne_de_reference > 0, salaire_imposable_conjoint > 0)
+    def formula(menage, period, parameters):
+        return compute_prestation_familiale(menage, period, 'salaire_unique', parameters)
 
 
 # Allocations familiales
@@ -85,20 +147,19 @@ class prestations_familiales_enfant_a_charge(Variable):
     # locales.
 
     def formula(individu, period, parameters):
-        age = individu('age', period)
+        age = individu('age', period.this_year)
+        salaire_imposable = individu('salaire_imposable', period)
         invalide = individu('invalide', period)
         est_enfant = individu.has_role(Menage.ENFANT)
+        smig_48h_mensuel = parameters(period.start).cotisations_sociales.gen.smig_48h_mensuel
 
-        condition_enfant = or_(
-            (age_individu <= 16) +
-            (age_individu <= 18) * (salaire_individu <= .75 * smig_48h_mensuel)
-            )
+        condition_enfant = (age <= 16) + (age <= 18) * (salaire_imposable <= .75 * smig_48h_mensuel)
         condition_jeune_etudiant_ou_invalide = (
-            # (age_individu <= 21) * etudiant ou soeur au foyer
-            (invalide_individu)
+            # (age <= 21) * etudiant ou soeur au foyer
+            invalide
             )
 
-        return or_(condition_enfant, condition_jeune_etudiant_ou_invalide) * est_enfant
+        return (condition_enfant + condition_jeune_etudiant_ou_invalide) * est_enfant
 
 
 class af_nbenf(Variable):
@@ -108,13 +169,7 @@ class af_nbenf(Variable):
     definition_period = YEAR
 
     def formula(menage, period, parameters):
-        prestations_familiales_enfant_a_charge = menage.members(
-            'prestations_familiales_enfant_a_charge', period)
-        af_nbenf = max_(
-            menage.sum(prestations_familiales_enfant_a_charge),
-            3
-            )
-        return af_nbenf
+        return compute_prestation_familiale(menage, period, 'af_nbenf', parameters)
 
 
 class af(Variable):
@@ -124,43 +179,17 @@ class af(Variable):
     definition_period = YEAR
 
     def formula(menage, period, parameters):
-        af_nbenf = menage('af_nbenf', period = period)
-        # Le montant trimestriel est calculé en pourcentage de la rémunération globale trimestrielle palfonnée
-        # à 122 dinars
-        # TODO: ajouter éligibilité des parents aux allocations familiales
-        P = _P.prestations_familiales
-        bm = min_(
-            max_(
-                menage.personne_de_reference('salaire_imposable', period),
-                menage.conjoint('salaire_imposable', period),
-                ) / 4,
-            P.af.plaf_trim
-            )  # base trimestrielle
-        # prestations familliales  # Règle d'arrondi ?
-        af_1enf = round(bm * parameters.af.taux.enf1, 2)
-        af_2enf = round(bm * parameters.af.taux.enf2, 2)
-        af_3enf = round(bm * parameters.af.taux.enf3, 2)
-        af_base = (af_nbenf >= 1) * af_1enf + \
-            (af_nbenf >= 2) * af_2enf + (af_nbenf >= 3) * af_3enf
-        return 4 * af_base  # annualisé
+        return compute_prestation_familiale(menage, period, 'af', parameters)
 
 
 class majoration_salaire_unique(Variable):
     value_type = float
     entity = Menage
     label = "Majoration du salaire unique"
-    definition_period = YEAR  # TODO trimestrialiser
+    definition_period = YEAR  # TODO trimestrialiser
 
     def formula(menage, period, parameters):
-        salaire_unique = menage('salaire_unique', period = period)
-        af_nbenf = menage('af_nbenf', period = period)
-        P = parameters(period.start).prestations_familiales
-        af_1enf = round(P.salaire_unique.enf1, 3)  # trimestrielle
-        af_2enf = round(P.salaire_unique.enf2, 3)  # trimestrielle
-        af_3enf = round(P.salaire_unique.enf3, 3)  # trimestrielle
-        af = (af_nbenf >= 1) * af_1enf + (af_nbenf >= 2) * \
-            af_2enf + (af_nbenf >= 3) * af_3enf
-        return 4 * af * salaire_unique  # annualisé
+        return compute_prestation_familiale(menage, period, 'majoration_salaire_unique', parameters)
 
 
 def _af_cong_naiss(age, _P):
@@ -188,29 +217,7 @@ class contribution_frais_creche(Variable):
     definition_period = YEAR
 
     def formula(menage, period, parameters):
-        month = period.last_month
-        salaire_imposable_holder = menage.members('salaire_imposable', period = month)
-        age_en_mois_holder = menage.members('age_en_mois', period = month)
-        smig48 = parameters(period.start).cotisations_sociales.gen.smig_48h_mensuel  # TODO: smig 48H
-        # TODO rework and test
-        # Une prise en charge peut être accordée à la mère exerçant une
-        # activité salariée et dont le salaire ne dépasse pas deux fois et demie
-        # le SMIG pour 48 heures de travail par semaine. Cette contribution est
-        # versée pour les enfants ouvrant droit aux prestations familiales et
-        # dont l'âge est compris entre 2 et 36 mois. Elle s'élève à 15 dinars par
-        # enfant et par mois pendant 11 mois.
-        # , _option = {'age_en_mois': ENFS, 'sal': [CHEF, PART]}
-        somme_salaire_imposable = (
-            menage.personne_de_reference('salaire_imposable', period = month) +
-            menage.conjoint('salaire_imposable', period = month)
-            )
-        age_en_mois = menage.members('age_en_mois', period = month)
-        P = parameters(period).prestations_familiales.creche
-        age_en_mois_benjamin = menage.min(age_en_mois)[0]
-
-        elig_age = (age_en_mois_benjamin <= P.age_max) * (age_en_mois_benjamin >= P.age_min)
-        elig_sal = somme_salaire_imposable < P.plaf * smig48
-        return P.montant * elig_age * elig_sal * min_(P.duree, 12 - age_en_mois_benjamin)
+        return compute_prestation_familiale(menage, period, 'contribution_frais_creche', parameters)
 
 
 class prestations_familiales(Variable):  # TODO add _af_cong_naiss, af_cong_jeun_trav
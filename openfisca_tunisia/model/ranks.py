@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Ranks of the members within their group entity, e.g. the k-th eldest child à charge of each menage
+
+    rang = rank_members(menage, 'age_en_mois', period, eligible = enfant_a_charge)
+    ages = top_k(menage, age_en_mois, rang, 3)  # Ages of the three eldest children à charge, by menage
+
+The members of each group are sorted once by key variable and period.
+'''
+
+
+from weakref import WeakKeyDictionary
+
+from numpy import bincount, concatenate, cumsum, empty_like, float64, full, lexsort, ones
+
+
+# Orders of the members computed by `get_members_order`, by population, then by (key variable, period, descending)
+members_order_by_population = WeakKeyDictionary()
+
+
+def get_members_order(group, key_variable, period, descending = True):
+    '''
+    Returns the indices of the members of the `group` population sorted by group, then by their `key_variable` over
+    `period` (from the largest if `descending`), and the index in this order of the first member of each group
+
+    The members with the same key stay in their order. The result is kept as long as the array of `key_variable`
+    stays the same.
+    '''
+    key = group.members(key_variable, period)
+    cache = members_order_by_population.setdefault(group, dict())
+    cached = cache.get((key_variable, period, descending))
+    if cached is not None and cached[0] is key:
+        return cached[1]
+
+    sort_key = key.astype(float64)
+    order = lexsort((- sort_key if descending else sort_key, group.members_entity_id))
+    members_count = bincount(group.members_entity_id, minlength = group.count)
+    first = cumsum(members_count) - members_count
+    cache[(key_variable, period, descending)] = (key, (order, first))
+    return order, first
+
+
+def rank_members(group, key_variable, period, eligible = None, descending = True):
+    '''
+    Returns the rank, from 1, of each member among the `eligible` members (all the members if None) of its group
+    sorted by `key_variable` over `period`, 0 for the members not eligible
+
+    See `get_members_order`.
+    '''
+    order, first = get_members_order(group, key_variable, period, descending = descending)
+    sorted_eligible = ones(len(order), dtype = int) if eligible is None else eligible[order].astype(int)
+    # Number of eligible members up to each sorted member, from the first member of its group
+    eligible_count = cumsum(sorted_eligible)
+    sorted_rank = (eligible_count - concatenate([[0], eligible_count])[first][group.members_entity_id[order]]) * \
+        sorted_eligible
+    rank = empty_like(sorted_rank)
+    rank[order] = sorted_rank
+    return rank
+
+
+def top_k(group, values, rank, k, default = 0):
+    '''
+    Returns the `values` of the members ranked from 1 to `k` by `rank_members`, as an array of shape (groups, `k`),
+    `default` where a group has fewer ranked members
+    '''
+    top = full((group.count, k), default, dtype = values.dtype)
+    selected = (rank >= 1) & (rank <= k)
+    top[group.members_entity_id[selected], rank[selected] - 1] = values[selected]
+    return top
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Evaluation of many variants of the parameters on the same simulation
+
+    variants = [
+        {'impot_revenu.bareme[1].rate': .27},
+        {'impot_revenu.bareme[1].rate': .28, 'impot_revenu.tspr.abat_sal': .15},
+        ]
+    aggregates = sweep(simulation, 2018, variants, ['irpp', 'revenu_disponible'])
+    aggregates['irpp']  # Sums of irpp, by variant
+
+The simulation is calculated once. Each variant is then calculated on a copy sharing all the calculations which do not
+depend on the overridden parameters, see `reform_delta`.
+'''
+
+
+import re
+from collections import OrderedDict
+
+from numpy import array, float64
+
+from openfisca_core import periods
+from openfisca_core.reforms import Reform
+
+from openfisca_tunisia.reform_delta import build_reform_simulation, get_affected_calculations, track_baseline
+
+
+# Key of a bracket of a scale, e.g. bareme[1]
+BRACKET_KEY_RE = re.compile(r'(?P<name>\w+)\[(?P<index>\d+)\]$')
+
+
+def get_parameter(parameters, name):
+    '''
+    Returns the parameter `name` of `parameters`, the brackets of the scales being named like in their
+    `name` attribute, e.g. `impot_revenu.bareme[1].rate`
+    '''
+    parameter = parameters
+    for key in name.split('.'):
+        match = BRACKET_KEY_RE.match(key)
+        if match is None:
+            parameter = getattr(parameter, key)
+        else:
+            parameter = getattr(parameter, match.group('name')).brackets[int(match.group('index'))]
+    return parameter
+
+
+def build_variant(tax_benefit_system, overrides, period):
+    '''
+    Returns a reform of `tax_benefit_system` setting each parameter of `overrides`, a dict by name, to its value
+    over `period`
+    '''
+    period = periods.period(period)
+
+    class variant(Reform):
+        name = 'Variant of the parameters'
+
+        def apply(self):
+            def modify_parameters(parameters):
+                for name, value in overrides.items():
+                    get_parameter(parameters, name).update(period = period, value = value)
+                return parameters
+
+            self.modify_parameters(modifier_function = modify_parameters)
+
+    return variant(tax_benefit_system)
+
+
+def sweep(simulation, period, variants, variables, weights = None):
+    '''
+    Returns the sums of `variables` over `period` for each of `variants`, as arrays indexed by variant
+
+    `variants` is a list of dicts of parameter values by name, see `get_parameter`. `weights` gives the weight variable
+    by entity key, the sums of the variables of the other entities being unweighted. The values already calculated in
+    `simulation` before the sweep or an other `reform_delta.track_baseline` are taken as inputs.
+    '''
+    period = periods.period(period)
+    if weights is None:
+        weights = dict()
+    if not hasattr(simulation.tracer, 'known_calculations'):
+        track_baseline(simulation)
+    for variable in variables:
+        simulation.calculate_add(variable, period)
+    weight_by_entity = dict(
+        (entity_key, simulation.calculate(weight_variable, period))
+        for entity_key, weight_variable in weights.items()
+        )
+
+    # The calculations affected by the variants overriding the same parameters are the same
+    affected_by_names = dict()
+    aggregates = OrderedDict((variable, list()) for variable in variables)
+    for overrides in variants:
+        variant = build_variant(simulation.tax_benefit_system, overrides, period)
+        names = frozenset(overrides)
+        affected = affected_by_names.get(names)
+        if affected is None:
+            affected = affected_by_names[names] = get_affected_calculations(
+                simulation, variant, changed_parameters = names)
+        variant_simulation = build_reform_simulation(simulation, variant, affected = affected)
+        for variable in variables:
+            value = variant_simulation.calculate_add(variable, period)
+            weight = weight_by_entity.get(simulation.get_variable_population(variable).entity.key)
+            aggregates[variable].append((value if weight is None else value * weight).sum(dtype = float64))
+    return OrderedDict((variable, array(values)) for variable, values in aggregates.items())
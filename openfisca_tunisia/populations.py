@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Populations whose aggregations over the members of the group entities use a cached index
+
+OpenFisca-Core compares the object array of the roles of the members at each `has_role`, and loops over the positions
+in the groups for `max`, `min` and `all`. `AggregationIndex` holds, once for each group population, the members sorted
+by group, the offsets of the groups in this order and the mask of each role, so that:
+
+- `has_role`, `sum(array, role)`, `nb_persons(role)` and the projections on a role reuse the masks,
+- `max`, `min`, `all` and `reduce` are segment reductions, e.g. `numpy.maximum.reduceat`, of the sorted members,
+- `value_from_person` reads the member of each group having the role.
+
+The index is built again when the arrays of the groups of the members or of their roles are replaced.
+'''
+
+
+import numpy
+
+from openfisca_core import projectors
+from openfisca_core.indexed_enums import EnumArray
+from openfisca_core.populations import GroupPopulation, Population
+
+
+class AggregationIndex(object):
+    '''
+    Members of a group population sorted by group, with the offsets of the groups and the masks of the roles
+    '''
+
+    def __init__(self, members_entity_id, members_role, count):
+        self.members_entity_id = members_entity_id
+        self.members_role = members_role
+        self.count = count
+        self.order = numpy.argsort(members_entity_id, kind = 'stable')
+        self.members_count = numpy.bincount(members_entity_id, minlength = count)
+        self.offsets = numpy.cumsum(self.members_count) - self.members_count
+        self.not_empty = self.members_count > 0
+        self._masks = dict()  # Masks of the members, by role
+        self._unique_members = dict()  # Index of the member with each unique role, -1 if none, by role
+
+    def get_role_mask(self, role):
+        mask = self._masks.get(role)
+        if mask is None:
+            if role.subroles:
+                mask = numpy.logical_or.reduce([self.get_role_mask(subrole) for subrole in role.subroles])
+            else:
+                mask = self.members_role == role
+            mask = self._masks[role] = numpy.asarray(mask, dtype = bool)
+        return mask
+
+    def get_unique_member(self, role):
+        member = self._unique_members.get(role)
+        if member is None:
+            member = self._unique_members[role] = numpy.full(self.count, -1)
+            members = numpy.flatnonzero(self.get_role_mask(role))
+            member[self.members_entity_id[members]] = members
+        return member
+
+    def reduce(self, array, ufunc, neutral_element, role = None):
+        '''
+        Returns the reduction by `ufunc` of `array` over the members (having `role` if given) of each group,
+        `neutral_element` for the groups without such members
+        '''
+        values = array[self.order]
+        if role is not None:
+            values = numpy.where(self.get_role_mask(role)[self.order], values, neutral_element)
+        result = numpy.full(self.count, neutral_element)
+        if len(values):
+            result[self.not_empty] = ufunc.reduceat(values, self.offsets[self.not_empty])
+        return result
+
+
+class TunisiaPopulation(Population):
+    '''
+    Population of the individus, whose roles come from the `AggregationIndex` of the group populations
+    '''
+
+    def clone(self, simulation):
+        result = TunisiaPopulation(self.entity)
+        result.simulation = simulation
+        result._holders = {variable: holder.clone(result) for (variable, holder) in self._holders.items()}
+        result.count = self.count
+        result.ids = self.ids
+        return result
+
+    @projectors.projectable
+    def has_role(self, role):
+        if self.simulation is None:
+            return None
+        self.entity.check_role_validity(role)
+        group_population = self.simulation.get_population(role.entity.plural)
+        return group_population.aggregation_index.get_role_mask(role).copy()
+
+
+class TunisiaGroupPopulation(GroupPopulation):
+    '''
+    Group population aggregating the values of its members with an `AggregationIndex`
+    '''
+
+    _aggregation_index = None
+
+    def clone(self, simulation):
+        result = TunisiaGroupPopulation(self.entity, self.members)
+        result.simulation = simulation
+        result._holders = {variable: holder.clone(self) for (variable, holder) in self._holders.items()}
+        result.count = self.count
+        result.ids = self.ids
+        result._members_entity_id = self._members_entity_id
+        result._members_role = self._members_role
+        result._members_position = self._members_position
+        result._ordered_members_map = self._ordered_members_map
+        result._aggregation_index = self._aggregation_index
+        return result
+
+    @property
+    def aggregation_index(self):
+        index = self._aggregation_index
+        members_entity_id = self.members_entity_id
+        members_role = self.members_role
+        if (
+                index is None or
+                index.members_entity_id is not members_entity_id or
+                index.members_role is not members_role or
+                index.count != self.count
+                ):
+            index = self._aggregation_index = AggregationIndex(members_entity_id, members_role, self.count)
+        return index
+
+    @projectors.projectable
+    def sum(self, array, role = None):
+        self.entity.check_role_validity(role)
+        self.members.check_array_compatible_with_entity(array)
+        if role is None:
+            return numpy.bincount(self.members_entity_id, weights = array, minlength = self.count)
+        role_filter = self.aggregation_index.get_role_mask(role)
+        return numpy.bincount(self.members_entity_id[role_filter], weights = array[role_filter], minlength = self.count)
+
+    @projectors.projectable
+    def reduce(self, array, reducer, neutral_element, role = None):
+        self.members.check_array_compatible_with_entity(array)
+        self.entity.check_role_validity(role)
+        return self.aggregation_index.reduce(numpy.asarray(array), reducer, neutral_element, role = role)
+
+    @projectors.projectable
+    def all(self, array, role = None):
+        return self.reduce(array, reducer = numpy.logical_and, neutral_element = True, role = role)
+
+    @projectors.projectable
+    def max(self, array, role = None):
+        return self.reduce(array, reducer = numpy.maximum, neutral_element = - numpy.inf, role = role)
+
+    @projectors.projectable
+    def min(self, array, role = None):
+        return self.reduce(array, reducer = numpy.minimum, neutral_element = numpy.inf, role = role)
+
+    @projectors.projectable
+    def nb_persons(self, role = None):
+        if role is None:
+            return self.aggregation_index.members_count
+        return numpy.bincount(
+            self.members_entity_id, weights = self.aggregation_index.get_role_mask(role), minlength = self.count)
+
+    @projectors.projectable
+    def value_from_person(self, array, role, default = 0):
+        self.entity.check_role_validity(role)
+        if role.max != 1:
+            raise Exception(
+                'You can only use value_from_person with a role that is unique in {}. Role {} is not unique.'
+                .format(self.key, role.key)
+                )
+        self.members.check_array_compatible_with_entity(array)
+        member = self.aggregation_index.get_unique_member(role)
+        result = self.filled_array(default, dtype = array.dtype)
+        has_member = member >= 0
+        result[has_member] = numpy.asarray(array)[member[has_member]]
+        if isinstance(array, EnumArray):
+            result = EnumArray(result, array.possible_values)
+        return result
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Per-variable profiler of the simulations
+
+`Profiler` is a tracer recording, for each calculated (variable, period), the number of calls, the cumulative and self
+wall times and the size of the resulting array, and the same times along the calculation paths. It keeps no computed
+value nor parameter access, so that it may stay on for large simulations:
+
+    profiler = profile(simulation)
+    simulation.calculate('revenu_disponible', 2018)
+    profiler.print_tree('revenu_disponible')
+    profiler.write_json('profile.json')
+    profiler.write_collapsed('profile.folded')  # For flamegraph.pl, speedscope, etc.
+
+With `profile(simulation, parameters = True)`, it also records the names of the parameters read by each calculation.
+'''
+
+
+import json
+from time import perf_counter
+
+from openfisca_core.parameters import ParameterNodeAtInstant, VectorialParameterNodeAtInstant
+from openfisca_core.periods import ETERNITY
+from openfisca_core.tracers import SimpleTracer, TracingParameterNodeAtInstant
+
+from openfisca_tunisia.memory import MemoryManager
+
+
+# Indices of the statistics lists
+CALLS, CUMULATIVE_TIME, SELF_TIME, SIZE, NBYTES = range(5)
+
+
+class Profiler(SimpleTracer):
+    '''
+    Tracer recording the time spent in each (variable, period)
+
+    The times of a (variable, period) include the calls returning its cached value. Its size and bytes are the ones
+    of the array returned by the calculation.
+    '''
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        # [path, start time, time spent in the children, size, bytes] of the calculations in progress
+        self._frames = []
+        self.stats = dict()  # Statistics by (variable, period)
+        self.path_stats = dict()  # Statistics by calculation path, a tuple of (variable, period) from the root
+        self.parameters = dict()  # Names of the parameters read, by (variable, period)
+
+    def record_calculation_start(self, variable, period):
+        super(Profiler, self).record_calculation_start(variable, period)
+        path = (self._frames[-1][0] if self._frames else ()) + ((variable, period),)
+        self._frames.append([path, perf_counter(), 0.0, 0, 0])
+
+    def record_calculation_result(self, value):
+        frame = self._frames[-1]
+        frame[3] = getattr(value, 'size', 1)
+        frame[4] = getattr(value, 'nbytes', 0)
+
+    def record_parameter_access(self, parameter, period, value):
+        if self._frames:
+            self.parameters.setdefault(self._frames[-1][0][-1], set()).add(parameter)
+
+    def record_calculation_end(self):
+        super(Profiler, self).record_calculation_end()
+        path, start, children_time, size, nbytes = self._frames.pop()
+        elapsed = perf_counter() - start
+        if self._frames:
+            self._frames[-1][2] += elapsed
+        for stats_by_key, key in [(self.stats, path[-1]), (self.path_stats, path)]:
+            stats = stats_by_key.get(key)
+            if stats is None:
+                stats = stats_by_key[key] = [0, 0.0, 0.0, 0, 0]
+            stats[CALLS] += 1
+            stats[CUMULATIVE_TIME] += elapsed
+            stats[SELF_TIME] += elapsed - children_time
+            stats[SIZE] = max(stats[SIZE], size)
+            stats[NBYTES] = max(stats[NBYTES], nbytes)
+
+    def reset(self):
+        self.stats = dict()
+        self.path_stats = dict()
+        self.parameters = dict()
+
+    def get_variables_stats(self):
+        '''
+        Returns the statistics by (variable, period), by decreasing self time
+        '''
+        return [
+            dict(
+                variable = variable,
+                period = str(period),
+                calls = stats[CALLS],
+                cumulative_time = stats[CUMULATIVE_TIME],
+                self_time = stats[SELF_TIME],
+                size = stats[SIZE],
+                nbytes = stats[NBYTES],
+                )
+            for (variable, period), stats in sorted(self.stats.items(), key = lambda item: - item[1][SELF_TIME])
+            ]
+
+    def get_dependents(self, variable, period = None):
+        '''
+        Returns the set of the (variable, period) whose calculations used `variable`, over a period overlapping
+        `period` (any period if None), directly or not
+        '''
+        return self.get_calculations_dependents(
+            calculation
+            for calculation in self.stats
+            if calculation[0] == variable and (period is None or overlap(calculation[1], period))
+            )
+
+    def get_calculations_dependents(self, calculations):
+        '''
+        Returns the set of the (variable, period) whose calculations used one of `calculations`, directly or not
+        '''
+        parents_by_calculation = self.get_consumers()
+        dependents = set()
+        pending = list(calculations)
+        while pending:
+            for parent in parents_by_calculation.get(pending.pop(), ()):
+                if parent not in dependents:
+                    dependents.add(parent)
+                    pending.append(parent)
+        return dependents
+
+    def get_consumers(self):
+        '''
+        Returns the sets of the (variable, period) whose calculations directly used each (variable, period)
+        '''
+        consumers = dict()
+        for path in self.path_stats:
+            for parent, child in zip(path[:-1], path[1:]):
+                consumers.setdefault(child, set()).add(parent)
+        return consumers
+
+    def get_tree(self, root = None):
+        '''
+        Returns the calculation trees, as nested dicts, of the calculations of `root` (all the calculations if None)
+        '''
+        children_by_path = dict()
+        for path in sorted(self.path_stats, key = len):
+            children_by_path.setdefault(path[:-1], []).append(path)
+
+        def build_node(path):
+            variable, period = path[-1]
+            stats = self.path_stats[path]
+            return dict(
+                variable = variable,
+                period = str(period),
+                calls = stats[CALLS],
+                cumulative_time = stats[CUMULATIVE_TIME],
+                self_time = stats[SELF_TIME],
+                children = [
+                    build_node(child)
+                    for child in sorted(
+                        children_by_path.get(path, []), key = lambda child: - self.path_stats[child][CUMULATIVE_TIME])
+                    ],
+                )
+
+        if root is None:
+            roots = children_by_path.get((), [])
+        else:
+            # The outermost calculations of root
+            roots = [
+                path for path in self.path_stats
+                if path[-1][0] == root and all(variable != root for variable, _ in path[:-1])
+                ]
+        return [build_node(path) for path in roots]
+
+    def print_tree(self, root = None, max_depth = None, min_time = 0):
+        def print_node(node, depth):
+            print('{}{}@{}: {:.3f} ms cumulative, {:.3f} ms self, {} calls'.format(
+                '  ' * depth, node['variable'], node['period'], node['cumulative_time'] * 1000,
+                node['self_time'] * 1000, node['calls']))
+            if max_depth is None or depth < max_depth:
+                for child in node['children']:
+                    if child['cumulative_time'] >= min_time:
+                        print_node(child, depth + 1)
+
+        for tree in self.get_tree(root):
+            print_node(tree, 0)
+
+    def write_json(self, path, root = None):
+        with open(path, 'w') as json_file:
+            json.dump(dict(variables = self.get_variables_stats(), trees = self.get_tree(root)), json_file, indent = 2)
+
+    def iter_collapsed(self):
+        '''
+        Yields the lines of the collapsed stacks format of the flame graphs, the self times being in microseconds
+        '''
+        for path, stats in self.path_stats.items():
+            microseconds = int(round(stats[SELF_TIME] * 1e6))
+            if microseconds > 0:
+                yield '{} {}'.format(
+                    ';'.join('{}@{}'.format(variable, period) for variable, period in path), microseconds)
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as collapsed_file:
+            for line in self.iter_collapsed():
+                collapsed_file.write(line + '\n')
+
+
+def overlap(period, other_period):
+    if period.unit == ETERNITY or other_period.unit == ETERNITY:
+        return True
+    return period.start <= other_period.stop and other_period.start <= period.stop
+
+
+class ParameterAccessRecorder(TracingParameterNodeAtInstant):
+    '''
+    Parameters at an instant recording the name of every node, scale and value read
+
+    Unlike OpenFisca-Core tracing, the nodes and the tax scales are recorded too, so that a calculation reading its
+    parameters through a node, e.g. to use precompiled tables, depends on all the parameters of the node.
+    '''
+
+    def get_traced_child(self, child, key):
+        node = self.parameter_node_at_instant
+        name = node._name
+        if isinstance(key, str) and not isinstance(node, VectorialParameterNodeAtInstant):
+            name = '.'.join([name, key]) if name else key
+        self.tracer.record_parameter_access(name, node._instant_str, child)
+        if isinstance(child, (ParameterNodeAtInstant, VectorialParameterNodeAtInstant)):
+            return ParameterAccessRecorder(child, self.tracer)
+        return child
+
+
+def profile(simulation, parameters = False):
+    '''
+    Installs a `Profiler` on `simulation` and returns it
+
+    If `parameters` is True, the formulas get parameters recording their accesses in `Profiler.parameters`.
+    Setting `simulation.trace` afterwards replaces the profiler by the tracers of OpenFisca-Core. Raises a ValueError
+    if `simulation` has a `MemoryManager`, which the profiler would replace.
+    '''
+    if isinstance(simulation.tracer, MemoryManager):
+        raise ValueError("The simulation has a MemoryManager, which a Profiler would replace")
+    profiler = Profiler()
+    if parameters:
+        simulation.trace = True
+        simulation.trace_parameters_at_instant = lambda instant: ParameterAccessRecorder(
+            simulation.tax_benefit_system.get_parameters_at_instant(instant), profiler)
+    simulation.tracer = profiler
+    return profiler
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Calculation of a reform reusing the calculations of the baseline it does not affect
+
+    profiler = track_baseline(baseline_simulation)
+    baseline_simulation.calculate('revenu_disponible', 2018)
+    reform_simulation = build_reform_simulation(baseline_simulation, reform)
+    reform_simulation.calculate('revenu_disponible', 2018)  # Only recomputes what the reform affects
+
+The calculations of the baseline are profiled with their parameter accesses. A calculation is affected by the reform
+when its variable is changed by the reform, when it read a changed parameter, or when it used an affected calculation.
+The reform simulation shares the arrays of all the other calculations with the baseline simulation.
+'''
+
+
+from openfisca_core.parameters import ParameterNode, ParameterScale
+
+from openfisca_tunisia.profiler import Profiler, profile
+from openfisca_tunisia.scenarios import clone_simulation
+
+
+def track_baseline(simulation):
+    '''
+    Installs on `simulation` a `Profiler` recording the parameter accesses, and returns it
+
+    The values known before, inputs or calculations, are taken as inputs by `build_reform_simulation`.
+    '''
+    profiler = profile(simulation, parameters = True)
+    profiler.known_calculations = get_known_calculations(simulation)
+    return profiler
+
+
+def get_known_calculations(simulation):
+    return set(
+        (variable, period)
+        for population in simulation.populations.values()
+        for variable, holder in population._holders.items()
+        for period in holder.get_known_periods()
+        )
+
+
+def get_parameters_values(node, values = None):
+    '''
+    Returns the values of the parameters of `node`, by name, as comparable tuples
+    '''
+    def get_values(parameter):
+        return tuple((value.instant_str, value.value) for value in parameter.values_list)
+
+    if values is None:
+        values = dict()
+    for child in node.children.values():
+        if isinstance(child, ParameterNode):
+            get_parameters_values(child, values)
+        elif isinstance(child, ParameterScale):
+            values[child.name] = tuple(
+                tuple((key, get_values(parameter)) for key, parameter in sorted(bracket.children.items()))
+                for bracket in child.brackets
+                )
+        else:
+            values[child.name] = get_values(child)
+    return values
+
+
+def get_changed_parameters(baseline_tax_benefit_system, reform_tax_benefit_system):
+    if reform_tax_benefit_system.parameters is baseline_tax_benefit_system.parameters:
+        return set()
+    baseline_values = get_parameters_values(baseline_tax_benefit_system.parameters)
+    reform_values = get_parameters_values(reform_tax_benefit_system.parameters)
+    return set(
+        name
+        for name in set(baseline_values) | set(reform_values)
+        if baseline_values.get(name) != reform_values.get(name)
+        )
+
+
+def get_changed_variables(baseline_tax_benefit_system, reform_tax_benefit_system):
+    def get_definition(variable):
+        # The variables neutralized in both systems, e.g. by a survey scenario, are different objects
+        if variable is None:
+            return None
+        return (
+            variable.is_neutralized,
+            list(variable.formulas.items()),
+            variable.value_type,
+            variable.default_value,
+            variable.definition_period,
+            variable.entity.key,
+            )
+
+    return set(
+        name
+        for name in set(baseline_tax_benefit_system.variables) | set(reform_tax_benefit_system.variables)
+        if get_definition(baseline_tax_benefit_system.variables.get(name)) !=
+        get_definition(reform_tax_benefit_system.variables.get(name))
+        )
+
+
+def get_affected_calculations(simulation, reform_tax_benefit_system, changed_parameters = None):
+    '''
+    Returns the set of the (variable, period) known in `simulation` which the reform may change
+
+    `changed_parameters`, the names of the parameters changed by the reform, are found by comparing the parameters of
+    the two systems if None.
+    '''
+    profiler = simulation.tracer
+    if not isinstance(profiler, Profiler) or not hasattr(profiler, 'known_calculations'):
+        raise ValueError("The baseline calculations are not tracked: call track_baseline(simulation) first")
+    baseline_tax_benefit_system = simulation.tax_benefit_system
+    if changed_parameters is None:
+        changed_parameters = get_changed_parameters(baseline_tax_benefit_system, reform_tax_benefit_system)
+    changed_variables = get_changed_variables(baseline_tax_benefit_system, reform_tax_benefit_system)
+
+    def reads_changed_parameter(names):
+        # Only the most precise accesses count: reading a node to get one of its values is not reading the node
+        return any(
+            changed_parameter == name or changed_parameter.startswith((name + '.', name + '['))
+            for name in names
+            if not any(other_name.startswith(name + '.') for other_name in names)
+            for changed_parameter in changed_parameters
+            )
+
+    calculations = set(profiler.stats)
+    affected = set(
+        (variable, period)
+        for variable, period in calculations - profiler.known_calculations
+        if variable in changed_variables or reads_changed_parameter(profiler.parameters.get((variable, period), ()))
+        )
+    affected |= profiler.get_calculations_dependents(affected)
+    # Values cached by the formulas without being calculated, e.g. by put_in_cache, have unknown dependencies
+    affected |= get_known_calculations(simulation) - calculations - profiler.known_calculations
+    return affected
+
+
+def build_reform_simulation(simulation, reform_tax_benefit_system, affected = None):
+    '''
+    Returns a simulation of `reform_tax_benefit_system` on the inputs of the baseline `simulation`, sharing the values
+    of the baseline calculations not affected by the reform
+
+    `affected` is given by `get_affected_calculations` if None.
+    '''
+    if affected is None:
+        affected = get_affected_calculations(simulation, reform_tax_benefit_system)
+    reform_simulation = clone_simulation(simulation, affected)
+    reform_simulation.tax_benefit_system = reform_tax_benefit_system
+    for population in reform_simulation.populations.values():
+        for variable, holder in population._holders.items():
+            holder.variable = reform_tax_benefit_system.variables.get(variable, holder.variable)
+    return reform_simulation
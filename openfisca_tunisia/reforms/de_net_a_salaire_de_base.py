@@ -1,36 +1,118 @@
 from __future__ import division
-from openfisca_tunisia.model.base import Reform, Variable, Individu, MONTH, set_input_divide_by_period
-
-
-try:
-    from scipy.optimize import fsolve
-except ImportError:
-    fsolve = None
-
-
-def calculate_net_from(salaire_de_base, individu, period, requested_variable_names):
-    # Work in isolation
-    temp_simulation = individu.simulation.clone()
-    temp_individu = temp_simulation.individu
-
-    # Calculated variable holders might contain undesired cache
-    # (their entity.simulation points to the original simulation above)
-    for name in requested_variable_names:
-        temp_individu.get_holder(name).delete_arrays(period)
-
-    # Clean 'computation_stack', that is used by -core to check for computation cycles.
-    # The variable 'salaire_imposable' might have been called from variable X,
-    # that will be calculated again in our iterations to compute the 'salaire_net_a_payer'
-    # requested as an input variable, hence producing a cycle error
-    temp_simulation.computation_stack = []
 
-    temp_individu.get_holder('salaire_de_base').set_input(period, salaire_de_base)
+import logging
 
-    # Force recomputing of salaire_net_a_payer
-    temp_individu.get_holder('salaire_net_a_payer').delete_arrays()
-    net = temp_individu('salaire_net_a_payer', period)[0]
+from numpy import column_stack, concatenate, maximum as max_, unique, zeros
 
-    return net
+from openfisca_tunisia.model.base import Reform, Variable, Individu, MONTH, set_input_divide_by_period
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import (
+    BAREMES_COTISATIONS_BY_TYPE, TypesRegimeSecuriteSociale, get_bareme)
+from openfisca_tunisia.model.prelevements_obligatoires.impot_revenu.irpp import calcule_impot_revenu_brut
+from openfisca_tunisia.reforms.inversion import PiecewiseLinear, ScratchSimulation, invert
+
+
+log = logging.getLogger(__name__)
+
+
+# Variables between 'salaire_de_base' and 'salaire_net_a_payer' whose formulas are composed analytically
+COMPOSED_VARIABLES = [
+    'assiette_cotisations_sociales',
+    'cotisations_salarie',
+    'irpp_mensuel_salarie',
+    'salaire_imposable',
+    'salaire_net_a_payer',
+    ] + ['{}_salarie'.format(bareme_name) for bareme_name in BAREMES_COTISATIONS_BY_TYPE['salarie']]
+
+
+def is_composable(tax_benefit_system):
+    '''
+    Checks that no reform replaced the formulas composed by `salaire_net_from_assiette`
+    '''
+    base_tax_benefit_system = tax_benefit_system.base_tax_benefit_system
+    return all(
+        tax_benefit_system.get_variable(variable_name) is base_tax_benefit_system.get_variable(variable_name)
+        for variable_name in COMPOSED_VARIABLES
+        )
+
+
+def salaire_imposable_from_assiette(parameters, period, regime, ugtt):
+    '''
+    Piecewise-linear schedule of 'salaire_imposable' as a function of 'assiette_cotisations_sociales'
+    '''
+    baremes_by_regime = parameters(period.start).cotisations_sociales
+    baremes = [
+        bareme
+        for bareme in (
+            get_bareme(baremes_by_regime, regime, 'salarie', bareme_name)
+            for bareme_name in BAREMES_COTISATIONS_BY_TYPE['salarie']
+            )
+        if bareme is not None
+        ]
+    thresholds = [threshold for bareme in baremes for threshold in bareme.thresholds]
+    knots = [-1, 0] + thresholds + [2 * max([0] + thresholds) + 1]
+
+    def salaire_imposable(assiette):
+        return assiette - sum(bareme.calc(assiette) for bareme in baremes) + ugtt
+
+    return PiecewiseLinear.from_function(salaire_imposable, knots)
+
+
+def salaire_net_from_salaire_imposable(parameters, period, deduction_famille_annuelle):
+    '''
+    Piecewise-linear schedule of 'salaire_net_a_payer' as a function of 'salaire_imposable'
+
+    The knots are the points where `calcule_impot_revenu_brut` changes slope or jumps:
+    SMIG thresholds, end of the abatements and preimages of the thresholds of the bareme and of the exoneration.
+    '''
+    parameters_at_instant = parameters(period.start)
+    tspr = parameters_at_instant.impot_revenu.tspr
+    smig_40h_mensuel = parameters_at_instant.cotisations_sociales.gen.smig_40h_mensuel
+    smig_ext = tspr.smig_ext if period.start.year >= 2011 else 0
+    thresholds = list(parameters_at_instant.impot_revenu.bareme.thresholds)
+    if 2014 <= period.start.year <= 2016:
+        thresholds.append(parameters_at_instant.impot_revenu.exoneration.seuil)
+
+    # Monthly abated salary reaching each annual threshold, with or without the SMIG abatement
+    abated = concatenate([zeros(1), (zeros(len(thresholds)) + thresholds + deduction_famille_annuelle) / 12])
+    knots = concatenate([
+        [-1, smig_40h_mensuel, smig_ext],
+        abated / (1 - tspr.abat_sal),
+        (abated + tspr.smig) / (1 - tspr.abat_sal),
+        ])
+    knots = concatenate([knots, [2 * max_(knots.max(), 0) + 1]])
+
+    def salaire_net_a_payer(salaire_imposable):
+        return salaire_imposable + calcule_impot_revenu_brut(
+            salaire_imposable, deduction_famille_annuelle, period, parameters)
+
+    return PiecewiseLinear.from_function(salaire_net_a_payer, knots)
+
+
+def assiette_from_salaire_net(individu, period, parameters, net):
+    '''
+    Inverts analytically the composed payroll schedule, grouping individuals sharing the same schedule
+    '''
+    regime_securite_sociale = individu('regime_securite_sociale', period)
+    ugtt = individu('ugtt', period)
+    deduction_famille_annuelle = individu.foyer_fiscal('deduction_famille', period = period.this_year)
+
+    keys, group = unique(
+        column_stack([regime_securite_sociale, ugtt, deduction_famille_annuelle]),
+        axis = 0,
+        return_inverse = True,
+        )
+    group = group.ravel()
+    regimes = list(TypesRegimeSecuriteSociale)
+    assiette = zeros(len(net))
+    for index, (regime_index, ugtt_value, deduction_value) in enumerate(keys):
+        selection = group == index
+        salaire_net_a_payer = salaire_net_from_salaire_imposable(parameters, period, deduction_value).compose(
+            salaire_imposable_from_assiette(parameters, period, regimes[int(regime_index)], ugtt_value)
+            )
+        assiette[selection] = salaire_net_a_payer.inverse(net[selection])
+
+    log.debug("Composed {} payroll schedule(s) for {} individuals on {}".format(len(keys), len(net), period))
+    return assiette
 
 
 class salaire_de_base(Variable):
@@ -40,33 +122,31 @@ class salaire_de_base(Variable):
     definition_period = MONTH
     set_input = set_input_divide_by_period
 
-    def formula(individu, period):
-        # Use numerical inversion to calculate 'salaire_de_base' from 'salaire_net_a_payer'
+    def formula(individu, period, parameters):
+        # Invert analytically the piecewise-linear schedules leading from 'salaire_de_base' to 'salaire_net_a_payer',
+        # then fall back to the numerical inversion where the composed schedule does not match the simulation
         net = individu.get_holder('salaire_net_a_payer').get_array(period)
-
         if net is None:
             return individu.empty_array()
 
         simulation = individu.simulation
-        simulation.period = period
-
-        # List of variables already calculated.
-        # We will need it to remove their holders, that might contain undesired cache
-        requested_variable_names = [stack_frame['name'] for stack_frame in simulation.tracer.stack]
-
-        def solve_func(net):
-            def innerfunc(essai_salaire_de_base):
-                return calculate_net_from(essai_salaire_de_base, individu, period, requested_variable_names) - net
-            return innerfunc
-
-        salaire_de_base_calcule = \
-            fsolve(
-                solve_func(net),
-                net * 1,  # first guess
-                xtol = 1 / 1000,  # précision au millime
-                )
-
-        return salaire_de_base_calcule
+        if is_composable(simulation.tax_benefit_system):
+            salaire_de_base = assiette_from_salaire_net(individu, period, parameters, net) - individu('primes', period)
+        else:
+            salaire_de_base = net * 1  # first guess
+
+        scratch_simulation = ScratchSimulation(simulation, period, 'salaire_de_base', 'salaire_net_a_payer')
+        inversion = invert(
+            scratch_simulation,
+            net,
+            lower = salaire_de_base,
+            upper = salaire_de_base,
+            tolerance = 1 / 1000,  # précision au millime
+            )
+        log.debug("Inverted salaire_de_base on {} in {} iterations, max residual: {}".format(
+            period, inversion.iterations, inversion.max_residual))
+
+        return inversion.solution
 
 
 class de_net_a_salaire_de_base(Reform):
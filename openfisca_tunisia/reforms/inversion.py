@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+
+import logging
+from collections import namedtuple
+
+from numpy import (
+    abs as abs_, asarray, clip, concatenate, inf, isfinite, logical_not as not_, maximum as max_, nextafter,
+    searchsorted, unique, where, zeros,
+    )
+
+
+log = logging.getLogger(__name__)
+
+
+InversionResult = namedtuple('InversionResult', ['solution', 'iterations', 'max_residual', 'converged'])
+
+
+def isolated_clone(simulation):
+    '''
+    Copy a simulation so that the copy holders do not share their storage with the original ones.
+
+    `Simulation.clone` shares the holders storage between the original and the copy: values computed
+    in the copy would otherwise leak into the original simulation cache.
+    '''
+    clone = simulation.clone()
+    for key, population in clone.populations.items():
+        original_holders = simulation.populations[key]._holders
+        population._holders = {}
+        for variable_name, original_holder in original_holders.items():
+            holder = population.get_holder(variable_name)
+            for period in original_holder.get_known_periods():
+                holder.put_in_cache(original_holder.get_array(period), period)
+    return clone
+
+
+class ScratchSimulation(object):
+    '''
+    Reusable copy of a simulation in which `input_variable` is repeatedly replaced to evaluate `output_variable`
+
+    Only the values computed since the creation of the scratch simulation are dropped between two evaluations,
+    so that everything not depending on the candidate input (household composition, deductions, etc.) is computed
+    once.
+    '''
+
+    def __init__(self, simulation, period, input_variable, output_variable):
+        self.simulation = isolated_clone(simulation)
+        self.period = period
+        self.input_variable = input_variable
+        self.output_variable = output_variable
+        self.evaluations = 0
+
+        for variable_name in (input_variable, output_variable):
+            self.simulation.get_holder(variable_name).delete_arrays(period)
+        self.known_arrays = self.get_known_arrays()
+
+    def get_known_arrays(self):
+        return set(
+            (variable_name, period)
+            for population in self.simulation.populations.values()
+            for variable_name, holder in population._holders.items()
+            for period in holder.get_known_periods()
+            )
+
+    def reset(self):
+        for variable_name, period in self.get_known_arrays() - self.known_arrays:
+            self.simulation.get_holder(variable_name).delete_arrays(period)
+
+    def __call__(self, input_array):
+        self.reset()
+        self.evaluations += 1
+        self.simulation.get_holder(self.input_variable).set_input(self.period, input_array)
+        return self.simulation.calculate(self.output_variable, self.period)
+
+
+class PiecewiseLinear(object):
+    '''
+    Piecewise-linear function known by its values `y` at the sorted knots `x`, linearly extrapolated beyond them
+
+    A jump is represented by two knots one ulp apart.
+    '''
+
+    def __init__(self, x, y):
+        self.x = asarray(x, dtype = float)
+        self.y = asarray(y, dtype = float)
+
+    @classmethod
+    def from_function(cls, function, knots):
+        '''
+        Samples the vectorized `function`, assumed linear between consecutive `knots`
+
+        Both neighbours of each knot are sampled as well, so that discontinuities located on a knot are kept.
+        The extreme knots delimit the segments used for the extrapolation.
+        '''
+        knots = asarray(knots, dtype = float)
+        inner_knots = knots[(knots > knots.min()) & (knots < knots.max())]
+        x = unique(concatenate([knots, nextafter(inner_knots, -inf), nextafter(inner_knots, inf)]))
+        return cls(x, function(x))
+
+    def segment(self, index):
+        index = clip(index, 0, len(self.x) - 2)
+        dx = self.x[index + 1] - self.x[index]
+        dy = self.y[index + 1] - self.y[index]
+        return index, dx, dy
+
+    def __call__(self, x):
+        index, dx, dy = self.segment(searchsorted(self.x, x, side = 'right') - 1)
+        return self.y[index] + (x - self.x[index]) * dy / dx
+
+    def inverse(self, y):
+        '''
+        Returns the smallest abscissa at which the function reaches `y`
+        '''
+        # The running maximum is non-decreasing: the first knot where it reaches y ends the first segment crossing y
+        envelope = max_.accumulate(self.y)
+        index, dx, dy = self.segment(searchsorted(envelope, y, side = 'left') - 1)
+        return where(dy != 0, self.x[index] + (y - self.y[index]) * dx / where(dy != 0, dy, 1), self.x[index])
+
+    def compose(self, inner):
+        '''
+        Returns `self` ∘ `inner`, `inner` being continuous and non-decreasing
+        '''
+        knots = concatenate([inner.x, inner.inverse(self.x)])
+        return PiecewiseLinear.from_function(lambda x: self(inner(x)), knots)
+
+
+def invert(function, target, lower, upper, tolerance = 1 / 100, max_iterations = 100):
+    '''
+    Solve `function(x) = target` element-wise for a non-decreasing vectorized `function`
+
+    The solver starts from the bracket [`lower`, `upper`], widens it where needed, then applies a regula falsi
+    with the Illinois modification, which converges in a few steps on the piecewise-linear payroll schedules.
+    Rows whose residual or bracket width is below `tolerance` are frozen while the others go on iterating.
+    '''
+    target = asarray(target, dtype = float)
+    lower = zeros(len(target)) + lower
+    upper = zeros(len(target)) + upper
+    residual_lower = function(lower) - target
+    residual_upper = residual_lower if (lower == upper).all() else function(upper) - target
+    iterations = 0
+
+    # Widen the bracket until it contains the solution
+    while iterations < max_iterations:
+        too_high = residual_lower > tolerance
+        too_low = residual_upper < - tolerance
+        if not (too_high.any() or too_low.any()):
+            break
+        iterations += 1
+        width = max_(max_(upper - lower, abs_(target) / 4), 1)
+        lower = where(too_high, lower - width, lower)
+        upper = where(too_low, upper + width, upper)
+        if too_high.any():
+            residual_lower = where(too_high, function(lower) - target, residual_lower)
+        if too_low.any():
+            residual_upper = where(too_low, function(upper) - target, residual_upper)
+
+    solution = where(abs_(residual_lower) <= abs_(residual_upper), lower, upper)
+    residual = where(abs_(residual_lower) <= abs_(residual_upper), residual_lower, residual_upper)
+    converged = (abs_(residual) <= tolerance) | ((upper - lower) <= tolerance)
+    last_side = zeros(len(target))
+
+    while not converged.all() and iterations < max_iterations:
+        iterations += 1
+        slope = residual_upper - residual_lower
+        candidate = upper - residual_upper * (upper - lower) / where(slope != 0, slope, 1)
+        inside = isfinite(candidate) & (slope != 0) & (candidate > lower) & (candidate < upper)
+        candidate = where(inside, candidate, (lower + upper) / 2)
+        candidate = where(converged, solution, candidate)
+
+        candidate_residual = function(candidate) - target
+        active = not_(converged)
+        solution = where(active, candidate, solution)
+        residual = where(active, candidate_residual, residual)
+
+        below = active & (candidate_residual < 0)
+        above = active & (candidate_residual >= 0)
+        # Illinois modification: halve the residual of the bound which is kept twice in a row
+        residual_upper = where(below & (last_side == -1), residual_upper / 2, residual_upper)
+        residual_lower = where(above & (last_side == 1), residual_lower / 2, residual_lower)
+        lower = where(below, candidate, lower)
+        residual_lower = where(below, candidate_residual, residual_lower)
+        upper = where(above, candidate, upper)
+        residual_upper = where(above, candidate_residual, residual_upper)
+        last_side = where(below, -1, where(above, 1, last_side))
+
+        converged = converged | (abs_(residual) <= tolerance) | ((upper - lower) <= tolerance)
+
+    result = InversionResult(
+        solution = solution,
+        iterations = iterations,
+        max_residual = abs_(residual).max() if len(residual) else 0,
+        converged = converged,
+        )
+    if not converged.all():
+        log.warning(
+            "Inversion did not converge for {} element(s) after {} iterations (max residual: {})".format(
+                (~converged).sum(), iterations, result.max_residual))
+    return result
+
+
+def invert_variable(population, period, input_variable, output_variable, lower = None, upper = None,
+        tolerance = 1 / 100, max_iterations = 100):
+    '''
+    Compute the values of `input_variable` that yield the `output_variable` values set as inputs for `period`
+
+    Returns None if `output_variable` is not an input of the simulation for `period`.
+    '''
+    target = population.get_holder(output_variable).get_array(period)
+    if target is None:
+        return None
+
+    scratch_simulation = ScratchSimulation(population.simulation, period, input_variable, output_variable)
+    result = invert(
+        scratch_simulation,
+        target,
+        lower = target if lower is None else lower,
+        upper = target if upper is None else upper,
+        tolerance = tolerance,
+        max_iterations = max_iterations,
+        )
+    log.debug("Inverted {} -> {} on {} in {} iterations ({} evaluations), max residual: {}".format(
+        input_variable, output_variable, period, result.iterations, scratch_simulation.evaluations,
+        result.max_residual))
+    return result
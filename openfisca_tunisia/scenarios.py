@@ -2,6 +2,14 @@
 
 import logging
 
+from numpy import arange, argsort, array, asarray, bincount, cumsum, empty, full, isin, repeat
+
+from openfisca_core import periods
+from openfisca_core.data_storage import InMemoryStorage
+from openfisca_core.indexed_enums import Enum
+from openfisca_core.simulations import SimulationBuilder
+
+
 log = logging.getLogger(__name__)
 
 
@@ -51,3 +59,103 @@ def init_single_entity(scenario, axes = None, enfants = None, foyer_fiscal = Non
         dict['axes'] = axes
     scenario.init_from_dict(dict)
     return scenario
+
+
+# Roles of the individuals of the households built by `build_households_simulation`, in the order of the arguments of
+# `init_single_entity`
+PARENT1 = 0
+PARENT2 = 1
+ENFANT = 2
+
+
+def build_households_simulation(tax_benefit_system, period, household, role, individus = None, foyers_fiscaux = None,
+        menages = None):
+    '''
+    Builds a simulation of many households, each one being a foyer fiscal and a menage as in `init_single_entity`
+
+    `household` is the index (from 0 to the number of households - 1) of the household of each individual, and `role`
+    its role in the household: `PARENT1` (declarant principal and personne de référence), `PARENT2` (conjoint) or
+    `ENFANT` (personne à charge and enfant). The members of a household are ordered as the individuals.
+    `individus`, `foyers_fiscaux` and `menages` map variables to their input values for `period`, as arrays by
+    individual or by household, or as scalars shared by all. Enum values may be given by name.
+    The entities are built directly from the arrays, without going through `init_from_dict`.
+    '''
+    household = asarray(household)
+    role = asarray(role)
+    if household.shape != role.shape:
+        raise ValueError("household and role must have one value by individual")
+    households_count = int(household.max()) + 1 if len(household) else 0
+    parents1 = bincount(household[role == PARENT1], minlength = households_count)
+    parents2 = bincount(household[role == PARENT2], minlength = households_count)
+    if (parents1 != 1).any() or (parents2 > 1).any() or not isin(role, [PARENT1, PARENT2, ENFANT]).all():
+        raise ValueError(
+            "Each household from 0 to {} must have one PARENT1, at most one PARENT2 and ENFANT members"
+            .format(households_count - 1))
+
+    # Position of each individual in its household
+    members_count = bincount(household, minlength = households_count)
+    position = empty(len(household), dtype = int)
+    position[argsort(household, kind = 'stable')] = arange(len(household)) - repeat(
+        cumsum(members_count) - members_count, members_count)
+
+    builder = SimulationBuilder()
+    builder.create_entities(tax_benefit_system)
+    person_population = builder.populations[tax_benefit_system.person_entity.key]
+    person_population.ids = arange(len(household))
+    person_population.count = len(household)
+    for entity in tax_benefit_system.group_entities:
+        group_population = builder.populations[entity.key]
+        group_population.ids = arange(households_count)
+        group_population.count = households_count
+        group_population.members_entity_id = household
+        # PARENT1, PARENT2 and ENFANT are the first three flattened roles of both foyer_fiscal and menage. The
+        # `members_role` setter goes through a list of roles, which is slow for millions of individuals.
+        group_population._members_role = array(entity.flattened_roles, dtype = object)[role]
+        group_population.members_position = position
+    simulation = builder.build(tax_benefit_system)
+
+    period = periods.period(period)
+    counts = dict(individu = len(household), foyer_fiscal = households_count, menage = households_count)
+    for entity_key, values_by_variable in [
+            ('individu', individus),
+            ('foyer_fiscal', foyers_fiscaux),
+            ('menage', menages),
+            ]:
+        for variable_name, value in (values_by_variable or {}).items():
+            variable = tax_benefit_system.get_variable(variable_name, check_existence = True)
+            if variable.entity.key != entity_key:
+                raise ValueError("Variable {} is defined for entity {}, not {}".format(
+                    variable_name, variable.entity.key, entity_key))
+            value = asarray(value)
+            if value.ndim == 0:
+                value = full(counts[entity_key], value)
+            if variable.value_type == Enum and value.dtype.kind in 'OSU':
+                value = variable.possible_values.encode(value.astype(str))
+            simulation.set_input(variable_name, period, value)
+    return simulation
+
+
+def clone_simulation(simulation, dropped_calculations = ()):
+    '''
+    Returns a copy of `simulation` sharing its arrays, except the ones of `dropped_calculations`
+
+    Unlike `Simulation.clone`, setting or deleting values of the copy leaves `simulation` untouched.
+    '''
+    new_simulation = simulation.clone()
+    # Installed by `profiler.profile`, bound to the original simulation
+    new_simulation.__dict__.pop('trace_parameters_at_instant', None)
+    for population in new_simulation.populations.values():
+        if population is not new_simulation.persons:
+            # GroupPopulation.clone binds the copy to the original members, and its holders to the original population
+            population.members = new_simulation.persons
+        for variable, holder in population._holders.items():
+            holder.population = population
+            holder.simulation = new_simulation
+            storage = InMemoryStorage(is_eternal = holder._memory_storage.is_eternal)
+            storage._arrays = dict(
+                (period, value)
+                for period, value in holder._memory_storage._arrays.items()
+                if (variable, period) not in dropped_calculations
+                )
+            holder._memory_storage = storage
+    return new_simulation
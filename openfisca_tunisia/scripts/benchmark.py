@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Benchmark the calculations of the model on synthetic populations, and compare the results with a baseline
+
+    python -m openfisca_tunisia.scripts.benchmark run --output benchmark.json
+    python -m openfisca_tunisia.scripts.benchmark run --sizes 1000 100000 --years 2018 --output current.json
+    python -m openfisca_tunisia.scripts.benchmark compare benchmark.json current.json --tolerance 0.1
+
+Each measure runs in a fresh process, so that its peak resident set size is its own. `compare` exits with an error
+when a calculation is slower, or uses more memory, than in the baseline beyond the tolerance.
+'''
+
+
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+from collections import OrderedDict
+from time import perf_counter
+
+
+# Calculations measured: variable, period unit, reform and salary given as input
+BENCHMARKS = OrderedDict([
+    ('revenu_disponible', dict(variable = 'revenu_disponible', unit = 'year')),
+    ('salaire_super_brut', dict(variable = 'salaire_super_brut', unit = 'year')),
+    ('irpp_mensuel_salarie', dict(variable = 'irpp_mensuel_salarie', unit = 'month')),
+    ('irpp_retenu_a_la_source', dict(variable = 'irpp_retenu_a_la_source', unit = 'year')),
+    ('de_net_a_imposable', dict(
+        variable = 'salaire_imposable',
+        unit = 'month',
+        reform = 'openfisca_tunisia.reforms.de_net_a_imposable.de_net_a_imposable',
+        salaire_variable = 'salaire_net_a_payer',
+        )),
+    ('de_net_a_salaire_de_base', dict(
+        variable = 'salaire_de_base',
+        unit = 'month',
+        reform = 'openfisca_tunisia.reforms.de_net_a_salaire_de_base.de_net_a_salaire_de_base',
+        salaire_variable = 'salaire_net_a_payer',
+        )),
+    ])
+SIZES = [1000, 100000, 1000000]
+YEARS = [2011, 2016, 2018]
+# Mean size of the synthetic households, see `build_synthetic_simulation`
+HOUSEHOLD_SIZE = 3.5
+
+
+def get_peak_rss():
+    '''
+    Returns the peak resident set size of the process, in bytes
+    '''
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def measure(benchmark, individuals, year, repeat = 1):
+    '''
+    Returns the time and memory taken by `benchmark` on about `individuals` individuals, the best of `repeat` runs
+    '''
+    from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+    from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+    description = BENCHMARKS[benchmark]
+    tax_benefit_system = TunisiaTaxBenefitSystem()
+    if description.get('reform') is not None:
+        tax_benefit_system = tax_benefit_system.apply_reform(description['reform'])
+    period = str(year) if description['unit'] == 'year' else '{}-01'.format(year)
+    households = max(1, int(round(individuals / HOUSEHOLD_SIZE)))
+
+    build_times = list()
+    times = list()
+    for _ in range(repeat):
+        start = perf_counter()
+        simulation = build_synthetic_simulation(
+            tax_benefit_system, households, period,
+            salaire_variable = description.get('salaire_variable', 'salaire_de_base'),
+            )
+        build_times.append(perf_counter() - start)
+        start = perf_counter()
+        simulation.calculate_add(description['variable'], period)
+        times.append(perf_counter() - start)
+        count = simulation.persons.count
+        del simulation
+
+    return OrderedDict([
+        ('benchmark', benchmark),
+        ('year', year),
+        ('individuals', count),
+        ('households', households),
+        ('build_time', min(build_times)),
+        ('time', min(times)),
+        ('throughput', count / min(times)),
+        ('peak_rss', get_peak_rss()),
+        ])
+
+
+def measure_in_subprocess(benchmark, individuals, year, repeat = 1):
+    output = subprocess.check_output([
+        sys.executable, '-m', 'openfisca_tunisia.scripts.benchmark', 'measure',
+        '--benchmark', benchmark, '--size', str(individuals), '--year', str(year), '--repeat', str(repeat),
+        ])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1], object_pairs_hook = OrderedDict)
+
+
+def get_metadata():
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        import importlib_metadata as metadata
+
+    versions = dict()
+    for distribution in ['OpenFisca-Core', 'OpenFisca-Tunisia', 'numpy']:
+        try:
+            versions[distribution] = metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            versions[distribution] = None
+    return OrderedDict([
+        ('date', datetime.datetime.now().isoformat(timespec = 'seconds')),
+        ('python', platform.python_version()),
+        ('machine', platform.machine()),
+        ('processor', platform.processor()),
+        ('versions', versions),
+        ])
+
+
+def run(benchmarks, sizes, years, repeat = 1, in_subprocess = True):
+    results = list()
+    for benchmark in benchmarks:
+        for individuals in sizes:
+            for year in years:
+                if in_subprocess:
+                    result = measure_in_subprocess(benchmark, individuals, year, repeat)
+                else:
+                    result = measure(benchmark, individuals, year, repeat)
+                print("{benchmark:<26} {year} {individuals:>9} individuals: {time:9.3f} s, "
+                    "{throughput:12.0f} individuals/s, {peak_rss_mb:8.1f} MB".format(
+                        peak_rss_mb = result['peak_rss'] / 2 ** 20, **result))
+                results.append(result)
+    return OrderedDict([('metadata', get_metadata()), ('results', results)])
+
+
+def compare(baseline, current, tolerance = .1, rss_tolerance = .2):
+    '''
+    Returns the comparisons of the measures of `current` with the same measures of `baseline`
+
+    Each comparison holds the ratios of the times and of the peak RSS, and the list of the regressions beyond the
+    tolerances.
+    '''
+    def get_key(result):
+        return (result['benchmark'], result['year'], result['individuals'])
+
+    baseline_by_key = dict((get_key(result), result) for result in baseline['results'])
+    comparisons = list()
+    for result in current['results']:
+        baseline_result = baseline_by_key.get(get_key(result))
+        if baseline_result is None:
+            continue
+        time_ratio = result['time'] / baseline_result['time']
+        rss_ratio = result['peak_rss'] / baseline_result['peak_rss']
+        regressions = list()
+        if time_ratio > 1 + tolerance:
+            regressions.append('time')
+        if rss_ratio > 1 + rss_tolerance:
+            regressions.append('peak_rss')
+        comparisons.append(OrderedDict([
+            ('benchmark', result['benchmark']),
+            ('year', result['year']),
+            ('individuals', result['individuals']),
+            ('time_ratio', time_ratio),
+            ('rss_ratio', rss_ratio),
+            ('regressions', regressions),
+            ]))
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    run_parser = subparsers.add_parser('run', help = "run the benchmarks and save their results as JSON")
+    run_parser.add_argument('--benchmarks', nargs = '+', choices = list(BENCHMARKS), default = list(BENCHMARKS))
+    run_parser.add_argument('--sizes', nargs = '+', type = int, default = SIZES, help = "numbers of individuals")
+    run_parser.add_argument('--years', nargs = '+', type = int, default = YEARS)
+    run_parser.add_argument('--repeat', type = int, default = 3, help = "number of runs, the best one being kept")
+    run_parser.add_argument('--output', required = True, help = "path of the JSON results")
+
+    measure_parser = subparsers.add_parser('measure', help = "run one benchmark and print its result as JSON")
+    measure_parser.add_argument('--benchmark', choices = list(BENCHMARKS), required = True)
+    measure_parser.add_argument('--size', type = int, required = True)
+    measure_parser.add_argument('--year', type = int, required = True)
+    measure_parser.add_argument('--repeat', type = int, default = 1)
+
+    compare_parser = subparsers.add_parser('compare', help = "compare results with a baseline")
+    compare_parser.add_argument('baseline', help = "path of the JSON baseline")
+    compare_parser.add_argument('current', help = "path of the JSON results to check")
+    compare_parser.add_argument('--tolerance', type = float, default = .1, help = "relative slowdown tolerated")
+    compare_parser.add_argument(
+        '--rss-tolerance', type = float, default = .2, help = "relative peak RSS increase tolerated")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        results = run(args.benchmarks, args.sizes, args.years, repeat = args.repeat)
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent = 2)
+    elif args.command == 'measure':
+        print(json.dumps(measure(args.benchmark, args.size, args.year, repeat = args.repeat)))
+    elif args.command == 'compare':
+        with open(args.baseline) as baseline_file, open(args.current) as current_file:
+            comparisons = compare(
+                json.load(baseline_file), json.load(current_file), args.tolerance, args.rss_tolerance)
+        for comparison in comparisons:
+            print("{benchmark:<26} {year} {individuals:>9} individuals: time x{time_ratio:.2f}, "
+                "peak RSS x{rss_ratio:.2f} {flag}".format(
+                    flag = ' '.join('SLOWER' if regression == 'time' else 'BIGGER' for regression in comparison[
+                        'regressions']),
+                    **comparison))
+        return 1 if any(comparison['regressions'] for comparison in comparisons) else 0
+    else:
+        parser.print_help()
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
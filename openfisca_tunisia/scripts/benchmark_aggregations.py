@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Benchmark the aggregations over the members of the menages with the `AggregationIndex`, against OpenFisca-Core
+
+    python -m openfisca_tunisia.scripts.benchmark_aggregations --households 1000000
+'''
+
+
+import argparse
+import sys
+from collections import OrderedDict
+from time import perf_counter
+
+from openfisca_core.populations import GroupPopulation, Population
+
+
+def get_aggregations(simulation, period):
+    '''
+    Returns the aggregations measured, by name, as functions of the class of the group population
+    '''
+    from openfisca_tunisia.entities import Menage
+
+    menage = simulation.menage
+    persons = simulation.persons
+    age = simulation.calculate('age', period)
+    salaire = simulation.calculate('salaire_de_base', period.first_month)
+
+    def has_role(population_class):
+        person_class = Population if population_class is GroupPopulation else type(persons)
+        return person_class.has_role(persons, Menage.ENFANT)
+
+    return OrderedDict([
+        ('has_role', has_role),
+        ('sum', lambda population_class: population_class.sum(menage, salaire)),
+        ('sum_role', lambda population_class: population_class.sum(menage, age, role = Menage.ENFANT)),
+        ('nb_persons_role', lambda population_class: population_class.nb_persons(menage, Menage.ENFANT)),
+        ('max', lambda population_class: population_class.max(menage, age)),
+        ('min_role', lambda population_class: population_class.min(menage, age, role = Menage.ENFANT)),
+        ('value_from_person', lambda population_class: population_class.value_from_person(
+            menage, salaire, Menage.CONJOINT)),
+        ])
+
+
+def run(households, repeat = 3):
+    from openfisca_core import periods
+
+    from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+    from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+    period = periods.period(2018)
+    simulation = build_synthetic_simulation(TunisiaTaxBenefitSystem(), households, period)
+    start = perf_counter()
+    for role in simulation.menage.entity.flattened_roles:
+        simulation.menage.aggregation_index.get_role_mask(role)
+    index_time = perf_counter() - start
+    print("{} individuals, {} menages, index built in {:.3f} s".format(
+        simulation.persons.count, simulation.menage.count, index_time))
+
+    results = list()
+    for name, aggregation in get_aggregations(simulation, period).items():
+        times = dict()
+        for population_class in [GroupPopulation, type(simulation.menage)]:
+            best = None
+            for _ in range(repeat):
+                start = perf_counter()
+                aggregation(population_class)
+                elapsed = perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times[population_class] = best
+        result = OrderedDict([
+            ('aggregation', name),
+            ('core_time', times[GroupPopulation]),
+            ('index_time', times[type(simulation.menage)]),
+            ])
+        print("{aggregation:<20} core {core_time:8.4f} s, index {index_time:8.4f} s, x{speedup:.1f}".format(
+            speedup = result['core_time'] / result['index_time'], **result))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--households', type = int, default = 1000000)
+    parser.add_argument('--repeat', type = int, default = 3, help = "number of runs, the best one being kept")
+    args = parser.parse_args()
+    run(args.households, repeat = args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Measure the construction time of TunisiaTaxBenefitSystem, from the sources and from a snapshot
+
+Each measure is taken in a fresh process, as the short-lived batch workers do, then again for the following instances
+built in the same process, as the tests and the survey scenarios do.
+
+    python -m openfisca_tunisia.scripts.benchmark_startup --runs 5
+'''
+
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+MEASURE_CODE = '''
+import json, sys, time
+from openfisca_tunisia import TunisiaTaxBenefitSystem
+cache_dir = sys.argv[1] or None
+timings = []
+for _ in range({instances}):
+    start = time.perf_counter()
+    tax_benefit_system = TunisiaTaxBenefitSystem(cache_dir = cache_dir)
+    tax_benefit_system.get_parameters_at_instant('2020-01-01').impot_revenu.bareme
+    timings.append(time.perf_counter() - start)
+print(json.dumps(timings))
+'''
+
+
+def measure(cache_dir, instances):
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE_CODE.format(instances = instances), cache_dir or ''],
+        env = None,
+        )
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type = int, default = 5, help = "number of fresh processes per mode")
+    parser.add_argument('--instances', type = int, default = 5, help = "number of instances built per process")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        measure(cache_dir, 1)  # Build the snapshot
+        for mode, mode_cache_dir in [('sources', None), ('snapshot', cache_dir)]:
+            timings = [measure(mode_cache_dir, args.instances) for _ in range(args.runs)]
+            first = sorted(run_timings[0] for run_timings in timings)
+            following = sorted(timing for run_timings in timings for timing in run_timings[1:])
+            print("{:<10} first instance: {:7.1f} ms (median of {} processes), following instances: {}".format(
+                mode,
+                first[len(first) // 2] * 1000,
+                args.runs,
+                "{:7.1f} ms (median)".format(following[len(following) // 2] * 1000) if following else "-",
+                ))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
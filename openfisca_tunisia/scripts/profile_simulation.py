@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Profile the calculation of a variable on synthetic households, by variable and along the calculation tree
+
+    python -m openfisca_tunisia.scripts.profile_simulation --households 100000 --json profile.json \
+        --collapsed profile.folded
+
+The collapsed stacks may be drawn with `flamegraph.pl profile.folded > profile.svg` or loaded in speedscope.
+'''
+
+
+import argparse
+import sys
+from time import perf_counter
+
+from numpy import arange, cumsum, minimum, random, repeat, where
+
+from openfisca_core import periods
+
+from openfisca_tunisia.profiler import profile
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1
+from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+
+def build_synthetic_simulation(tax_benefit_system, households, period, seed = 0, salaire_variable = 'salaire_de_base'):
+    '''
+    Builds a simulation of `households` households of one to six members, the first two being the parents
+
+    70 % of the parents earn a `salaire_variable` for `period`.
+    '''
+    year = periods.period(period).start.year
+    random_state = random.RandomState(seed)
+    sizes = random_state.randint(1, 7, households)
+    household = repeat(arange(households), sizes)
+    position = arange(len(household)) - repeat(cumsum(sizes) - sizes, sizes)
+    role = minimum(position, ENFANT)
+    age = where(
+        role == ENFANT, random_state.randint(0, 25, len(household)), random_state.randint(20, 80, len(household)))
+    individus = dict(
+        date_naissance = (year - age - 1970).astype('datetime64[Y]').astype('datetime64[D]'),
+        regime_securite_sociale = where(role == PARENT1, 'rsna', 'rsa'),
+        )
+    individus[salaire_variable] = where(
+        (role != ENFANT) & (random_state.random_sample(len(household)) < .7),
+        random_state.lognormal(7, .5, len(household)),
+        0,
+        )
+    return build_households_simulation(
+        tax_benefit_system, period = period, household = household, role = role, individus = individus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--households', type = int, default = 10000, help = "number of synthetic households")
+    parser.add_argument('--year', type = int, default = 2018, help = "year of the simulation")
+    parser.add_argument('--variable', default = 'revenu_disponible', help = "variable to calculate")
+    parser.add_argument('--max-depth', type = int, default = 3, help = "depth of the printed calculation tree")
+    parser.add_argument('--top', type = int, default = 20, help = "number of variables printed by self time")
+    parser.add_argument('--json', default = None, help = "path of the JSON export")
+    parser.add_argument('--collapsed', default = None, help = "path of the collapsed stacks export")
+    args = parser.parse_args()
+
+    tax_benefit_system = TunisiaTaxBenefitSystem()
+    simulation = build_synthetic_simulation(tax_benefit_system, args.households, args.year)
+    profiler = profile(simulation)
+    start = perf_counter()
+    simulation.calculate(args.variable, args.year)
+    print("Calculated {} for {} households in {:.3f} s".format(
+        args.variable, args.households, perf_counter() - start))
+
+    print("\n{:<50} {:>10} {:>10} {:>7} {:>12}".format('variable@period', 'self ms', 'cum. ms', 'calls', 'bytes'))
+    for stats in profiler.get_variables_stats()[:args.top]:
+        print("{:<50} {:>10.2f} {:>10.2f} {:>7} {:>12}".format(
+            '{}@{}'.format(stats['variable'], stats['period']), stats['self_time'] * 1000,
+            stats['cumulative_time'] * 1000, stats['calls'], stats['nbytes']))
+    print()
+    profiler.print_tree(args.variable, max_depth = args.max_depth)
+
+    if args.json:
+        profiler.write_json(args.json, root = args.variable)
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Run the YAML tests by batches, each batch being computed in one simulation
+
+The tests sharing their period, reforms, extensions and set of input variables are merged in a single simulation with
+one set of entities by test. Each expected output is computed once for the whole batch and compared test by test.
+The batches are run in a pool of processes.
+
+    python -m openfisca_tunisia.scripts.run_yaml_tests tests/formulas tests/fiches_de_paie tests/non_salaries
+
+The tests with axes or with several individuals described by lists of values are run alone.
+'''
+
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from openfisca_core.errors import SituationParsingError, VariableNotFound
+from openfisca_core.simulations import SimulationBuilder
+from openfisca_core.tools import assert_near
+from openfisca_core.tools.test_runner import build_test
+
+from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+
+log = logging.getLogger(__name__)
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+
+# Tax and benefit systems of the worker process by (reforms, extensions), see `init_worker`
+tax_benefit_system_by_key = dict()
+
+
+def init_worker(cache_dir = None):
+    tax_benefit_system_by_key.clear()
+    tax_benefit_system_by_key[(), ()] = TunisiaTaxBenefitSystem(cache_dir = cache_dir)
+
+
+def get_tax_benefit_system(reforms, extensions):
+    key = (reforms, extensions)
+    if key not in tax_benefit_system_by_key:
+        tax_benefit_system = tax_benefit_system_by_key[(), ()]
+        for reform_path in reforms:
+            tax_benefit_system = tax_benefit_system.apply_reform(reform_path)
+        for extension in extensions:
+            tax_benefit_system = tax_benefit_system.clone()
+            tax_benefit_system.load_extension(extension)
+        tax_benefit_system_by_key[key] = tax_benefit_system
+    return tax_benefit_system_by_key[key]
+
+
+def as_tuple(value):
+    if value is None:
+        return ()
+    return tuple(value) if isinstance(value, list) else (value,)
+
+
+def collect_cases(paths):
+    '''
+    Returns the tests of the YAML files found in `paths`, as dicts with their `file_path`
+    '''
+    file_paths = list()
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in sorted(os.walk(path)):
+                file_paths.extend(
+                    os.path.join(directory, file_name)
+                    for file_name in sorted(file_names)
+                    if os.path.splitext(file_name)[1] in ['.yaml', '.yml']
+                    )
+        else:
+            file_paths.append(path)
+
+    cases = list()
+    for file_path in file_paths:
+        with open(file_path) as yaml_file:
+            tests = yaml.load(yaml_file, Loader = Loader)
+        for test in (tests if isinstance(tests, list) else [tests]):
+            cases.append(dict(test = test, file_path = file_path))
+    return cases
+
+
+def get_entities_input(tax_benefit_system, input_dict):
+    '''
+    Returns `input_dict` with all its entities explicit, as `SimulationBuilder.build_from_dict` would build them
+
+    Returns None if the test cannot be batched, i.e. if it has axes or if it describes several individuals by lists of
+    values.
+    '''
+    input_dict = SimulationBuilder().explicit_singular_entities(tax_benefit_system, input_dict)
+    person_entity = tax_benefit_system.person_entity
+    if not any(key in tax_benefit_system.entities_plural() for key in input_dict):
+        # Only variables: one individual, alone in each group entity
+        if any(isinstance(value, list) for value in input_dict.values()):
+            return None
+        values_by_entity = dict((entity.key, dict()) for entity in tax_benefit_system.entities)
+        for variable_name, value in input_dict.items():
+            variable = tax_benefit_system.get_variable(variable_name, check_existence = True)
+            values_by_entity[variable.entity.key][variable_name] = value
+        input_dict = {person_entity.plural: {'0': values_by_entity[person_entity.key]}}
+        for entity in tax_benefit_system.group_entities:
+            input_dict[entity.plural] = {'0': values_by_entity[entity.key]}
+    if 'axes' in input_dict:
+        return None
+
+    persons = OrderedDict(
+        (str(person_id), values or {})
+        for person_id, values in input_dict[person_entity.plural].items()
+        )
+    entities_input = {person_entity.plural: persons}
+    for entity in tax_benefit_system.group_entities:
+        instances = OrderedDict()
+        allocated = set()
+        for instance_id, instance in (input_dict.get(entity.plural) or {}).items():
+            instance = dict(instance or {})
+            for role in entity.roles:
+                role_key = role.plural or role.key
+                if role_key in instance:
+                    instance[role_key] = [
+                        str(person_id) for person_id in (
+                            instance[role_key] if isinstance(instance[role_key], list) else [instance[role_key]])
+                        ]
+                    allocated.update(instance[role_key])
+            instances[str(instance_id)] = instance
+        # Same as `SimulationBuilder.add_group_entity`: the individuals not allocated are alone in their group entity
+        first_role = entity.roles[0]
+        for person_id in persons:
+            if person_id not in allocated:
+                instances[person_id] = {first_role.plural or first_role.key: [person_id]}
+        entities_input[entity.plural] = instances
+    return entities_input
+
+
+def get_signature(tax_benefit_system, entities_input, default_period):
+    '''
+    Returns the set of the input (variable, period) of a test
+
+    Tests can only be batched if they have the same inputs: a variable given as input for one test of a batch would
+    also be an input, with its default value, of the other tests.
+    '''
+    signature = set()
+    for entity in tax_benefit_system.entities:
+        role_keys = set(role.plural or role.key for role in getattr(entity, 'roles', []))
+        for instance in entities_input[entity.plural].values():
+            for variable_name, value in instance.items():
+                if variable_name in role_keys:
+                    continue
+                if isinstance(value, dict):
+                    signature.update((variable_name, str(period)) for period in value)
+                else:
+                    signature.add((variable_name, default_period))
+    return frozenset(signature)
+
+
+def build_batches(cases):
+    '''
+    Groups the cases in batches that can be computed together, returning lists of cases
+    '''
+    tax_benefit_system = tax_benefit_system_by_key[(), ()]
+    batches = OrderedDict()
+    for index, case in enumerate(cases):
+        test = case['test']
+        reforms = as_tuple(test.get('reforms'))
+        extensions = as_tuple(test.get('extensions'))
+        try:
+            entities_input = get_entities_input(
+                get_tax_benefit_system(reforms, extensions), test.get('input') or {})
+        except Exception:
+            entities_input = None
+        if entities_input is None:
+            key = index
+        else:
+            period = str(test.get('period'))
+            key = (
+                period,
+                reforms,
+                extensions,
+                test.get('max_spiral_loops'),
+                get_signature(tax_benefit_system, entities_input, period),
+                )
+        batches.setdefault(key, []).append(dict(case, entities_input = entities_input))
+    return list(batches.values())
+
+
+def run_batch(cases):
+    '''
+    Runs the `cases` in one simulation, returning for each one its file path, its name and its error message if any
+    '''
+    if len(cases) > 1:
+        try:
+            return run_merged_cases(cases)
+        except (VariableNotFound, SituationParsingError, ValueError, TypeError):
+            log.info("Unable to run the batch of {} tests together, running them one by one".format(len(cases)))
+    return [
+        result
+        for case in cases
+        for result in run_merged_cases([dict(case, entities_input = None)])
+        ]
+
+
+def run_merged_cases(cases):
+    first_test = cases[0]['test']
+    tax_benefit_system = get_tax_benefit_system(
+        as_tuple(first_test.get('reforms')), as_tuple(first_test.get('extensions')))
+    tests = list()
+    errors = list()
+    for case in cases:
+        try:
+            test = build_test(dict(case['test']))
+            if test.output is None:
+                raise ValueError("Missing key 'output' in test '{}'".format(test.name))
+        except Exception as error:
+            test = None
+            errors.append(str(error))
+        else:
+            errors.append(None)
+        tests.append(test)
+
+    valid_cases = [(case, test) for case, test in zip(cases, tests) if test is not None]
+    if not valid_cases:
+        return [(case['file_path'], case['test'].get('name', ''), error) for case, error in zip(cases, errors)]
+
+    builder = SimulationBuilder()
+    builder.set_default_period(valid_cases[0][1].period)
+    if len(valid_cases) == 1 and valid_cases[0][0]['entities_input'] is None:
+        # Run alone, as `openfisca test` would
+        case, test = valid_cases[0]
+        try:
+            simulation = builder.build_from_dict(tax_benefit_system, test.input)
+        except Exception as error:
+            return [(case['file_path'], test.name, str(error))]
+        prefixes = ['']
+    else:
+        prefixes = ['{}:'.format(index) for index in range(len(valid_cases))]
+        merged_input = dict((entity.plural, OrderedDict()) for entity in tax_benefit_system.entities)
+        for prefix, (case, _) in zip(prefixes, valid_cases):
+            for entity in tax_benefit_system.entities:
+                role_keys = set(role.plural or role.key for role in getattr(entity, 'roles', []))
+                for instance_id, instance in case['entities_input'][entity.plural].items():
+                    merged_input[entity.plural][prefix + instance_id] = dict(
+                        (key, [prefix + person_id for person_id in value] if key in role_keys else value)
+                        for key, value in instance.items()
+                        )
+        simulation = builder.build_from_entities(tax_benefit_system, merged_input)
+
+    first_test = valid_cases[0][1]
+    if first_test.max_spiral_loops:
+        simulation.max_spiral_loops = first_test.max_spiral_loops
+
+    # Index of the instances of each entity in the simulation, by test
+    index_by_id_by_entity = dict(
+        (population.entity.key, dict((str(instance_id), index) for index, instance_id in enumerate(population.ids)))
+        for population in simulation.populations.values()
+        )
+    indices_by_entity_by_test = [dict() for _ in valid_cases]
+    for prefix, indices_by_entity in zip(prefixes, indices_by_entity_by_test):
+        for entity_key, index_by_id in index_by_id_by_entity.items():
+            indices_by_entity[entity_key] = [
+                index for instance_id, index in index_by_id.items()
+                if instance_id.startswith(prefix)
+                ]
+
+    values = dict()
+
+    def calculate(variable_name, period):
+        key = (variable_name, str(period))
+        if key not in values:
+            try:
+                values[key] = simulation.calculate(variable_name, period)
+            except Exception as error:
+                values[key] = error
+        if isinstance(values[key], Exception):
+            raise values[key]
+        return values[key]
+
+    results = list()
+    valid_index = 0
+    for case, test, error in zip(cases, tests, errors):
+        if test is None:
+            results.append((case['file_path'], case['test'].get('name', ''), error))
+            continue
+        prefix = prefixes[valid_index]
+        indices_by_entity = indices_by_entity_by_test[valid_index]
+        valid_index += 1
+        try:
+            for variable_name, expected_value, period, instance_id in iter_expected_values(
+                    tax_benefit_system, simulation, test):
+                variable = tax_benefit_system.get_variable(variable_name, check_existence = True)
+                actual_value = calculate(variable_name, period)
+                if instance_id is None:
+                    actual_value = actual_value[indices_by_entity[variable.entity.key]]
+                else:
+                    actual_value = actual_value[index_by_id_by_entity[variable.entity.key][prefix + instance_id]]
+                assert_near(
+                    actual_value,
+                    expected_value,
+                    test.absolute_error_margin[variable_name],
+                    "{}@{}: ".format(variable_name, period),
+                    test.relative_error_margin[variable_name],
+                    )
+        except Exception as error:
+            results.append((case['file_path'], test.name, str(error) or repr(error)))
+        else:
+            results.append((case['file_path'], test.name, None))
+    return results
+
+
+def iter_expected_values(tax_benefit_system, simulation, test):
+    '''
+    Yields (variable, expected value, period, instance id or None) for the outputs of `test`, as `YamlItem.check_output`
+    '''
+    def iter_periods(variable_name, expected_value, instance_id = None):
+        if isinstance(expected_value, dict):
+            for period, expected_value_at_period in expected_value.items():
+                yield variable_name, expected_value_at_period, period, instance_id
+        else:
+            yield variable_name, expected_value, test.period, instance_id
+
+    for key, expected_value in test.output.items():
+        if key in tax_benefit_system.variables:
+            for item in iter_periods(key, expected_value):
+                yield item
+        elif key in simulation.populations:
+            for variable_name, value in expected_value.items():
+                for item in iter_periods(variable_name, value):
+                    yield item
+        elif simulation.get_population(plural = key) is not None:
+            for instance_id, instance_values in expected_value.items():
+                for variable_name, value in instance_values.items():
+                    for item in iter_periods(variable_name, value, str(instance_id)):
+                        yield item
+        else:
+            raise VariableNotFound(key, tax_benefit_system)
+
+
+def run_yaml_tests(paths, max_workers = None, cache_dir = None):
+    '''
+    Runs the YAML tests of `paths` by batches, returning (file path, test name, error message or None) by test
+    '''
+    init_worker(cache_dir)
+    batches = build_batches(collect_cases(paths))
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(batches))
+    if max_workers <= 1:
+        results_by_batch = [run_batch(cases) for cases in batches]
+    else:
+        with ProcessPoolExecutor(max_workers, initializer = init_worker, initargs = (cache_dir,)) as executor:
+            # Heaviest batches first, to balance the workers
+            order = sorted(range(len(batches)), key = lambda index: - len(batches[index]))
+            futures = dict((index, executor.submit(run_batch, batches[index])) for index in order)
+            results_by_batch = [futures[index].result() for index in range(len(batches))]
+    log.info("Ran {} tests in {} batches".format(sum(len(cases) for cases in batches), len(batches)))
+    return [result for results in results_by_batch for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs = '+', help = "YAML test files or directories")
+    parser.add_argument('--max-workers', type = int, default = None, help = "number of processes")
+    parser.add_argument('--cache-dir', default = None, help = "directory of the tax and benefit system snapshot")
+    parser.add_argument('-v', '--verbose', action = 'store_true', help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.INFO if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    start = time.perf_counter()
+    results = run_yaml_tests(args.paths, max_workers = args.max_workers, cache_dir = args.cache_dir)
+    failures = [(file_path, name, error) for file_path, name, error in results if error is not None]
+    for file_path, name, error in failures:
+        print("{}:\n  Test '{}':\n    {}".format(file_path, name, error.replace('\n', '\n    ')))
+    print("{} passed, {} failed in {:.2f}s".format(
+        len(results) - len(failures), len(failures), time.perf_counter() - start))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
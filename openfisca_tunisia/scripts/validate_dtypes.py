@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+'''
+Bound the errors of the compact mode against a float64 reference, on synthetic households
+
+    python -m openfisca_tunisia.scripts.validate_dtypes --households 100000 --tolerance 0.01
+
+Exits with an error when the maximal absolute error of a variable exceeds the tolerance, in dinars.
+'''
+
+
+import argparse
+import json
+import sys
+from collections import OrderedDict
+
+from numpy import abs as abs_, float64, maximum
+
+from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+from openfisca_tunisia.tunisia_taxbenefitsystem import COMPACT_DTYPES, TunisiaTaxBenefitSystem
+
+
+VARIABLES = [
+    'salaire_imposable',
+    'salaire_super_brut',
+    'cotisations_salarie',
+    'irpp_retenu_a_la_source',
+    'irpp',
+    'revenu_disponible',
+    ]
+
+
+def get_holders_nbytes(simulation):
+    return sum(
+        holder.get_memory_usage()['total_nb_bytes']
+        for population in simulation.populations.values()
+        for holder in population._holders.values()
+        )
+
+
+def build_report(households, year, variables = None, seed = 0):
+    '''
+    Returns, for each of `variables` over `year`, the errors of the compact mode against the float64 reference, and
+    the bytes used by all the holders in both modes
+    '''
+    if variables is None:
+        variables = VARIABLES
+    simulation_by_mode = OrderedDict()
+    for mode, dtypes in [('reference', dict(float_dtype = float64)), ('compact', COMPACT_DTYPES)]:
+        tax_benefit_system = TunisiaTaxBenefitSystem()
+        tax_benefit_system.set_dtypes(**dtypes)
+        simulation_by_mode[mode] = build_synthetic_simulation(tax_benefit_system, households, year, seed = seed)
+
+    report = OrderedDict([('variables', list())])
+    for variable in variables:
+        reference = simulation_by_mode['reference'].calculate_add(variable, year)
+        compact = simulation_by_mode['compact'].calculate_add(variable, year)
+        errors = abs_(compact.astype(float64) - reference)
+        reference_sum = reference.sum()
+        report['variables'].append(OrderedDict([
+            ('variable', variable),
+            ('max_abs_error', float(errors.max())),
+            ('max_rel_error', float((errors / maximum(abs_(reference), 1)).max())),
+            ('sum_rel_error', float(abs(compact.sum(dtype = float64) - reference_sum) / max(abs(reference_sum), 1))),
+            ]))
+    report['reference_nbytes'] = get_holders_nbytes(simulation_by_mode['reference'])
+    report['compact_nbytes'] = get_holders_nbytes(simulation_by_mode['compact'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--households', type = int, default = 10000, help = "number of synthetic households")
+    parser.add_argument('--year', type = int, default = 2018, help = "year of the simulations")
+    parser.add_argument('--tolerance', type = float, default = .01, help = "maximal absolute error tolerated")
+    parser.add_argument('--json', default = None, help = "path of the JSON report")
+    args = parser.parse_args()
+
+    report = build_report(args.households, args.year)
+    print("{:<26} {:>14} {:>14} {:>14}".format('variable', 'max abs error', 'max rel error', 'sum rel error'))
+    for row in report['variables']:
+        print("{variable:<26} {max_abs_error:>14.6f} {max_rel_error:>14.2e} {sum_rel_error:>14.2e}".format(**row))
+    print("Holders: {:.1f} MB in float64, {:.1f} MB in compact mode".format(
+        report['reference_nbytes'] / 2 ** 20, report['compact_nbytes'] / 2 ** 20))
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent = 2)
+    return 1 if any(row['max_abs_error'] > args.tolerance for row in report['variables']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Snapshot of a tax and benefit system, to start it without parsing the parameters and executing the model files
+
+The snapshot holds the parameter tree, each top-level subtree being pickled separately so that it is only
+unpickled on first access, and the registry of the variables as (module, class) names. It is valid as long as the
+stat of the model files, of the parameter files and of the OpenFisca-Core parameter classes are unchanged.
+'''
+
+
+import importlib
+import logging
+import os
+import pickle
+import sys
+
+from openfisca_core import parameters as core_parameters
+from openfisca_core.parameters import ParameterNode, ParameterNodeAtInstant
+
+
+log = logging.getLogger(__name__)
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_FORMAT = 1
+
+
+class LazyParameterNode(ParameterNode):
+    '''
+    Parameter node whose children are unpickled on first access
+    '''
+
+    def __init__(self, name, pickled_children, description = None, documentation = None, metadata = None):
+        self.name = name
+        self.description = description
+        self.documentation = documentation
+        self.file_path = None
+        self.metadata = metadata or {}
+        self.child_names = [child_name for child_name, _ in pickled_children]
+        self._pickled_children = dict(pickled_children)
+        self._children = {}
+
+    @property
+    def children(self):
+        for child_name in list(self._pickled_children):
+            self._load_child(child_name)
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self.child_names = list(children)
+        self._pickled_children = {}
+        self._children = children
+
+    def __getattr__(self, name):
+        # Only called when the attribute is missing, i.e. for children not unpickled yet
+        if name not in self.__dict__.get('_pickled_children', {}):
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+        return self._load_child(name)
+
+    def _load_child(self, child_name):
+        child = pickle.loads(self._pickled_children.pop(child_name))
+        self._children[child_name] = child
+        setattr(self, child_name, child)
+        if not self._pickled_children:
+            # Restore the order of the children
+            self._children = dict((name, self._children[name]) for name in self.child_names)
+        return child
+
+    def add_child(self, name, child):
+        super(LazyParameterNode, self).add_child(name, child)
+        self.child_names.append(name)
+
+    def _get_at_instant(self, instant):
+        return LazyParameterNodeAtInstant(self.name, self, instant)
+
+
+class LazyParameterNodeAtInstant(ParameterNodeAtInstant):
+    '''
+    Parameter node at instant whose children are only evaluated on first access
+    '''
+
+    def __init__(self, name, node, instant_str):
+        self._name = name
+        self._instant_str = instant_str
+        self._children = {}
+        self._node = node
+        self._evaluated = set()
+
+    def __getattr__(self, key):
+        node = self.__dict__.get('_node')
+        if node is None or key in self._evaluated or key not in node.child_names:
+            return super(LazyParameterNodeAtInstant, self).__getattr__(key)
+        self._evaluated.add(key)
+        child_at_instant = getattr(node, key)._get_at_instant(self._instant_str)
+        if child_at_instant is None:
+            return super(LazyParameterNodeAtInstant, self).__getattr__(key)
+        self.add_child(key, child_at_instant)
+        return child_at_instant
+
+    def _evaluate_children(self):
+        for child_name in self._node.child_names:
+            if child_name not in self._evaluated:
+                try:
+                    getattr(self, child_name)
+                except AttributeError:
+                    pass
+
+    def __getitem__(self, key):
+        self._evaluate_children()
+        return super(LazyParameterNodeAtInstant, self).__getitem__(key)
+
+    def __iter__(self):
+        self._evaluate_children()
+        return super(LazyParameterNodeAtInstant, self).__iter__()
+
+    def __repr__(self):
+        self._evaluate_children()
+        return super(LazyParameterNodeAtInstant, self).__repr__()
+
+
+def get_sources_stat():
+    '''
+    Returns the (modification time, size) of the files a snapshot depends on, by path
+    '''
+    directories = [
+        (os.path.join(PACKAGE_DIR, 'model'), '.py'),
+        (os.path.join(PACKAGE_DIR, 'parameters'), '.yaml'),
+        (os.path.dirname(os.path.abspath(core_parameters.__file__)), '.py'),
+        ]
+    sources_stat = dict()
+    for directory_path, extension in directories:
+        for directory, _, file_names in os.walk(directory_path):
+            for file_name in file_names:
+                if file_name.endswith(extension):
+                    file_path = os.path.join(directory, file_name)
+                    stat = os.stat(file_path)
+                    sources_stat[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return sources_stat
+
+
+def get_module_name(variable):
+    '''
+    Returns the importable name of the model module defining `variable`
+
+    `TaxBenefitSystem.add_variables_from_file` executes each model file under a name unique to the tax and benefit
+    system, so the module is found back from its file.
+    '''
+    file_path = os.path.abspath(sys.modules[type(variable).__module__].__file__)
+    relative_path = os.path.relpath(os.path.splitext(file_path)[0], os.path.dirname(PACKAGE_DIR))
+    return relative_path.replace(os.sep, '.')
+
+
+def save_snapshot(tax_benefit_system, path):
+    '''
+    Saves the parameters and the variables registry of `tax_benefit_system`, freshly loaded from the sources
+    '''
+    parameters = tax_benefit_system.parameters
+    snapshot = dict(
+        format = SNAPSHOT_FORMAT,
+        python = sys.version_info[:2],
+        sources_stat = get_sources_stat(),
+        variables = [
+            (get_module_name(variable), variable.name)
+            for variable in tax_benefit_system.variables.values()
+            ],
+        parameters = dict(
+            description = parameters.description,
+            documentation = parameters.documentation,
+            metadata = parameters.metadata,
+            pickled_children = [
+                (child_name, pickle.dumps(child, protocol = pickle.HIGHEST_PROTOCOL))
+                for child_name, child in parameters.children.items()
+                ],
+            ),
+        )
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write then rename, so that concurrent workers never read a partial file
+    temporary_path = '{}.{}'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as snapshot_file:
+        pickle.dump(snapshot, snapshot_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(tax_benefit_system, path):
+    '''
+    Loads in `tax_benefit_system` the snapshot saved at `path`
+
+    Returns False, leaving `tax_benefit_system` untouched, if the snapshot is missing, unreadable or stale.
+    '''
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, 'rb') as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+        if (
+                snapshot.get('format') != SNAPSHOT_FORMAT or
+                tuple(snapshot['python']) != sys.version_info[:2] or
+                snapshot['sources_stat'] != get_sources_stat()
+                ):
+            log.info("Snapshot {} is stale".format(path))
+            return False
+        variables_classes = [
+            getattr(importlib.import_module(module_name), variable_name)
+            for module_name, variable_name in snapshot['variables']
+            ]
+    except Exception:
+        log.warning("Unable to load snapshot {}".format(path), exc_info = True)
+        return False
+
+    for variable_class in variables_classes:
+        tax_benefit_system.add_variable(variable_class)
+    # The subtrees were pickled after `preprocess_parameters`
+    tax_benefit_system.parameters = LazyParameterNode('', **snapshot['parameters'])
+    return True
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+
+from openfisca_core import periods
 from openfisca_tunisia import CountryTaxBenefitSystem as TunisiaTaxBenefitSystem
 from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
 
 from openfisca_survey_manager.scenarios import AbstractSurveyScenario
 
+from openfisca_tunisia.survey_scenario import chunks, parallel
+
 survey_variables_filepath = os.path.join(
     os.path.dirname(os.path.abspath(__file__)),
     'data.py'
@@ -22,35 +26,164 @@ class TunisiaSurveyScenario(AbstractSurveyScenario):
         menage = 'role_menage',
         )
 
-    weight_column_name_by_entity = dict(
+    weight_variable_by_entity = weight_column_name_by_entity = dict(
         individu = 'poids',
         foyer_fiscal = 'poids_foyer_fiscal',
         menage = 'poids_menage',
         )
 
     def __init__(self, input_data_frame = None, tax_benefit_system = None,
-            baseline_tax_benefit_system = None, year = None):
+            baseline_tax_benefit_system = None, year = None, input_table = None):
+        '''
+        The input is either a pandas `input_data_frame` or an `input_table`, a pyarrow Table or the path of a Parquet
+        file, with one row by individual.
+        '''
         super(TunisiaSurveyScenario, self).__init__()
-        assert input_data_frame is not None
+        assert (input_data_frame is None) != (input_table is None), "Give either an input_data_frame or an input_table"
         assert year is not None
         self.year = year
         if tax_benefit_system is None:
             tax_benefit_system = TunisiaTaxBenefitSystem()
 
-        tax_benefit_system.add_variables_from_file(survey_variables_filepath)
+        add_survey_variables(tax_benefit_system)
         if baseline_tax_benefit_system:
-            baseline_tax_benefit_system.add_variables_from_file(survey_variables_filepath)
+            add_survey_variables(baseline_tax_benefit_system)
 
         self.set_tax_benefit_systems(
             tax_benefit_system = tax_benefit_system,
             baseline_tax_benefit_system = baseline_tax_benefit_system
             )
 
+        if input_data_frame is not None:
+            columns = input_data_frame.columns
+        else:
+            from openfisca_tunisia.survey_scenario import parquet
+            columns = parquet.get_column_names(input_table)
         self.used_as_input_variables = list(
             set(list(tax_benefit_system.variables.keys())).intersection(
-                set(input_data_frame.columns)
+                set(columns)
                 ))
-        self.init_from_data_frame(input_data_frame = input_data_frame)
-        self.new_simulation()
-        if baseline_tax_benefit_system is not None:
-            self.new_simulation(use_baseline = True)
+        if input_data_frame is not None:
+            self.init_from_data(data = dict(input_data_frame = input_data_frame))
+        else:
+            self.init_from_table(input_table)
+
+    def init_from_table(self, input_table):
+        '''
+        Initializes the simulations from a pyarrow Table or a Parquet file, reading only the columns used as input
+        '''
+        from openfisca_tunisia.survey_scenario import parquet
+
+        self._set_id_variable_by_entity_key()
+        self._set_role_variable_by_entity_key()
+        self._set_used_as_input_variables_by_entity()
+        table = parquet.read_input_table(
+            input_table,
+            columns = (
+                list(self.id_variable_by_entity_key.values()) +
+                list(self.role_variable_by_entity_key.values()) +
+                sorted(self.used_as_input_variables)
+                ),
+            )
+        period = periods.period(self.year)
+        for use_baseline in ([True] if self.baseline_tax_benefit_system is not None else []) + [False]:
+            tax_benefit_system = self.baseline_tax_benefit_system if use_baseline else self.tax_benefit_system
+            self.neutralize_variables(tax_benefit_system)
+            simulation = parquet.init_simulation_from_table(self, tax_benefit_system, table, period)
+            simulation.debug = self.debug
+            simulation.trace = self.trace
+            simulation.opt_out_cache = self.cache_blacklist is not None
+            if use_baseline:
+                self.baseline_simulation = simulation
+            else:
+                self.simulation = simulation
+
+    def share_baseline_calculations(self, variables, period = None):
+        '''
+        Calculates `variables` on the baseline simulation, then replaces the reform simulation by a copy of the
+        baseline one sharing all the calculations the reform does not affect
+
+        See `openfisca_tunisia.reform_delta`.
+        '''
+        from openfisca_tunisia import reform_delta
+
+        assert self.baseline_simulation is not None, "The survey scenario has no baseline"
+        period = periods.period(self.year if period is None else period)
+        reform_delta.track_baseline(self.baseline_simulation)
+        for variable in variables:
+            self.baseline_simulation.calculate_add(variable, period)
+        self.simulation = reform_delta.build_reform_simulation(self.baseline_simulation, self.tax_benefit_system)
+
+    def sweep_parameters(self, variants, variables, period = None):
+        '''
+        Returns the weighted sums of `variables` for each of `variants`, dicts of parameter values by name, applied to
+        the tax and benefit system of the scenario
+
+        To be called before the other calculations of the scenario. See `openfisca_tunisia.parameter_sweep.sweep`.
+        '''
+        from openfisca_tunisia.parameter_sweep import sweep
+
+        return sweep(
+            self.simulation,
+            self.year if period is None else period,
+            variants,
+            variables,
+            weights = self.weight_variable_by_entity,
+            )
+
+    def write_parquet(self, variables, output_dir, period = None, use_baseline = False):
+        '''
+        Writes `variables` in one Parquet file by entity in `output_dir`, see `parquet.build_output_tables`
+        '''
+        from openfisca_tunisia.survey_scenario import parquet
+
+        with parquet.ParquetOutput(output_dir) as output:
+            for entity_key, table in parquet.build_output_tables(
+                    self, variables, period = period, use_baseline = use_baseline).items():
+                output.write(entity_key, table)
+
+    @classmethod
+    def run_by_chunks(cls, input_data_frames, year, variables, output_path, chunk_size = 100000,
+            tax_benefit_system = None, baseline_tax_benefit_system = None, output_format = 'hdf5'):
+        '''
+        Out-of-core alternative to the constructor, running one survey scenario by chunk of whole households
+
+        See `openfisca_tunisia.survey_scenario.chunks.run_by_chunks`.
+        '''
+        return chunks.run_by_chunks(
+            cls,
+            input_data_frames,
+            year,
+            variables,
+            output_path,
+            chunk_size = chunk_size,
+            tax_benefit_system = tax_benefit_system,
+            baseline_tax_benefit_system = baseline_tax_benefit_system,
+            output_format = output_format,
+            )
+
+    @classmethod
+    def run_in_parallel(cls, input_data_frame, year, variables, max_workers = None, shards_by_worker = 4,
+            reform = None, cache_dir = None, output_dir = None):
+        '''
+        Computes `variables` in a pool of processes, one survey scenario by shard of whole households
+
+        See `openfisca_tunisia.survey_scenario.parallel.run_in_parallel`.
+        '''
+        return parallel.run_in_parallel(
+            cls,
+            input_data_frame,
+            year,
+            variables,
+            max_workers = max_workers,
+            shards_by_worker = shards_by_worker,
+            reform = reform,
+            cache_dir = cache_dir,
+            output_dir = output_dir,
+            )
+
+
+def add_survey_variables(tax_benefit_system):
+    # The same tax and benefit system may be used by several scenarios, e.g. one for each chunk of the survey
+    if 'poids' not in tax_benefit_system.variables:
+        tax_benefit_system.add_variables_from_file(survey_variables_filepath)
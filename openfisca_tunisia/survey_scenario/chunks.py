@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+
+import gc
+import logging
+
+import pandas as pd
+from numpy import argsort, bincount, concatenate, cumsum, empty, isin, ones, unique
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from openfisca_core.indexed_enums import EnumArray
+
+
+log = logging.getLogger(__name__)
+
+
+AGGREGATES = ['sum', 'count', 'count_non_zero']
+
+
+def partition_households(id_menage, id_foyer_fiscal, chunk_size):
+    '''
+    Assigns each individual to a chunk of at most `chunk_size` individuals, never splitting a menage or a foyer fiscal
+
+    Menages and foyers fiscaux sharing a member are kept in the same chunk. A group of linked entities larger than
+    `chunk_size` gets a chunk of its own. Chunks are numbered in the order of appearance of their first individual.
+    '''
+    menages, menage_index = unique(id_menage, return_inverse = True)
+    foyers_fiscaux, foyer_fiscal_index = unique(id_foyer_fiscal, return_inverse = True)
+    # Bipartite graph between menages and foyers fiscaux, one edge by individual
+    graph = coo_matrix(
+        (ones(len(menage_index)), (menage_index, len(menages) + foyer_fiscal_index)),
+        shape = (len(menages) + len(foyers_fiscaux),) * 2,
+        )
+    _, labels = connected_components(graph, directed = False)
+    component = labels[menage_index]
+
+    # Renumber the components by order of appearance
+    components, first_individual, component = unique(component, return_index = True, return_inverse = True)
+    rank = empty(len(components), dtype = int)
+    rank[argsort(first_individual, kind = 'stable')] = range(len(components))
+    component = rank[component]
+
+    chunk_by_component = empty(len(components), dtype = int)
+    chunk = 0
+    filled = 0
+    for index, size in enumerate(bincount(component).tolist()):
+        if filled and filled + size > chunk_size:
+            chunk += 1
+            filled = 0
+        chunk_by_component[index] = chunk
+        filled += size
+    return chunk_by_component[component]
+
+
+def iter_chunk_rows(input_data_frame, chunk_size, id_menage = 'id_menage', id_foyer_fiscal = 'id_foyer_fiscal'):
+    '''
+    Yields the positions of the rows of each chunk of `input_data_frame`, see `partition_households`
+    '''
+    chunk = partition_households(
+        input_data_frame[id_menage].values, input_data_frame[id_foyer_fiscal].values, chunk_size)
+    rows = argsort(chunk, kind = 'stable')
+    offsets = concatenate([[0], cumsum(bincount(chunk))])
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        yield rows[start:stop]
+
+
+def iter_chunks(input_data_frames, chunk_size, id_menage = 'id_menage', id_foyer_fiscal = 'id_foyer_fiscal'):
+    '''
+    Yields data frames of at most `chunk_size` individuals holding whole menages and foyers fiscaux
+
+    `input_data_frames` is a data frame or an iterable of data frames (e.g. read by blocks from disk), each block
+    holding whole menages and foyers fiscaux.
+    '''
+    if isinstance(input_data_frames, pd.DataFrame):
+        input_data_frames = [input_data_frames]
+
+    seen_ids = {id_menage: [], id_foyer_fiscal: []}
+    for input_data_frame in input_data_frames:
+        for id_variable, ids in seen_ids.items():
+            block_ids = unique(input_data_frame[id_variable].values)
+            if ids and isin(block_ids, concatenate(ids)).any():
+                raise ValueError(
+                    "Some {} of the input block are already in a previous block: blocks must hold whole entities"
+                    .format(id_variable))
+            ids.append(block_ids)
+
+        for rows in iter_chunk_rows(input_data_frame, chunk_size, id_menage, id_foyer_fiscal):
+            yield input_data_frame.iloc[rows].copy()
+
+
+class HDF5Output(object):
+    '''
+    Appends data frames to the tables of an HDF5 file
+    '''
+
+    def __init__(self, output_path):
+        self.store = pd.HDFStore(output_path, mode = 'w')
+
+    def append(self, key, data_frame):
+        self.store.append(key, data_frame, format = 'table', index = False)
+
+    def put(self, key, data_frame):
+        self.store.put(key, data_frame)
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_by_chunks(survey_scenario_class, input_data_frames, year, variables, output_path, chunk_size = 100000,
+        tax_benefit_system = None, baseline_tax_benefit_system = None, output_format = 'hdf5'):
+    '''
+    Runs the survey chunk by chunk, each chunk in its own survey scenario, so that memory is bounded by `chunk_size`
+
+    The values of `variables` are appended to the HDF5 file `output_path`, in one table by entity (the baseline
+    values in 'baseline/<entity>'), indexed by the input index for individuals and by the id for the other entities.
+    With `output_format = 'parquet'`, `output_path` is a directory holding one Parquet file by table, with one row
+    group by chunk.
+    The weighted sums, counts and non zero counts of `variables` are returned as a data frame (also stored as
+    'aggregates').
+    '''
+    assert output_format in ['hdf5', 'parquet']
+    if output_format == 'parquet':
+        from openfisca_tunisia.survey_scenario.parquet import ParquetOutput
+        output = ParquetOutput(output_path)
+    else:
+        output = HDF5Output(output_path)
+
+    simulations = ['reform', 'baseline'] if baseline_tax_benefit_system is not None else ['reform']
+    aggregates = None
+    with output:
+        for index, input_data_frame in enumerate(iter_chunks(input_data_frames, chunk_size)):
+            log.info("Running chunk {} ({} individuals)".format(index, len(input_data_frame)))
+            survey_scenario = survey_scenario_class(
+                input_data_frame = input_data_frame.reset_index(drop = True),
+                tax_benefit_system = tax_benefit_system,
+                baseline_tax_benefit_system = baseline_tax_benefit_system,
+                year = year,
+                )
+            tax_benefit_system = survey_scenario.tax_benefit_system
+            if baseline_tax_benefit_system is not None:
+                baseline_tax_benefit_system = survey_scenario.baseline_tax_benefit_system
+            chunk_aggregates = dict()
+            for simulation in simulations:
+                data_frame_by_entity, chunk_aggregates[simulation] = compute_chunk(
+                    survey_scenario, input_data_frame, variables, use_baseline = simulation == 'baseline')
+                for entity_key, data_frame in data_frame_by_entity.items():
+                    if len(data_frame.columns):
+                        key = entity_key if simulation == 'reform' else 'baseline/{}'.format(entity_key)
+                        output.append(key, data_frame)
+            chunk_aggregates = pd.concat(chunk_aggregates, axis = 1)
+            aggregates = chunk_aggregates if aggregates is None else aggregates + chunk_aggregates
+            del survey_scenario
+            gc.collect()
+
+        for simulation in simulations:
+            aggregates[simulation, 'mean'] = aggregates[simulation, 'sum'] / aggregates[simulation, 'count']
+        aggregates = aggregates.sort_index(axis = 1)
+        if simulations == ['reform']:
+            aggregates = aggregates['reform']
+        output.put('aggregates', aggregates)
+    return aggregates
+
+
+def compute_chunk(survey_scenario, input_data_frame, variables, use_baseline = False):
+    '''
+    Returns the values of `variables` by entity for one chunk, and their weighted aggregates
+    '''
+    simulation = survey_scenario.baseline_simulation if use_baseline else survey_scenario.simulation
+    tax_benefit_system = simulation.tax_benefit_system
+    period = survey_scenario.year
+    data_frame_by_entity = dict()
+    for entity in tax_benefit_system.entities:
+        if entity.is_person:
+            index = pd.Index(input_data_frame.index)
+        else:
+            id_variable = survey_scenario.id_variable_by_entity_key[entity.key]
+            # Same order as the group entities of the simulation, see `AbstractSurveyScenario.init_entity_structure`
+            index = pd.Index(
+                input_data_frame[id_variable].drop_duplicates().sort_values().values,
+                name = id_variable,
+                )
+        data_frame_by_entity[entity.key] = pd.DataFrame(index = index)
+
+    aggregates = pd.DataFrame(0, index = variables, columns = AGGREGATES, dtype = float)
+    for variable in variables:
+        entity_key = tax_benefit_system.variables[variable].entity.key
+        value = survey_scenario.calculate_variable(variable, period = period, use_baseline = use_baseline)
+        weight = survey_scenario.calculate_variable(
+            survey_scenario.weight_variable_by_entity[entity_key], period = period, use_baseline = use_baseline)
+        if isinstance(value, EnumArray):
+            data_frame_by_entity[entity_key][variable] = value.decode_to_str()
+            aggregates.loc[variable] = [float('nan'), weight.sum(), float('nan')]
+            continue
+        data_frame_by_entity[entity_key][variable] = value
+        value = value.astype(float)
+        aggregates.loc[variable] = [(value * weight).sum(), weight.sum(), (weight * (value != 0)).sum()]
+    return data_frame_by_entity, aggregates
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from numpy import searchsorted, unique
+from numpy.lib.format import open_memmap
+
+from openfisca_core.indexed_enums import Enum, EnumArray
+
+from openfisca_tunisia.survey_scenario.chunks import iter_chunk_rows
+from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+
+log = logging.getLogger(__name__)
+
+
+# Tax and benefit system built once by each worker process, see `init_worker`
+worker_tax_benefit_system = None
+
+
+def build_tax_benefit_system(reform = None, cache_dir = None):
+    tax_benefit_system = TunisiaTaxBenefitSystem(cache_dir = cache_dir)
+    return reform(tax_benefit_system) if reform is not None else tax_benefit_system
+
+
+def init_worker(reform, cache_dir):
+    global worker_tax_benefit_system
+    worker_tax_benefit_system = build_tax_benefit_system(reform, cache_dir)
+
+
+def get_output_path(output_dir, entity_key, variable):
+    return os.path.join(output_dir, '{}.{}.npy'.format(entity_key, variable))
+
+
+def run_shard(survey_scenario_class, input_data_frame, year, variables, output_dir, positions_by_entity):
+    '''
+    Computes `variables` on a shard of whole households, writing them in the memory-mapped output arrays
+
+    Only the number of individuals of the shard is sent back to the parent process.
+    '''
+    survey_scenario = survey_scenario_class(
+        input_data_frame = input_data_frame.reset_index(drop = True),
+        tax_benefit_system = worker_tax_benefit_system,
+        year = year,
+        )
+    tax_benefit_system = survey_scenario.tax_benefit_system
+    for variable in variables:
+        entity_key = tax_benefit_system.variables[variable].entity.key
+        output = open_memmap(get_output_path(output_dir, entity_key, variable), mode = 'r+')
+        output[positions_by_entity[entity_key]] = survey_scenario.calculate_variable(variable, period = year)
+        output.flush()
+        del output
+    return len(input_data_frame)
+
+
+def run_in_parallel(survey_scenario_class, input_data_frame, year, variables, max_workers = None,
+        shards_by_worker = 4, reform = None, cache_dir = None, output_dir = None):
+    '''
+    Computes `variables` on the survey in a pool of processes, each shard holding whole menages and foyers fiscaux
+
+    Each worker builds its tax and benefit system once (applying `reform`, a reform class, if given), using the
+    snapshot stored in `cache_dir` if any. The workers write their results in memory-mapped `.npy` files (kept in
+    `output_dir` if given), which are returned as data frames by entity, in the order of the input rows for
+    individuals and by increasing id for the other entities.
+    '''
+    from openfisca_tunisia.survey_scenario import add_survey_variables
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    tax_benefit_system = build_tax_benefit_system(reform, cache_dir)
+    # Describes the outputs, survey weights included
+    add_survey_variables(tax_benefit_system)
+
+    index_by_entity = dict()
+    for entity in tax_benefit_system.entities:
+        if entity.is_person:
+            index_by_entity[entity.key] = pd.Index(input_data_frame.index)
+        else:
+            id_variable = survey_scenario_class.id_variable_by_entity_key[entity.key]
+            index_by_entity[entity.key] = pd.Index(unique(input_data_frame[id_variable].values), name = id_variable)
+
+    keep_output_dir = output_dir is not None
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp()
+    elif not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    try:
+        for variable in variables:
+            column = tax_benefit_system.variables[variable]
+            open_memmap(
+                get_output_path(output_dir, column.entity.key, variable),
+                mode = 'w+',
+                dtype = column.dtype,
+                shape = (len(index_by_entity[column.entity.key]),),
+                )
+
+        chunk_size = max(1, -(- len(input_data_frame) // (max_workers * shards_by_worker)))
+        with ProcessPoolExecutor(max_workers, initializer = init_worker, initargs = (reform, cache_dir)) as executor:
+            futures = list()
+            for rows in iter_chunk_rows(input_data_frame, chunk_size):
+                shard = input_data_frame.iloc[rows]
+                positions_by_entity = dict(
+                    (
+                        entity_key,
+                        rows if entity_key == tax_benefit_system.person_entity.key else searchsorted(
+                            index.values, unique(shard[index.name].values)),
+                        )
+                    for entity_key, index in index_by_entity.items()
+                    )
+                futures.append(executor.submit(
+                    run_shard, survey_scenario_class, shard, year, variables, output_dir, positions_by_entity))
+            individus = sum(future.result() for future in futures)
+        log.info("Computed {} variables for {} individuals in {} shards".format(
+            len(variables), individus, len(futures)))
+
+        data_frame_by_entity = dict(
+            (entity_key, pd.DataFrame(index = index))
+            for entity_key, index in index_by_entity.items()
+            )
+        for variable in variables:
+            column = tax_benefit_system.variables[variable]
+            values = open_memmap(get_output_path(output_dir, column.entity.key, variable), mode = 'r')
+            if column.value_type == Enum:
+                values = EnumArray(values, column.possible_values).decode_to_str()
+            elif not keep_output_dir:
+                values = values.copy()
+            data_frame_by_entity[column.entity.key][variable] = values
+        return data_frame_by_entity
+    finally:
+        if not keep_output_dir:
+            shutil.rmtree(output_dir)
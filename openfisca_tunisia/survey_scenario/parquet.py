@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+
+'''
+Arrow/Parquet input and output of the survey scenarios
+
+Only the columns used as inputs are read, and they are handed to the holders without copy when the Arrow column is
+a single chunk without null values of the dtype of the variable. Such input arrays are read-only views of the Arrow
+buffers.
+'''
+
+
+import logging
+import os
+
+from numpy import arange, argsort, asarray, flatnonzero, unique
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from openfisca_core import periods
+from openfisca_core.indexed_enums import Enum, EnumArray
+from openfisca_core.simulations import SimulationBuilder
+
+
+log = logging.getLogger(__name__)
+
+
+def get_column_names(input_table):
+    if isinstance(input_table, pa.Table):
+        return input_table.column_names
+    return pq.ParquetFile(input_table).schema_arrow.names
+
+
+def read_input_table(input_table, columns):
+    '''
+    Returns the `columns` of `input_table`, a pyarrow Table or the path of a Parquet file (read memory-mapped)
+    '''
+    if isinstance(input_table, pa.Table):
+        return input_table.select(columns)
+    return pq.read_table(input_table, columns = columns, memory_map = True)
+
+
+def column_to_array(column, variable = None):
+    '''
+    Converts an Arrow column to the values of `variable`, without copy when possible
+    '''
+    if variable is not None and column.null_count:
+        default_value = variable.default_value.name if variable.value_type == Enum else variable.default_value
+        column = pc.fill_null(column, default_value)
+    if column.num_chunks == 1:
+        array = column.chunk(0).to_numpy(zero_copy_only = False)
+    else:
+        array = column.to_numpy()
+    if variable is not None and variable.value_type == Enum and array.dtype.kind in 'OSU':
+        # `Enum.encode` takes the object arrays for arrays of enum items
+        array = variable.possible_values.encode(array.astype(str))
+    return array
+
+
+def init_simulation_from_table(survey_scenario, tax_benefit_system, table, period):
+    '''
+    Builds a simulation of `tax_benefit_system` from an Arrow `table` with one row by individual
+
+    The group entities are sorted by id, and their variables are read on the row of their member of role 0, as in
+    `AbstractSurveyScenario.init_simulation_with_data_frame`.
+    '''
+    builder = SimulationBuilder()
+    builder.create_entities(tax_benefit_system)
+    person_population = builder.populations[tax_benefit_system.person_entity.key]
+    # Same as `SimulationBuilder.declare_person_entity` and `declare_entity`, without going through lists
+    person_population.ids = arange(table.num_rows)
+    person_population.count = table.num_rows
+
+    member_rows_by_entity = dict()
+    for entity in tax_benefit_system.group_entities:
+        ids = column_to_array(table[survey_scenario.id_variable_by_entity_key[entity.key]])
+        roles = column_to_array(table[survey_scenario.role_variable_by_entity_key[entity.key]])
+        group_population = builder.populations[entity.key]
+        group_population.ids = unique(ids)
+        group_population.count = len(group_population.ids)
+        builder.join_with_persons(group_population, ids, roles.astype(int))
+        first_members = flatnonzero(roles == 0)
+        member_rows_by_entity[entity.key] = first_members[argsort(ids[first_members], kind = 'stable')]
+
+    simulation = builder.build(tax_benefit_system)
+    for variable_name in survey_scenario.used_as_input_variables:
+        variable = tax_benefit_system.variables[variable_name]
+        array = column_to_array(table[variable_name], variable)
+        if not variable.entity.is_person:
+            array = array[member_rows_by_entity[variable.entity.key]]
+        simulation.set_input(variable_name, period, array)
+    simulation.period = period
+    return simulation
+
+
+class ParquetOutput(object):
+    '''
+    Writes tables in the Parquet files `<output_dir>/<key>.parquet`, one row group by written table
+    '''
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.writers = dict()
+
+    def get_path(self, key):
+        path = os.path.join(self.output_dir, '{}.parquet'.format(key))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path
+
+    def write(self, key, table):
+        writer = self.writers.get(key)
+        if writer is None:
+            writer = self.writers[key] = pq.ParquetWriter(self.get_path(key), table.schema)
+        writer.write_table(table, row_group_size = max(table.num_rows, 1))
+
+    def append(self, key, data_frame):
+        self.write(key, pa.Table.from_pandas(data_frame))
+
+    def put(self, key, data_frame):
+        data_frame.to_parquet(self.get_path(key))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_output_tables(survey_scenario, variables, period = None, use_baseline = False):
+    '''
+    Returns the values of `variables` as Arrow tables by entity, with the ids of the group entities
+    '''
+    simulation = survey_scenario.baseline_simulation if use_baseline else survey_scenario.simulation
+    tax_benefit_system = simulation.tax_benefit_system
+    if period is None:
+        period = periods.period(survey_scenario.year)
+    arrays_by_entity = dict()
+    for entity in tax_benefit_system.entities:
+        population = simulation.populations[entity.key]
+        arrays_by_entity[entity.key] = dict() if entity.is_person else {
+            survey_scenario.id_variable_by_entity_key[entity.key]: population.ids,
+            }
+    for variable_name in variables:
+        variable = tax_benefit_system.variables[variable_name]
+        value = survey_scenario.calculate_variable(variable_name, period = period, use_baseline = use_baseline)
+        if isinstance(value, EnumArray):
+            value = pa.DictionaryArray.from_arrays(
+                asarray(value, dtype = 'int32'), [item.name for item in variable.possible_values])
+        arrays_by_entity[variable.entity.key][variable_name] = value
+    return dict(
+        (entity_key, pa.table(arrays))
+        for entity_key, arrays in arrays_by_entity.items()
+        if len(arrays) > (0 if entity_key == tax_benefit_system.person_entity.key else 1)
+        )
@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import glob
+import hashlib
 import os
+import sys
 
+from numpy import float32, iinfo, int8
+
+from openfisca_core.indexed_enums import Enum
 from openfisca_core.taxbenefitsystems import TaxBenefitSystem
-from openfisca_tunisia import decompositions, entities, scenarios
+from openfisca_tunisia import decompositions, entities, scenarios, snapshot
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import (
+    BAREMES_COTISATIONS, COTISATIONS_TYPES, BaremesTables, TypesRegimeSecuriteSociale)
+from openfisca_tunisia.populations import TunisiaGroupPopulation, TunisiaPopulation
 
 
+# dtypes of the compact mode, see `TunisiaTaxBenefitSystem.set_dtypes`
+COMPACT_DTYPES = dict(float_dtype = float32, enum_dtype = int8)
 COUNTRY_DIR = os.path.dirname(os.path.abspath(__file__))
 EXTENSIONS_PATH = os.path.join(COUNTRY_DIR, 'extensions')
 EXTENSIONS_DIRECTORIES = glob.glob(os.path.join(EXTENSIONS_PATH, '*/'))
@@ -19,14 +29,108 @@ class TunisiaTaxBenefitSystem(TaxBenefitSystem):
     DEFAULT_DECOMP_FILE = decompositions.DEFAULT_DECOMP_FILE
     REFORMS_DIR = os.path.join(COUNTRY_DIR, 'reformes')
     REV_TYP = None
+    cotisations_sociales_tables = None
 
-    def __init__(self):
+    def __init__(self, cache_dir = None):
+        '''
+        If `cache_dir` (or else the `OPENFISCA_TUNISIA_CACHE_DIR` environment variable) is set, the variables and the
+        parameters are loaded from a snapshot stored there, which is (re)built when missing or stale.
+        '''
         # We initialize our tax and benefit system with the general constructor
         super(TunisiaTaxBenefitSystem, self).__init__(entities.entities)
 
+        if cache_dir is None:
+            cache_dir = os.environ.get('OPENFISCA_TUNISIA_CACHE_DIR')
+        snapshot_path = None
+        if cache_dir is not None:
+            snapshot_path = os.path.join(
+                cache_dir,
+                'tunisia_taxbenefitsystem_py{}{}.pickle'.format(*sys.version_info[:2]),
+                )
+            if snapshot.load_snapshot(self, snapshot_path):
+                return
+
         # We add to our tax and benefit system all the variables
         self.add_variables_from_directory(os.path.join(COUNTRY_DIR, 'model'))
 
         # We add to our tax and benefit system all the legislation parameters defined in the  parameters files
         param_path = os.path.join(COUNTRY_DIR, 'parameters')
         self.load_parameters(param_path)
+
+        if snapshot_path is not None:
+            snapshot.save_snapshot(self, snapshot_path)
+
+    def instantiate_entities(self):
+        '''
+        Returns the populations of the entities, aggregating the members of the group entities with a cached index
+
+        See `populations.TunisiaGroupPopulation`. The reforms, which are not Tunisian systems, use the populations of
+        OpenFisca-Core.
+        '''
+        members = TunisiaPopulation(self.person_entity)
+        populations = {self.person_entity.key: members}
+        for entity in self.group_entities:
+            populations[entity.key] = TunisiaGroupPopulation(entity, members)
+        return populations
+
+    def set_dtypes(self, float_dtype = None, enum_dtype = None):
+        '''
+        Sets the dtype of the arrays of the float variables (float32 by default) and of the enum variables (int16 by
+        default)
+
+        `set_dtypes(**COMPACT_DTYPES)` is the compact mode, `set_dtypes(float_dtype = float64)` the reference of
+        `scripts/validate_dtypes.py`. The reforms of the system share the dtypes of its variables.
+        '''
+        for variable in self.variables.values():
+            if float_dtype is not None and variable.value_type == float:
+                variable.dtype = float_dtype
+            elif enum_dtype is not None and variable.value_type == Enum:
+                assert len(variable.possible_values) <= iinfo(enum_dtype).max + 1, \
+                    "Too many possible values for {} to be stored as {}".format(variable.name, enum_dtype)
+                variable.dtype = enum_dtype
+
+    def compile_cotisations_sociales(self, cache_dir = None):
+        '''
+        Precompiles the cotisations sociales baremes into the dense tables used by `compute_cotisations_sociales`
+
+        If `cache_dir` is given, the tables are stored there, keyed by a hash of the YAML files of
+        `parameters/cotisations_sociales`, so that other processes can load them instead of compiling them again.
+        '''
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(
+                cache_dir,
+                'cotisations_sociales_{}.npz'.format(hash_cotisations_sociales_parameters()),
+                )
+            if os.path.exists(cache_path):
+                self.cotisations_sociales_tables = BaremesTables.load(cache_path, parameters = self.parameters)
+                return self.cotisations_sociales_tables
+
+        self.cotisations_sociales_tables = BaremesTables.compile(self.parameters)
+        if cache_path is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # Write then rename, so that concurrent workers never read a partial file
+            temporary_path = '{}.{}.npz'.format(cache_path[:-len('.npz')], os.getpid())
+            self.cotisations_sociales_tables.save(temporary_path)
+            os.replace(temporary_path, cache_path)
+        return self.cotisations_sociales_tables
+
+
+def hash_cotisations_sociales_parameters():
+    '''
+    Hashes the YAML files of the cotisations sociales parameters, and the layout of the compiled tables
+    '''
+    parameters_path = os.path.join(COUNTRY_DIR, 'parameters', 'cotisations_sociales')
+    digest = hashlib.sha256()
+    for name in [regime.name for regime in TypesRegimeSecuriteSociale] + BAREMES_COTISATIONS + COTISATIONS_TYPES:
+        digest.update(name.encode('utf-8'))
+    for directory, _, file_names in sorted(os.walk(parameters_path)):
+        for file_name in sorted(file_names):
+            if not file_name.endswith('.yaml'):
+                continue
+            file_path = os.path.join(directory, file_name)
+            digest.update(os.path.relpath(file_path, parameters_path).encode('utf-8'))
+            with open(file_path, 'rb') as yaml_file:
+                digest.update(yaml_file.read())
+    return digest.hexdigest()
@@ -21,7 +21,7 @@ doc_lines = __doc__.split('\n')
 
 setup(
     name = 'OpenFisca-Tunisia',
-    version = '0.33.2',
+    version = '0.58.0',
     author = 'OpenFisca Team',
     author_email = 'contact@openfisca.org',
     classifiers = [classifier for classifier in classifiers.split('\n') if classifier],
@@ -48,11 +48,15 @@ setup(
             ],
         survey = [
             'OpenFisca-Survey-Manager >=0.34,<1.0',
-            ]
+            ],
+        parquet = [
+            'OpenFisca-Survey-Manager >=0.34,<1.0',
+            'pyarrow >= 1.0',
+            ],
         ),
     include_package_data = True,  # Will read MANIFEST.in
     install_requires = [
-        'OpenFisca-Core >=34, <36',
+        'OpenFisca-Core >=35.3.2, <36',
         'PyYAML >= 3.10',
         'scipy >= 0.12',
         ],
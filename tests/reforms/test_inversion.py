@@ -0,0 +1,26 @@
+from numpy import array, minimum as min_
+
+from openfisca_tunisia.reforms.inversion import PiecewiseLinear, invert
+
+
+def test_invert_piecewise_linear():
+    def net(brut):
+        return brut - .2 * min_(brut, 1000) - .4 * (brut - min_(brut, 1000))
+
+    target = array([0, 400, 800, 1200])
+    result = invert(net, target, lower = target, upper = target, tolerance = 1e-6)
+
+    assert result.converged.all()
+    assert result.max_residual <= 1e-6
+    assert 0 < result.iterations < 20
+    assert abs(result.solution - array([0, 500, 1000, 1666.6667])).max() < 1e-3
+
+
+def test_piecewise_linear_inverse_returns_smallest_solution():
+    # Net increasing by segments but falling at 100, as when an abatement stops applying
+    schedule = PiecewiseLinear.from_function(
+        lambda brut: brut - 20 * (brut > 100),
+        knots = [0, 100, 200],
+        )
+    assert abs(schedule(array([50, 150])) - array([50, 130])).max() < 1e-9
+    assert abs(schedule.inverse(array([50, 90, 130])) - array([50, 90, 150])).max() < 1e-9
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+
+from openfisca_tunisia.scripts.benchmark import BENCHMARKS, compare, measure
+
+
+def test_measure():
+    for benchmark in BENCHMARKS:
+        result = measure(benchmark, 100, 2018)
+        assert result['individuals'] > 0
+        assert result['time'] > 0
+        assert result['peak_rss'] > 0
+
+
+def test_compare():
+    def build_results(time, peak_rss):
+        return dict(results = [
+            dict(benchmark = 'revenu_disponible', year = 2018, individuals = 1000, time = time, peak_rss = peak_rss),
+            ])
+
+    baseline = build_results(1.0, 100)
+    assert compare(baseline, build_results(1.05, 110))[0]['regressions'] == []
+    assert compare(baseline, build_results(1.2, 130))[0]['regressions'] == ['time', 'peak_rss']
+    assert compare(baseline, dict(results = [])) == []
@@ -0,0 +1,42 @@
+from numpy import arange, array, repeat
+
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import (
+    BAREMES_COTISATIONS, BAREMES_COTISATIONS_BY_TYPE, COTISATIONS_TYPES, TypesRegimeSecuriteSociale,
+    apply_baremes_tables, build_baremes_tables, get_bareme,
+    )
+from openfisca_tunisia import TunisiaTaxBenefitSystem
+from tests.base import tax_benefit_system
+
+
+def test_baremes_tables_match_baremes():
+    baremes_by_regime = tax_benefit_system.parameters('2016-01-01').cotisations_sociales
+    regimes = list(TypesRegimeSecuriteSociale)
+    assiette = array([0, 250, 1000, 4000] * len(regimes), dtype = float)
+    regime_index = repeat(arange(len(regimes)), 4)
+
+    cotisations = apply_baremes_tables(assiette, regime_index, *build_baremes_tables(baremes_by_regime))
+
+    for type_index, cotisation_type in enumerate(COTISATIONS_TYPES):
+        for bareme_index, bareme_name in enumerate(BAREMES_COTISATIONS):
+            for regime in regimes:
+                bareme = get_bareme(baremes_by_regime, regime, cotisation_type, bareme_name)
+                selection = regime_index == regimes.index(regime)
+                expected = (
+                    bareme.calc(assiette[selection])
+                    if bareme is not None and bareme_name in BAREMES_COTISATIONS_BY_TYPE[cotisation_type]
+                    else 0
+                    )
+                assert abs(cotisations[selection, bareme_index, type_index] - expected).max() < 1e-9
+
+
+def test_compiled_baremes_tables(tmpdir):
+    tables = TunisiaTaxBenefitSystem().compile_cotisations_sociales(cache_dir = str(tmpdir))
+    for instant in ['1995-06-01', '2016-01-01', '2021-03-01']:
+        thresholds, rates = build_baremes_tables(tax_benefit_system.parameters(instant).cotisations_sociales)
+        compiled_thresholds, compiled_rates = tables.at(instant)
+        assert (compiled_rates[..., :rates.shape[-1]] == rates).all()
+        assert (compiled_thresholds[..., :thresholds.shape[-1]] == thresholds).all()
+
+    loaded_tables = TunisiaTaxBenefitSystem().compile_cotisations_sociales(cache_dir = str(tmpdir))
+    assert loaded_tables.instants == tables.instants
+    assert (loaded_tables.rates == tables.rates).all()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+
+from numpy import array
+from numpy.testing import assert_allclose
+
+from openfisca_tunisia.decomposition import compute_decomposition, compute_waterfall, load_decomposition
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+def test_load_decomposition():
+    decomposition = load_decomposition(tax_benefit_system)
+    assert load_decomposition(tax_benefit_system) is decomposition
+    assert decomposition.codes[-1] == 'revenu_disponible'
+    assert decomposition.parents[-1] == -1
+    for index, parent in enumerate(decomposition.parents[:-1]):
+        assert index < parent
+        assert decomposition.depths[parent] == decomposition.depths[index] - 1
+
+
+def test_compute_decomposition():
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 1],
+        role = [PARENT1, PARENT2, ENFANT, PARENT1],
+        individus = dict(salaire_de_base = [36000, 15000, 0, 50000], regime_securite_sociale = 'rsna'),
+        )
+    weights = array([2., 3.])
+    decomposition = compute_decomposition(simulation, 2018, weights = weights)
+    values = dict(zip(decomposition['decomposition'].codes, decomposition['values']))
+    totals = dict(zip(decomposition['decomposition'].codes, decomposition['totals']))
+
+    assert_allclose(values['revenu_disponible'], simulation.calculate('revenu_disponible', 2018))
+    assert_allclose(values['cotisations_salarie'], simulation.menage.sum(
+        simulation.calculate_add('cotisations_salarie', 2018)), rtol = 1e-6)
+    # Counted once by foyer fiscal
+    assert_allclose(values['irpp'], simulation.calculate('irpp', 2018))
+    # Nodes without variable
+    assert_allclose(values['salaire_brut'], values['salaire_super_brut'] + values['cotisations_employeur'])
+    assert_allclose(values['sal'], values['salaire_brut'] + values['cotisations_salarie'])
+    assert_allclose(totals['revenu_disponible'], values['revenu_disponible'].dot(weights))
+
+    by_individu = compute_decomposition(simulation, 2018, entity = 'individu')
+    assert by_individu['values'].shape == (len(decomposition['decomposition']), 4)
+    assert_allclose(by_individu['totals'], decomposition['values'].sum(axis = 1), rtol = 1e-6)
+
+
+def test_compute_waterfall():
+    decomposition = compute_waterfall(
+        tax_benefit_system, 2018,
+        axes = [[dict(count = 3, name = 'salaire_de_base', min = 0, max = 30000)]],
+        parent1 = dict(age = 40),
+        )
+    values = dict(zip(decomposition['decomposition'].codes, decomposition['values']))
+    assert_allclose(values['salaire_brut'], [0, 15000, 30000], rtol = 1e-6)
+    assert (values['irpp'][1:] < 0).all()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+
+from numpy import arange, datetime64, int32
+
+from openfisca_tunisia.model.caracteristiques_socio_demographiques.demographie import civil_from_days
+from openfisca_tunisia.scenarios import build_households_simulation, PARENT1
+from tests.base import tax_benefit_system
+
+
+def test_civil_from_days():
+    dates = datetime64('1600-01-01') + arange(0, 800 * 366, 7)
+    year, month, day = civil_from_days(dates.astype(int32))
+    years = dates.astype('datetime64[Y]')
+    months = dates.astype('datetime64[M]')
+    assert (year == years.astype(int) + 1970).all()
+    assert (month == (months - years).astype(int) + 1).all()
+    assert (day == (dates - months).astype(int) + 1).all()
+
+
+def test_age():
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 1, 2, 3],
+        role = [PARENT1] * 4,
+        individus = dict(date_naissance = ['1980-01-01', '1980-01-02', '2016-02-29', '2018-06-15']),
+        )
+    assert list(simulation.calculate('age', 2018)) == [38, 37, 1, -1]
+    assert list(simulation.calculate('age_en_mois', '2018-03')) == [458, 457, 24, -4]
+    assert list(simulation.calculate('age_en_mois', '2019-07')) == [474, 473, 40, 12]
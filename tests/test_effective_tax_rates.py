@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+from numpy import isnan
+from numpy.testing import assert_allclose
+
+from openfisca_tunisia.effective_tax_rates import compute_effective_tax_rates, get_perturbation_rounds
+from openfisca_tunisia.profiler import profile
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+def build_simulation(salaire_de_base):
+    return build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 1],
+        role = [PARENT1, PARENT2, ENFANT, PARENT1],
+        individus = dict(salaire_de_base = salaire_de_base, regime_securite_sociale = 'rsna'),
+        )
+
+
+def test_perturbation_rounds():
+    rounds = get_perturbation_rounds(build_simulation(0))
+    assert [list(selected) for selected in rounds] == [
+        [True, False, False, True],
+        [False, True, False, False],
+        [False, False, True, False],
+        ]
+
+
+def test_effective_tax_rates():
+    salaire_de_base = [36000, 15000, 0, 50000]
+    simulation = build_simulation(salaire_de_base)
+    rates = compute_effective_tax_rates(simulation, 2018, delta = 10)
+    revenu_disponible = simulation.calculate('revenu_disponible', 2018)
+    assert (revenu_disponible == build_simulation(salaire_de_base).calculate('revenu_disponible', 2018)).all()
+
+    # The same rates by simulating again the perturbed households
+    marginal = list()
+    average = list()
+    for index in [0, 3]:
+        perturbed_salaire_de_base = list(salaire_de_base)
+        perturbed_salaire_de_base[index] += 120
+        perturbed = build_simulation(perturbed_salaire_de_base)
+        marginal.append(1 - (perturbed.calculate('revenu_disponible', 2018) - revenu_disponible)[index // 3] / 120)
+        perturbed_salaire_de_base[index] = 0
+        perturbed = build_simulation(perturbed_salaire_de_base)
+        average.append(1 - (revenu_disponible - perturbed.calculate('revenu_disponible', 2018))[index // 3] /
+            salaire_de_base[index])
+
+    assert_allclose(rates['revenu_disponible']['marginal'][[0, 3]], marginal, atol = 1e-3)
+    assert_allclose(rates['revenu_disponible']['average'][[0, 3]], average, atol = 1e-3)
+    assert_allclose(rates['cotisations_salarie']['marginal'], .0918, atol = 1e-3)
+    assert rates['irpp']['marginal'][0] > 0
+    assert isnan(rates['irpp']['average'][2])
+
+
+def test_effective_tax_rates_after_calculations():
+    salaire_de_base = [36000, 15000, 0, 50000]
+    expected = compute_effective_tax_rates(build_simulation(salaire_de_base), 2018)
+
+    simulation = build_simulation(salaire_de_base)
+    simulation.calculate('salaire_imposable', '2018-01')
+    with pytest.raises(ValueError):
+        compute_effective_tax_rates(simulation, 2018)
+
+    simulation = build_simulation(salaire_de_base)
+    profile(simulation)
+    simulation.calculate('salaire_imposable', '2018-01')
+    rates = compute_effective_tax_rates(simulation, 2018)
+    assert_allclose(rates['revenu_disponible']['marginal'], expected['revenu_disponible']['marginal'])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from openfisca_core import periods
+
+from openfisca_tunisia.incremental import track, update_input
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+def build_simulation(salaire_de_base):
+    return build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 1],
+        role = [PARENT1, PARENT2, ENFANT, PARENT1],
+        individus = dict(salaire_de_base = salaire_de_base, regime_securite_sociale = 'rsna'),
+        )
+
+
+def test_update_input():
+    simulation = build_simulation([36000, 15000, 0, 50000])
+    with pytest.raises(ValueError):
+        update_input(simulation, 'salaire_de_base', 2018, [40000, 15000, 0, 50000])
+
+    track(simulation)
+    simulation.calculate('revenu_disponible', 2018)
+    age = simulation.calculate('age', 2018)
+    year = periods.period(2018)
+    removed = update_input(simulation, 'salaire_de_base', 2018, [40000, 15000, 0, 50000])
+    assert ('revenu_disponible', year) in removed
+    assert ('salaire_imposable', year.first_month) in removed
+    assert ('age', year) not in removed
+    assert simulation.calculate('age', 2018) is age
+
+    expected = build_simulation([40000, 15000, 0, 50000]).calculate('revenu_disponible', 2018)
+    assert (simulation.calculate('revenu_disponible', 2018) == expected).all()
+    assert update_input(simulation, 'salaire_de_base', '2018-01', simulation.calculate('salaire_de_base', '2018-01')) \
+        == set()
+
+
+def test_update_input_withholdings():
+    simulation = build_simulation([36000, 15000, 0, 50000])
+    track(simulation)
+    simulation.calculate('irpp_retenu_a_la_source', 2018)
+    simulation.calculate('irpp_mensuel_salarie', '2018-03')
+    update_input(simulation, 'salaire_de_base', 2018, [90000, 15000, 0, 120000])
+
+    expected = build_simulation([90000, 15000, 0, 120000])
+    for variable, period in [('irpp_retenu_a_la_source', 2018), ('irpp_mensuel_salarie', '2018-03')]:
+        assert (simulation.calculate(variable, period) == expected.calculate(variable, period)).all()
+    assert (simulation.calculate('irpp_retenu_a_la_source', 2018) !=
+        build_simulation([36000, 15000, 0, 50000]).calculate('irpp_retenu_a_la_source', 2018)).any()
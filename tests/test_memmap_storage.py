@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+
+import numpy
+
+from openfisca_tunisia.memmap_storage import open_simulation, use_memmap_storage
+from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+from tests.base import tax_benefit_system
+
+
+VARIABLES = ['revenu_disponible', 'irpp', 'salaire_super_brut']
+
+
+def calculate(simulation):
+    return [simulation.calculate_add(variable, 2018) for variable in VARIABLES] + [
+        simulation.calculate('regime_securite_sociale', 2018)]
+
+
+def build_simulation():
+    return build_synthetic_simulation(tax_benefit_system, 100, 2018)
+
+
+def test_memmap_storage(tmpdir):
+    directory = str(tmpdir.join('run'))
+    reference = calculate(build_simulation())
+
+    simulation = build_simulation()
+    use_memmap_storage(simulation, directory)
+    for value, reference_value in zip(calculate(simulation), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    assert os.path.exists(os.path.join(directory, '2018-01', 'salaire_de_base.npy'))
+    assert os.path.exists(os.path.join(directory, '2018', 'revenu_disponible.npy'))
+    assert isinstance(simulation.get_holder('cotisations_salarie').get_array('2018-01'), numpy.memmap)
+
+    simulation.get_holder('revenu_disponible').delete_arrays('2018')
+    assert not os.path.exists(os.path.join(directory, '2018', 'revenu_disponible.npy'))
+    simulation.calculate('revenu_disponible', 2018)
+
+    reopened = open_simulation(tax_benefit_system, directory)
+    assert (reopened.get_holder('irpp').get_array('2018') is not None)
+    for value, reference_value in zip(calculate(reopened), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    assert (reopened.persons.has_role(reopened.menage.entity.PERSONNE_DE_REFERENCE) ==
+        simulation.persons.has_role(simulation.menage.entity.PERSONNE_DE_REFERENCE)).all()
+    assert (reopened.menage.members_entity_id == simulation.menage.members_entity_id).all()
+
+    # The files of a reopened run are left untouched
+    reopened.get_holder('revenu_disponible').delete_arrays('2018')
+    assert os.path.exists(os.path.join(directory, '2018', 'revenu_disponible.npy'))
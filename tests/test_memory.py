@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+
+import numpy
+import pytest
+
+from openfisca_tunisia.incremental import track
+from openfisca_tunisia.memory import manage_memory
+from openfisca_tunisia.profiler import profile
+from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+from tests.base import tax_benefit_system
+
+
+VARIABLES = ['revenu_disponible', 'irpp', 'salaire_super_brut']
+
+
+def calculate(simulation):
+    return [simulation.calculate_add(variable, 2018) for variable in VARIABLES]
+
+
+def build_simulation():
+    return build_synthetic_simulation(tax_benefit_system, 100, 2018)
+
+
+def test_budget():
+    reference = calculate(build_simulation())
+
+    simulation = build_simulation()
+    manager = manage_memory(simulation, budget = 20000, outputs = VARIABLES)
+    for value, reference_value in zip(calculate(simulation), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    assert manager.nbytes <= 20000
+    assert 20000 < manager.peak_nbytes
+    stats = dict((variable_stats['variable'], variable_stats) for variable_stats in manager.get_variables_stats())
+    assert stats['cotisations_salarie']['evictions'] > 0
+    assert all(variable not in stats for variable in VARIABLES + ['salaire_de_base'])
+    assert sum(variable_stats['nbytes'] for variable_stats in stats.values()) == manager.nbytes
+    # The cotisations calculated again after their eviction leave nothing in the cache of the shared kernel
+    formula = tax_benefit_system.get_variable('retraite_salarie').get_formula('2018-01')
+    assert not any(formula.__globals__['cotisations_sociales_by_population'].get(simulation.persons, dict()).values())
+
+
+def test_last_consumer():
+    sample = build_simulation()
+    profiler = profile(sample)
+    reference = calculate(sample)
+
+    simulation = build_simulation()
+    manager = manage_memory(simulation, policy = 'last_consumer', outputs = VARIABLES,
+        consumers = profiler.get_consumers())
+    for value, reference_value in zip(calculate(simulation), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    assert manager.nbytes == 0
+    assert manager.peak_nbytes > 0
+
+    with pytest.raises(ValueError):
+        manage_memory(simulation, policy = 'last_consumer')
+
+
+def test_spill(tmpdir):
+    reference = calculate(build_simulation())
+
+    simulation = build_simulation()
+    manager = manage_memory(simulation, budget = 0, outputs = VARIABLES, spill_dir = str(tmpdir))
+    for value, reference_value in zip(calculate(simulation), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    assert manager.nbytes == 0
+    assert os.listdir(manager.spill_dir)
+    assert isinstance(simulation.get_holder('cotisations_salarie').get_array('2018-01'), numpy.memmap)
+    # The spilled values are not calculated again
+    for value, reference_value in zip(calculate(simulation), reference):
+        numpy.testing.assert_array_equal(value, reference_value)
+    manager.close()
+
+
+def test_tracer_conflicts():
+    simulation = build_simulation()
+    track(simulation)
+    with pytest.raises(ValueError):
+        manage_memory(simulation, budget = 20000)
+
+    simulation = build_simulation()
+    manage_memory(simulation, budget = 20000)
+    with pytest.raises(ValueError):
+        track(simulation)
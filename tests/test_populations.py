@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+
+import numpy
+from numpy.testing import assert_array_equal
+
+from openfisca_core.populations import GroupPopulation, Population
+
+from openfisca_tunisia.entities import FoyerFiscal, Menage
+from openfisca_tunisia.populations import TunisiaGroupPopulation
+from openfisca_tunisia.scenarios import clone_simulation
+from openfisca_tunisia.scripts.profile_simulation import build_synthetic_simulation
+from tests.base import tax_benefit_system
+
+
+def test_aggregations():
+    simulation = build_synthetic_simulation(tax_benefit_system, 200, 2018)
+    assert isinstance(simulation.menage, TunisiaGroupPopulation)
+    age = simulation.calculate('age', 2018)
+    persons = simulation.persons
+    for group, roles in [
+            (simulation.menage, [None, Menage.PERSONNE_DE_REFERENCE, Menage.ENFANT]),
+            (simulation.foyer_fiscal, [None, FoyerFiscal.DECLARANT, FoyerFiscal.PERSONNE_A_CHARGE]),
+            ]:
+        for role in roles:
+            if role is not None:
+                assert_array_equal(persons.has_role(role), Population.has_role(persons, role))
+                assert_array_equal(group.nb_persons(role), GroupPopulation.nb_persons(group, role))
+                total = group.sum(age)
+                assert_array_equal(group.project(total, role), GroupPopulation.project(group, total, role))
+            assert_array_equal(group.sum(age, role), GroupPopulation.sum(group, age, role))
+            assert_array_equal(group.max(age, role), GroupPopulation.max(group, age, role))
+            assert_array_equal(group.min(age, role), GroupPopulation.min(group, age, role))
+            assert_array_equal(group.all(age > 10, role), GroupPopulation.all(group, age > 10, role))
+    for role in [Menage.PERSONNE_DE_REFERENCE, Menage.CONJOINT]:
+        assert_array_equal(
+            simulation.menage.value_from_person(age, role),
+            GroupPopulation.value_from_person(simulation.menage, age, role),
+            )
+    regime = simulation.calculate('regime_securite_sociale', 2018)
+    assert_array_equal(
+        simulation.foyer_fiscal.declarant_principal('regime_securite_sociale', 2018).decode_to_str(),
+        GroupPopulation.value_from_person(simulation.foyer_fiscal, regime, FoyerFiscal.DECLARANT_PRINCIPAL)
+        .decode_to_str(),
+        )
+
+
+def test_index_invalidation():
+    simulation = build_synthetic_simulation(tax_benefit_system, 20, 2018)
+    menage = simulation.menage
+    index = menage.aggregation_index
+    assert menage.aggregation_index is index
+    assert clone_simulation(simulation).menage.aggregation_index is index
+
+    # Each individu alone in its menage
+    menage.count = simulation.persons.count
+    menage.members_entity_id = numpy.arange(simulation.persons.count)
+    assert menage.aggregation_index is not index
+    assert (menage.nb_persons() == 1).all()
+
+
+def test_benchmark_aggregations():
+    from openfisca_tunisia.scripts.benchmark_aggregations import run
+    results = run(50, repeat = 1)
+    assert [result['aggregation'] for result in results] == [
+        'has_role', 'sum', 'sum_role', 'nb_persons_role', 'max', 'min_role', 'value_from_person']
@@ -1,5 +1,7 @@
+from numpy.testing import assert_allclose
+
 from openfisca_tunisia.model.base import *
-from openfisca_tunisia.scenarios import init_single_entity
+from openfisca_tunisia.scenarios import build_households_simulation, init_single_entity, ENFANT, PARENT1, PARENT2
 from tests import base
 
 import datetime
@@ -40,5 +42,46 @@ def test_contribution_frais_creche():
     assert contribution_frais_creche != 0
 
 
+def test_prestations_familiales_by_menage():
+    simulation = build_households_simulation(
+        base.tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 0, 0, 0, 1, 1, 2],
+        role = [PARENT1, PARENT2, ENFANT, ENFANT, ENFANT, ENFANT, PARENT1, ENFANT, PARENT1],
+        individus = dict(
+            salaire_de_base = [3000, 0, 0, 0, 0, 0, 500, 0, 0],
+            date_naissance = [
+                '1980-01-01', '1980-01-01', '2005-01-01', '2010-01-01', '2012-01-01', '2017-06-01',
+                '1990-01-01', '2016-12-01', '1970-01-01',
+                ],
+            ),
+        )
+    P = base.tax_benefit_system.parameters(2018).prestations_familiales
+    salaire_imposable = simulation.calculate_add('salaire_imposable', 2018)
+
+    assert (simulation.calculate('af_nbenf', 2018) == [3, 1, 0]).all()
+    assert (simulation.calculate('salaire_unique', 2018) == [True, True, False]).all()
+    # The quarterly base is capped for the first menage
+    assert salaire_imposable[0] / 4 > P.af.plaf_trim
+    assert_allclose(simulation.calculate('af', 2018), [
+        4 * sum(round(P.af.plaf_trim * taux, 2) for taux in [P.af.taux.enf1, P.af.taux.enf2, P.af.taux.enf3]),
+        4 * round(salaire_imposable[6] / 4 * P.af.taux.enf1, 2),
+        0,
+        ], rtol = 1e-6)
+    assert_allclose(simulation.calculate('majoration_salaire_unique', 2018), [
+        4 * (P.salaire_unique.enf1 + P.salaire_unique.enf2 + P.salaire_unique.enf3),
+        4 * P.salaire_unique.enf1,
+        0,
+        ], rtol = 1e-6)
+    # The youngest members are 6 and 12 months old in December 2017
+    assert P.creche.age_min <= 6 <= P.creche.age_max
+    assert_allclose(simulation.calculate('contribution_frais_creche', 2018), [
+        P.creche.montant * min(P.creche.duree, 12 - 6),
+        0,
+        0,
+        ])
+
+
 if __name__ == '__main__':
     test_contribution_frais_creche()
+    test_prestations_familiales_by_menage()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+
+from openfisca_tunisia.profiler import profile
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+def test_profiler(tmpdir):
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 1],
+        role = [PARENT1, PARENT2, ENFANT, PARENT1],
+        individus = dict(salaire_de_base = [1000, 500, 0, 2000], regime_securite_sociale = 'rsna'),
+        )
+    profiler = profile(simulation)
+    revenu_disponible = simulation.calculate('revenu_disponible', 2018)
+    assert simulation.calculate('revenu_disponible', 2018) is revenu_disponible
+
+    stats_by_variable = dict(
+        ((stats['variable'], stats['period']), stats)
+        for stats in profiler.get_variables_stats()
+        )
+    stats = stats_by_variable['revenu_disponible', '2018']
+    assert stats['calls'] == 2
+    assert stats['size'] == 2
+    assert stats['nbytes'] == revenu_disponible.nbytes
+    assert 0 <= stats['self_time'] <= stats['cumulative_time']
+    assert ('salaire_imposable', '2018-01') in stats_by_variable
+
+    tree, = profiler.get_tree('revenu_disponible')
+    assert tree['cumulative_time'] >= sum(child['cumulative_time'] for child in tree['children'])
+    assert tree['children'][0]['variable'] == 'revenu_disponible_individuel'
+
+    json_path = str(tmpdir.join('profile.json'))
+    profiler.write_json(json_path, root = 'revenu_disponible')
+    with open(json_path) as json_file:
+        assert json.load(json_file)['trees'][0]['variable'] == 'revenu_disponible'
+
+    collapsed = list(profiler.iter_collapsed())
+    assert all(line.startswith('revenu_disponible@2018') for line in collapsed)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in collapsed)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+
+from numpy import array
+
+from openfisca_tunisia.model.ranks import get_members_order, rank_members, top_k
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+def build_simulation():
+    return build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 0, 0, 1, 1, 2],
+        role = [PARENT1, PARENT2, ENFANT, ENFANT, ENFANT, PARENT1, ENFANT, PARENT1],
+        individus = dict(age = [40, 38, 5, 12, 5, 30, 2, 60]),
+        )
+
+
+def test_rank_members():
+    simulation = build_simulation()
+    enfant = array([False, False, True, True, True, False, True, False])
+    for group in [simulation.menage, simulation.foyer_fiscal]:
+        # The twins keep the order of the members
+        assert list(rank_members(group, 'age', 2018, eligible = enfant)) == [0, 0, 2, 1, 3, 0, 1, 0]
+        assert list(rank_members(group, 'age', 2018)) == [1, 2, 4, 3, 5, 1, 2, 1]
+        assert list(rank_members(group, 'age', 2018, eligible = enfant, descending = False)) == \
+            [0, 0, 1, 3, 2, 0, 1, 0]
+
+    age = simulation.calculate('age', 2018)
+    rang = rank_members(simulation.menage, 'age', 2018, eligible = enfant)
+    assert top_k(simulation.menage, age, rang, 2, default = -1).tolist() == [[12, 5], [2, -1], [-1, -1]]
+
+
+def test_members_order_cache():
+    simulation = build_simulation()
+    order, first = get_members_order(simulation.menage, 'age', 2018)
+    assert list(first) == [0, 5, 7]
+    assert get_members_order(simulation.menage, 'age', 2018)[0] is order
+
+    simulation.get_holder('age').delete_arrays()
+    simulation.set_input('age', 2018, [40, 38, 5, 12, 5, 30, 2, 70])
+    assert get_members_order(simulation.menage, 'age', 2018)[0] is not order
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+
+from numpy import float64
+
+from openfisca_core import periods
+from openfisca_core.reforms import Reform
+
+from openfisca_tunisia.parameter_sweep import build_variant, sweep
+from openfisca_tunisia.reform_delta import build_reform_simulation, get_changed_parameters, track_baseline
+from openfisca_tunisia.scenarios import build_households_simulation, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+class hausse_bareme(Reform):
+    def apply(self):
+        def modify_parameters(parameters):
+            for bracket in parameters.impot_revenu.bareme.brackets:
+                bracket.rate.update(
+                    start = periods.instant('2010-01-01'), value = (bracket.rate.values_list[0].value or 0) + .02)
+            return parameters
+
+        self.modify_parameters(modifier_function = modify_parameters)
+
+
+def build_simulation(tax_benefit_system):
+    return build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 0, 0, 1],
+        role = [PARENT1, PARENT2, ENFANT, PARENT1],
+        individus = dict(
+            date_naissance = ['1980-01-01', '1982-01-01', '2010-01-01', '1975-01-01'],
+            salaire_de_base = [36000, 15000, 0, 50000],
+            regime_securite_sociale = 'rsna',
+            ),
+        )
+
+
+def test_build_reform_simulation():
+    reform = hausse_bareme(tax_benefit_system)
+    assert get_changed_parameters(tax_benefit_system, reform) == set(['impot_revenu.bareme'])
+
+    simulation = build_simulation(tax_benefit_system)
+    track_baseline(simulation)
+    revenu_disponible = simulation.calculate('revenu_disponible', 2018)
+    reform_simulation = build_reform_simulation(simulation, reform)
+
+    assert (reform_simulation.calculate('revenu_disponible', 2018) ==
+        build_simulation(reform).calculate('revenu_disponible', 2018)).all()
+    assert (reform_simulation.calculate('revenu_disponible', 2018) < revenu_disponible).any()
+    assert simulation.calculate('revenu_disponible', 2018) is revenu_disponible
+    assert reform_simulation.calculate('salaire_imposable', '2018-01') is \
+        simulation.calculate('salaire_imposable', '2018-01')
+
+
+def test_irpp_depends_on_the_bareme():
+    reform = hausse_bareme(tax_benefit_system)
+    simulation = build_simulation(tax_benefit_system)
+    track_baseline(simulation)
+    # The withholdings of the months are computed at once by irpp_retenu_a_la_source
+    irpp_retenu_a_la_source = simulation.calculate('irpp_retenu_a_la_source', 2018)
+    irpp_mensuel_salarie = simulation.calculate('irpp_mensuel_salarie', '2018-03')
+    reform_simulation = build_reform_simulation(simulation, reform)
+    full_reform_simulation = build_simulation(reform)
+
+    assert (reform_simulation.calculate('irpp_retenu_a_la_source', 2018) ==
+        full_reform_simulation.calculate('irpp_retenu_a_la_source', 2018)).all()
+    assert (reform_simulation.calculate('irpp_retenu_a_la_source', 2018) < irpp_retenu_a_la_source).any()
+    assert (reform_simulation.calculate('irpp_mensuel_salarie', '2018-03') ==
+        full_reform_simulation.calculate('irpp_mensuel_salarie', '2018-03')).all()
+    assert (reform_simulation.calculate('irpp_mensuel_salarie', '2018-03') < irpp_mensuel_salarie).any()
+
+
+def test_sweep_irpp_retenu_a_la_source():
+    variants = [{}, {'impot_revenu.bareme[1].rate': .3}, {'impot_revenu.bareme[1].rate': .5}]
+    aggregates = sweep(build_simulation(tax_benefit_system), 2018, variants, ['irpp_retenu_a_la_source'])
+
+    for index, overrides in enumerate(variants):
+        variant_simulation = build_simulation(build_variant(tax_benefit_system, overrides, 2018))
+        assert aggregates['irpp_retenu_a_la_source'][index] == \
+            variant_simulation.calculate('irpp_retenu_a_la_source', 2018).sum(dtype = float64)
+    assert len(set(aggregates['irpp_retenu_a_la_source'])) == len(variants)
+
+
+class hausse_retraite(Reform):
+    def apply(self):
+        def modify_parameters(parameters):
+            for bracket in parameters.cotisations_sociales.rsna.cotisations_salarie.retraite.brackets:
+                bracket.rate.update(
+                    start = periods.instant('2010-01-01'), value = (bracket.rate.values_list[0].value or 0) + .01)
+            return parameters
+
+        self.modify_parameters(modifier_function = modify_parameters)
+
+
+def test_cotisations_depend_on_their_baremes():
+    reform = hausse_retraite(tax_benefit_system)
+    simulation = build_simulation(tax_benefit_system)
+    track_baseline(simulation)
+    # Most cotisations come from the cache of the first one calculated
+    simulation.calculate('cotisations_salarie', '2018-01')
+    retraite_salarie = simulation.calculate('retraite_salarie', '2018-01')
+    reform_simulation = build_reform_simulation(simulation, reform)
+
+    assert (reform_simulation.calculate('retraite_salarie', '2018-01') ==
+        build_simulation(reform).calculate('retraite_salarie', '2018-01')).all()
+    assert (reform_simulation.calculate('retraite_salarie', '2018-01') < retraite_salarie).any()
+
+
+class hausse_allocations_familiales(Reform):
+    def apply(self):
+        def modify_parameters(parameters):
+            parameters.prestations_familiales.af.taux.enf1.update(
+                start = periods.instant('2010-01-01'),
+                value = parameters.prestations_familiales.af.taux.enf1.values_list[0].value + .01,
+                )
+            return parameters
+
+        self.modify_parameters(modifier_function = modify_parameters)
+
+
+def test_prestations_familiales_depend_on_their_parameters():
+    reform = hausse_allocations_familiales(tax_benefit_system)
+    simulation = build_simulation(tax_benefit_system)
+    track_baseline(simulation)
+    # af is computed along with the other prestations familiales by prestations_familiales
+    simulation.calculate('prestations_familiales', 2018)
+    af = simulation.calculate('af', 2018)
+    reform_simulation = build_reform_simulation(simulation, reform)
+
+    assert (reform_simulation.calculate('af', 2018) == build_simulation(reform).calculate('af', 2018)).all()
+    assert (reform_simulation.calculate('af', 2018) > af).any()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+
+from openfisca_tunisia.scripts.run_yaml_tests import build_batches, collect_cases, init_worker, run_yaml_tests
+
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+yaml_tests = '''
+- name: Salarié 1
+  period: 2016
+  absolute_error_margin: 0.01
+  input:
+    salaire_imposable: 17710
+  output:
+    revenu_assimile_salaire_apres_abattements: 17710 * (1 - .1)
+
+- name: Salarié 2, mauvais résultat
+  period: 2016
+  input:
+    salaire_imposable: 10000
+  output:
+    revenu_assimile_salaire_apres_abattements: 10000
+
+- name: Deux salariés
+  period: 2016
+  input:
+    individus:
+      salarie_1:
+        salaire_imposable: 0
+      salarie_2:
+        salaire_imposable: 20000
+    foyers_fiscaux:
+      foyer_fiscal_1:
+        declarants: [salarie_1]
+      foyer_fiscal_2:
+        declarants: [salarie_2]
+  output:
+    revenu_assimile_salaire: [0, 20000]
+    foyers_fiscaux:
+      foyer_fiscal_2:
+        revenu_assimile_salaire_apres_abattements: 18000
+
+- name: Individus décrits par des listes
+  period: 2016
+  absolute_error_margin: 0.01
+  input:
+    salaire_imposable: [0, 1000]
+  output:
+    revenu_assimile_salaire: [0, 1000]
+'''
+
+
+def test_run_yaml_tests(tmpdir):
+    yaml_path = str(tmpdir.join('tests.yaml'))
+    with open(yaml_path, 'w') as yaml_file:
+        yaml_file.write(yaml_tests)
+    init_worker()
+    batches = build_batches(collect_cases([yaml_path]))
+    assert [len(cases) for cases in batches] == [3, 1]
+
+    results = run_yaml_tests([yaml_path], max_workers = 1)
+    assert [(name, error is None) for _, name, error in results] == [
+        ('Salarié 1', True),
+        ('Salarié 2, mauvais résultat', False),
+        ('Deux salariés', True),
+        ('Individus décrits par des listes', True),
+        ]
+
+
+def test_run_yaml_tests_in_parallel():
+    results = run_yaml_tests([os.path.join(tests_dir, 'formulas'), os.path.join(tests_dir, 'reforms')], max_workers = 2)
+    assert len(results) > 1
+    assert [error for _, _, error in results if error is not None] == []
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+
+import numpy as np
+import pytest
+
+from openfisca_tunisia.scenarios import build_households_simulation, init_single_entity, ENFANT, PARENT1, PARENT2
+from tests.base import tax_benefit_system
+
+
+households = [
+    dict(
+        parent1 = dict(date_naissance = '1972-01-01', salaire_de_base = 2000, regime_securite_sociale = 'rsna'),
+        parent2 = dict(date_naissance = '1975-01-01'),
+        ),
+    dict(
+        parent1 = dict(date_naissance = '1980-01-01', salaire_de_base = 1500, regime_securite_sociale = 'rsa'),
+        parent2 = dict(date_naissance = '1982-01-01', salaire_de_base = 800),
+        enfants = [dict(date_naissance = '2010-01-01'), dict(date_naissance = '2012-05-01')],
+        ),
+    dict(
+        parent1 = dict(date_naissance = '1960-01-01', salaire_de_base = 3000, regime_securite_sociale = 're'),
+        ),
+    ]
+
+
+def test_build_households_simulation():
+    year = 2018
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = year,
+        # The members of the second household are not contiguous
+        household = [0, 0, 1, 1, 1, 2, 1],
+        role = [PARENT1, PARENT2, PARENT1, ENFANT, ENFANT, PARENT1, PARENT2],
+        individus = dict(
+            date_naissance = np.array(
+                ['1972-01-01', '1975-01-01', '1980-01-01', '2010-01-01', '2012-05-01', '1960-01-01', '1982-01-01'],
+                dtype = 'datetime64[D]',
+                ),
+            salaire_de_base = [2000, 0, 1500, 0, 0, 3000, 800],
+            regime_securite_sociale = ['rsna', 'rsna', 'rsa', 'rsna', 'rsna', 're', 'rsna'],
+            ),
+        )
+    assert list(simulation.menage.nb_persons()) == [2, 4, 1]
+    for variable in ['revenu_disponible', 'salaire_imposable']:
+        value = simulation.calculate_add(variable, period = year)
+        expected = np.concatenate([
+            init_single_entity(tax_benefit_system.new_scenario(), period = year, **household)
+            .new_simulation()
+            .calculate_add(variable, period = year)
+            for household in households
+            ])
+        if simulation.tax_benefit_system.variables[variable].entity.is_person:
+            expected = expected[[0, 1, 2, 4, 5, 6, 3]]
+        assert value == pytest.approx(expected)
+
+
+def test_build_households_simulation_checks_roles():
+    with pytest.raises(ValueError):
+        build_households_simulation(tax_benefit_system, 2018, household = [0, 0, 1], role = [PARENT1, PARENT1, PARENT1])
+    with pytest.raises(ValueError):
+        build_households_simulation(tax_benefit_system, 2018, household = [0, 0, 1], role = [PARENT1, ENFANT, ENFANT])
@@ -0,0 +1,46 @@
+import pickle
+
+from openfisca_tunisia import TunisiaTaxBenefitSystem
+from openfisca_tunisia.scenarios import init_single_entity
+from openfisca_tunisia.snapshot import LazyParameterNode, load_snapshot
+from tests.base import tax_benefit_system
+
+
+def test_snapshot(tmpdir):
+    TunisiaTaxBenefitSystem(cache_dir = str(tmpdir))
+    snapshot_tax_benefit_system = TunisiaTaxBenefitSystem(cache_dir = str(tmpdir))
+    parameters = snapshot_tax_benefit_system.parameters
+    assert isinstance(parameters, LazyParameterNode)
+    assert list(snapshot_tax_benefit_system.variables) == list(tax_benefit_system.variables)
+
+    # Subtrees are only unpickled when used
+    bareme = parameters('2015-01-01').impot_revenu.bareme
+    assert bareme.thresholds == tax_benefit_system.parameters('2015-01-01').impot_revenu.bareme.thresholds
+    assert 'cotisations_sociales' in parameters._pickled_children
+    assert len(list(parameters.get_descendants())) == len(list(tax_benefit_system.parameters.get_descendants()))
+
+    for tbs in [tax_benefit_system, snapshot_tax_benefit_system]:
+        simulation = init_single_entity(
+            tbs.new_scenario(),
+            period = 2018,
+            parent1 = dict(date_naissance = '1972-01-01', salaire_de_base = 2000),
+            ).new_simulation()
+        if tbs is tax_benefit_system:
+            expected = simulation.calculate('revenu_disponible', 2018)
+    assert (abs(simulation.calculate('revenu_disponible', 2018) - expected) < 1e-3).all()
+
+
+def test_stale_snapshot(tmpdir):
+    TunisiaTaxBenefitSystem(cache_dir = str(tmpdir))
+    snapshot_path = tmpdir.listdir()[0]
+    with snapshot_path.open('rb') as snapshot_file:
+        snapshot = pickle.load(snapshot_file)
+    file_path, (mtime, size) = next(iter(snapshot['sources_stat'].items()))
+    snapshot['sources_stat'][file_path] = (mtime - 1, size)
+    with snapshot_path.open('wb') as snapshot_file:
+        pickle.dump(snapshot, snapshot_file)
+
+    assert not load_snapshot(TunisiaTaxBenefitSystem(), str(snapshot_path))
+    # The stale snapshot is rebuilt
+    assert not isinstance(TunisiaTaxBenefitSystem(cache_dir = str(tmpdir)).parameters, LazyParameterNode)
+    assert isinstance(TunisiaTaxBenefitSystem(cache_dir = str(tmpdir)).parameters, LazyParameterNode)
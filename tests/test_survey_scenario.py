@@ -0,0 +1,185 @@
+import pytest
+from numpy import array, bincount
+
+pytest.importorskip('openfisca_survey_manager')
+pytest.importorskip('tables')
+
+import pandas as pd  # noqa: E402
+
+from openfisca_tunisia.survey_scenario import TunisiaSurveyScenario  # noqa: E402
+from openfisca_tunisia.survey_scenario.chunks import partition_households  # noqa: E402
+
+
+def build_input_data_frame():
+    # 3 menages: the third one holds 2 foyers fiscaux, the second foyer fiscal spans menages 1 and 2
+    input_data_frame = pd.DataFrame(dict(
+        id_menage = [0, 0, 1, 2, 2, 2, 1],
+        role_menage = [0, 1, 0, 0, 1, 2, 1],
+        id_foyer_fiscal = [0, 0, 1, 2, 2, 3, 2],
+        role_foyer_fiscal = [0, 1, 0, 0, 1, 0, 1],
+        salaire_de_base = [24000.0, 0, 12000, 18000, 9600, 3600, 6000],
+        poids = [1.0, 1, 2, 3, 3, 3, 2],
+        ))
+    input_data_frame['poids_menage'] = input_data_frame.poids
+    input_data_frame['poids_foyer_fiscal'] = input_data_frame.poids
+    input_data_frame['date_naissance'] = pd.to_datetime('1970-01-01')
+    return input_data_frame
+
+
+def test_partition_households():
+    input_data_frame = build_input_data_frame()
+    chunk = partition_households(input_data_frame.id_menage.values, input_data_frame.id_foyer_fiscal.values, 3)
+    # Menages 1 and 2 are linked by the foyer fiscal 2
+    assert (chunk == array([0, 0, 1, 1, 1, 1, 1])).all()
+    assert (bincount(partition_households(array([5, 5, 6, 7]), array([1, 2, 3, 4]), 2)) == [2, 2]).all()
+
+
+def test_run_by_chunks(tmpdir):
+    variables = ['revenu_disponible', 'salaire_imposable']
+    survey_scenario = TunisiaSurveyScenario(input_data_frame = build_input_data_frame(), year = 2018)
+    output_path = str(tmpdir.join('output.h5'))
+    aggregates = TunisiaSurveyScenario.run_by_chunks(
+        build_input_data_frame(), 2018, variables, output_path, chunk_size = 2)
+
+    for variable in variables:
+        assert aggregates.loc[variable, 'sum'] == pytest.approx(
+            survey_scenario.compute_aggregate(variable, period = 2018), rel = 1e-6)
+    individus = pd.read_hdf(output_path, 'individu').sort_index()
+    assert individus.salaire_imposable.values == pytest.approx(
+        survey_scenario.calculate_variable('salaire_imposable', period = 2018), rel = 1e-6)
+    assert list(pd.read_hdf(output_path, 'menage').index) == [0, 1, 2]
+
+
+def test_run_in_parallel(tmpdir):
+    input_data_frame = build_input_data_frame()
+    input_data_frame.index = input_data_frame.index + 10
+    survey_scenario = TunisiaSurveyScenario(input_data_frame = build_input_data_frame(), year = 2018)
+    data_frame_by_entity = TunisiaSurveyScenario.run_in_parallel(
+        input_data_frame,
+        2018,
+        ['revenu_disponible', 'salaire_imposable', 'regime_securite_sociale'],
+        max_workers = 2,
+        cache_dir = str(tmpdir),
+        )
+
+    individus = data_frame_by_entity['individu']
+    assert list(individus.index) == list(input_data_frame.index)
+    assert individus.salaire_imposable.values == pytest.approx(
+        survey_scenario.calculate_variable('salaire_imposable', period = 2018), rel = 1e-6)
+    assert (individus.regime_securite_sociale == 'rsna').all()
+    assert data_frame_by_entity['menage'].revenu_disponible.values == pytest.approx(
+        survey_scenario.calculate_variable('revenu_disponible', period = 2018), rel = 1e-6)
+
+
+def test_parquet(tmpdir):
+    pytest.importorskip('pyarrow')
+    input_data_frame = build_input_data_frame()
+    input_data_frame['unused'] = 1
+    input_data_frame['regime_securite_sociale'] = ['rsna', 'rsa', 'rsna', 'rsna', 're', 'rsna', 'rsna']
+    input_path = str(tmpdir.join('input.parquet'))
+    input_data_frame.to_parquet(input_path)
+
+    survey_scenario = TunisiaSurveyScenario(input_table = input_path, year = 2018)
+    assert 'unused' not in survey_scenario.used_as_input_variables
+    regime_securite_sociale = survey_scenario.calculate_variable('regime_securite_sociale', period = 2018)
+    assert list(regime_securite_sociale.decode_to_str()) == list(input_data_frame.regime_securite_sociale)
+
+    input_data_frame['regime_securite_sociale'] = [0, 1, 0, 0, 5, 0, 0]
+    expected = TunisiaSurveyScenario(input_data_frame = input_data_frame, year = 2018)
+    output_dir = str(tmpdir.join('output'))
+    survey_scenario.write_parquet(['revenu_disponible', 'salaire_imposable'], output_dir)
+    menages = pd.read_parquet(tmpdir.join('output', 'menage.parquet'))
+    assert list(menages.id_menage) == [0, 1, 2]
+    assert menages.revenu_disponible.values == pytest.approx(
+        expected.calculate_variable('revenu_disponible', period = 2018), rel = 1e-6)
+    individus = pd.read_parquet(tmpdir.join('output', 'individu.parquet'))
+    assert individus.salaire_imposable.values == pytest.approx(
+        expected.calculate_variable('salaire_imposable', period = 2018), rel = 1e-6)
+
+
+def test_run_by_chunks_parquet(tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    variables = ['revenu_disponible', 'salaire_imposable']
+    survey_scenario = TunisiaSurveyScenario(input_data_frame = build_input_data_frame(), year = 2018)
+    output_dir = str(tmpdir.join('output'))
+    aggregates = TunisiaSurveyScenario.run_by_chunks(
+        build_input_data_frame(), 2018, variables, output_dir, chunk_size = 2, output_format = 'parquet')
+
+    for variable in variables:
+        assert aggregates.loc[variable, 'sum'] == pytest.approx(
+            survey_scenario.compute_aggregate(variable, period = 2018), rel = 1e-6)
+    individus = pd.read_parquet(tmpdir.join('output', 'individu.parquet')).sort_index()
+    assert individus.salaire_imposable.values == pytest.approx(
+        survey_scenario.calculate_variable('salaire_imposable', period = 2018), rel = 1e-6)
+    # One row group by chunk
+    assert pq.ParquetFile(str(tmpdir.join('output', 'individu.parquet'))).num_row_groups == 2
+    assert list(pd.read_parquet(tmpdir.join('output', 'menage.parquet')).index) == [0, 1, 2]
+    assert pd.read_parquet(tmpdir.join('output', 'aggregates.parquet')).loc['revenu_disponible', 'sum'] == \
+        pytest.approx(aggregates.loc['revenu_disponible', 'sum'])
+
+
+def test_share_baseline_calculations():
+    from openfisca_core import periods
+    from openfisca_core.reforms import Reform
+
+    from openfisca_tunisia.tunisia_taxbenefitsystem import TunisiaTaxBenefitSystem
+
+    class hausse_bareme(Reform):
+        def apply(self):
+            def modify_parameters(parameters):
+                for bracket in parameters.impot_revenu.bareme.brackets:
+                    bracket.rate.update(
+                        start = periods.instant('2010-01-01'), value = (bracket.rate.values_list[0].value or 0) + .02)
+                return parameters
+
+            self.modify_parameters(modifier_function = modify_parameters)
+
+    baseline_tax_benefit_system = TunisiaTaxBenefitSystem()
+    variables = ['revenu_disponible', 'salaire_imposable', 'irpp_retenu_a_la_source']
+
+    def build_survey_scenario():
+        return TunisiaSurveyScenario(
+            input_data_frame = build_input_data_frame(),
+            tax_benefit_system = hausse_bareme(baseline_tax_benefit_system),
+            baseline_tax_benefit_system = baseline_tax_benefit_system,
+            year = 2018,
+            )
+
+    survey_scenario = build_survey_scenario()
+    survey_scenario.share_baseline_calculations(variables)
+    # Unaffected by the reform, the salaries are shared with the baseline
+    assert survey_scenario.simulation.get_holder('salaire_imposable').get_array('2018-01') is \
+        survey_scenario.baseline_simulation.get_holder('salaire_imposable').get_array('2018-01')
+
+    expected_survey_scenario = build_survey_scenario()
+    for variable in variables:
+        assert survey_scenario.calculate_variable(variable, period = 2018) == pytest.approx(
+            expected_survey_scenario.calculate_variable(variable, period = 2018))
+        assert survey_scenario.calculate_variable(variable, period = 2018, use_baseline = True) == pytest.approx(
+            expected_survey_scenario.calculate_variable(variable, period = 2018, use_baseline = True))
+    assert survey_scenario.compute_aggregate('revenu_disponible', period = 2018) < survey_scenario.compute_aggregate(
+        'revenu_disponible', period = 2018, use_baseline = True)
+    # The withholdings of the months, computed at once by irpp_retenu_a_la_source, are not shared
+    assert survey_scenario.compute_aggregate('irpp_retenu_a_la_source', period = 2018) == pytest.approx(
+        expected_survey_scenario.compute_aggregate('irpp_retenu_a_la_source', period = 2018))
+    assert survey_scenario.compute_aggregate('irpp_retenu_a_la_source', period = 2018) < \
+        survey_scenario.compute_aggregate('irpp_retenu_a_la_source', period = 2018, use_baseline = True)
+
+
+def test_sweep_parameters():
+    from openfisca_tunisia.parameter_sweep import build_variant
+
+    variants = [{'impot_revenu.bareme[1].rate': rate} for rate in [.2, .3]] + [{'impot_revenu.tspr.abat_sal': .2}]
+    survey_scenario = TunisiaSurveyScenario(input_data_frame = build_input_data_frame(), year = 2018)
+    aggregates = survey_scenario.sweep_parameters(variants, ['irpp', 'revenu_disponible'])
+
+    for index, overrides in enumerate(variants):
+        variant_survey_scenario = TunisiaSurveyScenario(
+            input_data_frame = build_input_data_frame(),
+            tax_benefit_system = build_variant(survey_scenario.tax_benefit_system, overrides, 2018),
+            year = 2018,
+            )
+        for variable in ['irpp', 'revenu_disponible']:
+            assert aggregates[variable][index] == pytest.approx(
+                variant_survey_scenario.compute_aggregate(variable, period = 2018))
+    assert aggregates['irpp'][0] > aggregates['irpp'][1]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+
+from numpy import float64, int8
+
+from openfisca_tunisia.model.prelevements_obligatoires.cotisations_sociales import (
+    TypesRegimeSecuriteSociale, get_bareme)
+from openfisca_tunisia.scripts.validate_dtypes import build_report
+from openfisca_tunisia.scenarios import build_households_simulation, PARENT1
+from openfisca_tunisia.tunisia_taxbenefitsystem import COMPACT_DTYPES, TunisiaTaxBenefitSystem
+
+
+def test_compact_dtypes():
+    tax_benefit_system = TunisiaTaxBenefitSystem()
+    tax_benefit_system.set_dtypes(**COMPACT_DTYPES)
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 1],
+        role = [PARENT1, PARENT1],
+        individus = dict(salaire_de_base = [36000, 15000], regime_securite_sociale = ['rsna', 'rsa']),
+        )
+    regime_securite_sociale = simulation.calculate('regime_securite_sociale', 2018)
+    assert regime_securite_sociale.dtype == int8
+    assert list(regime_securite_sociale.decode_to_str()) == ['rsna', 'rsa']
+    assert simulation.calculate('revenu_disponible', 2018).dtype == COMPACT_DTYPES['float_dtype']
+
+
+def test_build_report():
+    report = build_report(200, 2018)
+    assert all(row['max_abs_error'] < .01 for row in report['variables'])
+    assert report['compact_nbytes'] < report['reference_nbytes']
+
+
+def test_reference_dtypes_match_baremes():
+    tax_benefit_system = TunisiaTaxBenefitSystem()
+    tax_benefit_system.set_dtypes(float_dtype = float64)
+    regimes = ['rsna', 'rsa', 're', 'rsna']
+    simulation = build_households_simulation(
+        tax_benefit_system,
+        period = 2018,
+        household = [0, 1, 2, 3],
+        role = [PARENT1] * 4,
+        individus = dict(salaire_de_base = [36000.7, 15000.3, 9876.5, 123456.9], regime_securite_sociale = regimes),
+        )
+    assiette = simulation.calculate('assiette_cotisations_sociales', '2018-01')
+    retraite_salarie = simulation.calculate('retraite_salarie', '2018-01')
+    assert retraite_salarie.dtype == float64
+
+    baremes_by_regime = tax_benefit_system.parameters('2018-01-01').cotisations_sociales
+    for index, regime in enumerate(regimes):
+        bareme = get_bareme(baremes_by_regime, TypesRegimeSecuriteSociale[regime], 'salarie', 'retraite')
+        expected = 0 if bareme is None else - bareme.calc(assiette[index:index + 1])[0]
+        assert retraite_salarie[index] == expected